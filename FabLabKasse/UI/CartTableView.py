@@ -18,61 +18,143 @@
 # see <http://www.gnu.org/licenses/>.
 
 from qtpy.QtWidgets import QTableView
-from qtpy import QtGui, QtCore
-import functools
+from qtpy import QtCore
 from FabLabKasse.UI.GUIHelper import resize_table_columns
 
 
-class CartTableView(QTableView):
-    """Extends the funxtionality of a normal QTableView in order to supply a cart-view
+class CartTableModel(QtCore.QAbstractTableModel):
+    """table model for the order lines of the current order
 
-    for usage see the cart-view in Kassenterminal and the cart-view in the app-checkout
+    update() compares the order lines with the previous state and only emits
+    signals for the rows that were inserted, removed or changed, so that the
+    view keeps its selection and only repaints what has changed.
+
+    The order line id of each row is available as Qt.UserRole + 1 of column 0
+    (like QStandardItem.setData()) and via order_line_id().
     """
 
-    def update_cart(self, shoppingBackend):
-        """update table with current order lines"""
-        order_lines = shoppingBackend.get_order_lines()
+    HEADERS = ["Anzahl", "Einheit", "Artikel", "Einzelpreis", "Gesamtpreis"]
 
-        # Initialize basic model for table
-        order_model = QtGui.QStandardItemModel(len(order_lines), 4)
-        order_model.setHorizontalHeaderItem(0, QtGui.QStandardItem("Anzahl"))
-        order_model.setHorizontalHeaderItem(1, QtGui.QStandardItem("Einheit"))
-        order_model.setHorizontalHeaderItem(2, QtGui.QStandardItem("Artikel"))
-        order_model.setHorizontalHeaderItem(3, QtGui.QStandardItem("Einzelpreis"))
-        order_model.setHorizontalHeaderItem(4, QtGui.QStandardItem("Gesamtpreis"))
+    def __init__(self, parent=None):
+        QtCore.QAbstractTableModel.__init__(self, parent)
+        # one (order_line_id, tuple of cell texts) per row
+        self._rows = []
 
-        # Update Order lines
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._rows)
 
-        for i, line in enumerate(order_lines):
-            qty = QtGui.QStandardItem(shoppingBackend.format_qty(line.qty))
-            qty.setData(line.order_line_id)
-            order_model.setItem(i, 0, qty)
+    def columnCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.HEADERS)
 
-            uos = QtGui.QStandardItem(line.unit)
-            order_model.setItem(i, 1, uos)
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        (order_line_id, texts) = self._rows[index.row()]
+        if role == QtCore.Qt.DisplayRole:
+            return texts[index.column()]
+        if role == QtCore.Qt.UserRole + 1 and index.column() == 0:
+            return order_line_id
+        return None
 
-            name = QtGui.QStandardItem(line.name)
-            order_model.setItem(i, 2, name)
+    def headerData(self, section, orientation, role=QtCore.Qt.DisplayRole):
+        if orientation == QtCore.Qt.Horizontal and role == QtCore.Qt.DisplayRole:
+            return self.HEADERS[section]
+        return None
 
-            price_unit = QtGui.QStandardItem(
-                shoppingBackend.format_money(line.price_per_unit)
-            )
-            order_model.setItem(i, 3, price_unit)
+    def order_line_id(self, row):
+        """order line id of the given row"""
+        return self._rows[row][0]
+
+    @staticmethod
+    def _row_from_line(shoppingBackend, line):
+        return (
+            line.order_line_id,
+            (
+                shoppingBackend.format_qty(line.qty),
+                line.unit,
+                line.name,
+                shoppingBackend.format_money(line.price_per_unit),
+                shoppingBackend.format_money(line.price_subtotal),
+            ),
+        )
+
+    def update(self, shoppingBackend):
+        """update the rows from the current order lines of the backend"""
+        new_rows = [
+            self._row_from_line(shoppingBackend, line)
+            for line in shoppingBackend.get_order_lines()
+        ]
+        new_ids = set(order_line_id for (order_line_id, _) in new_rows)
+
+        # remove deleted lines in blocks of adjacent rows, from the bottom so
+        # that the row numbers stay valid
+        row = len(self._rows)
+        while row > 0:
+            row -= 1
+            if self._rows[row][0] in new_ids:
+                continue
+            last = row
+            while row > 0 and self._rows[row - 1][0] not in new_ids:
+                row -= 1
+            self.beginRemoveRows(QtCore.QModelIndex(), row, last)
+            del self._rows[row : last + 1]
+            self.endRemoveRows()
+
+        old_ids = [order_line_id for (order_line_id, _) in self._rows]
+        if old_ids != [
+            order_line_id for (order_line_id, _) in new_rows[: len(old_ids)]
+        ]:
+            # lines were reordered or inserted in between, which does not happen
+            # in the offline backends: start from scratch
+            self.beginResetModel()
+            self._rows = new_rows
+            self.endResetModel()
+            return
 
-            subtotal = QtGui.QStandardItem(
-                shoppingBackend.format_money(line.price_subtotal)
+        # changed lines
+        for (row, (old_row, new_row)) in enumerate(zip(self._rows, new_rows)):
+            if old_row != new_row:
+                self._rows[row] = new_row
+                self.dataChanged.emit(
+                    self.index(row, 0), self.index(row, self.columnCount() - 1)
+                )
+
+        # added lines, always at the end
+        if len(new_rows) > len(self._rows):
+            self.beginInsertRows(
+                QtCore.QModelIndex(), len(self._rows), len(new_rows) - 1
             )
-            order_model.setItem(i, 4, subtotal)
+            self._rows.extend(new_rows[len(self._rows) :])
+            self.endInsertRows()
+
+
+class CartTableView(QTableView):
+    """Extends the funxtionality of a normal QTableView in order to supply a cart-view
 
-        # Set Model
-        self.setModel(order_model)
+    for usage see the cart-view in Kassenterminal and the cart-view in the app-checkout
+    """
+
+    def update_cart(self, shoppingBackend):
+        """update table with current order lines"""
+        model = self.model()
+        new_model = not isinstance(model, CartTableModel)
+        if new_model:
+            model = CartTableModel(self)
+            self.setModel(model)
+        old_row_count = model.rowCount()
+        model.update(shoppingBackend)
 
-        # Change column width to useful values
-        # needs to be delayed so that resize events for the scrollbar happens first, otherwise it reports a scrollbar width of 100px at the very first call
-        QtCore.QTimer.singleShot(1, self.resize_table)
-        # the 100ms delay is a workaround that is necessary because the first call often comes too early.
-        # It is not clear if this workaround is still necessary, but who cares...
-        QtCore.QTimer.singleShot(100, self.resize_table)
+        if new_model or model.rowCount() != old_row_count:
+            # Change column width to useful values, the scrollbar may have appeared or disappeared
+            # needs to be delayed so that resize events for the scrollbar happens first, otherwise it reports a scrollbar width of 100px at the very first call
+            QtCore.QTimer.singleShot(1, self.resize_table)
+            # the 100ms delay is a workaround that is necessary because the first call often comes too early.
+            # It is not clear if this workaround is still necessary, but who cares...
+            QtCore.QTimer.singleShot(100, self.resize_table)
 
     def resize_table(self):
         # Update column width to useful values
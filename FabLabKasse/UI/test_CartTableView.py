@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# FabLabKasse, a Point-of-Sale Software for FabLabs and other public and trust-based workshops.
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program. If not,
+# see <http://www.gnu.org/licenses/>.
+
+"""unittests for CartTableView.py"""
+
+import unittest
+
+from qtpy import QtCore
+
+from .CartTableView import CartTableModel
+from ..shopping.backend.test_offline_base import ExampleBackend
+
+
+class CartTableModelTest(unittest.TestCase):
+
+    """test the signals of CartTableModel"""
+
+    def setUp(self):
+        self.backend = ExampleBackend()
+        self.backend.set_current_order(self.backend.create_order())
+        self.model = CartTableModel()
+        self.signals = []
+        self.model.rowsInserted.connect(
+            lambda parent, first, last: self.signals.append(("insert", first, last))
+        )
+        self.model.rowsRemoved.connect(
+            lambda parent, first, last: self.signals.append(("remove", first, last))
+        )
+        self.model.dataChanged.connect(
+            lambda first, last: self.signals.append(("change", first.row(), last.row()))
+        )
+        self.model.modelReset.connect(lambda: self.signals.append(("reset",)))
+
+    def update(self):
+        """update the model, return the emitted signals"""
+        self.signals.clear()
+        self.model.update(self.backend)
+        return self.signals
+
+    def test_update(self):
+        for prod_id in [1, 2, 3]:
+            self.backend.add_order_line(prod_id, 1)
+        self.assertEqual(self.update(), [("insert", 0, 2)])
+        self.assertEqual(self.model.rowCount(), 3)
+        self.assertEqual(self.model.columnCount(), 5)
+        self.assertEqual(self.model.headerData(2, QtCore.Qt.Horizontal), "Artikel")
+        index = self.model.index(1, 2)
+        self.assertEqual(self.model.data(index), "Plexiglas 5mm﻿  Rot")
+        lines = self.backend.get_order_lines()
+        self.assertEqual(
+            self.model.data(self.model.index(1, 0), QtCore.Qt.UserRole + 1),
+            lines[1].order_line_id,
+        )
+        self.assertEqual(self.model.order_line_id(2), lines[2].order_line_id)
+
+        # nothing changed: no signals
+        self.assertEqual(self.update(), [])
+
+        # changed quantity: only this row
+        self.backend.update_quantity(lines[1].order_line_id, 3)
+        self.assertEqual(self.update(), [("change", 1, 1)])
+        self.assertEqual(self.model.data(self.model.index(1, 0)), "3")
+
+        # deleted and added lines
+        self.backend.delete_order_line(lines[0].order_line_id)
+        self.backend.add_order_line(1, 2)
+        self.assertEqual(self.update(), [("remove", 0, 0), ("insert", 2, 2)])
+        self.assertEqual(
+            [self.model.order_line_id(row) for row in range(3)],
+            [line.order_line_id for line in self.backend.get_order_lines()],
+        )
+
+        # empty cart
+        self.backend.delete_current_order()
+        self.assertEqual(self.update(), [("remove", 0, 2)])
+        self.assertEqual(self.model.rowCount(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -15,8 +15,7 @@ import sqlite3
 import codecs
 from decimal import Decimal
 from FabLabKasse.faucardPayment.faucardStates import Status, Info
-
-# from FabLabKasse import scriptHelper
+from FabLabKasse import scriptHelper
 
 
 def query_yes_no():
@@ -42,6 +41,16 @@ def valid_date(s):
         raise argparse.ArgumentTypeError(msg)
 
 
+def str2date(x):
+    """
+    convert string x in format "2023-05-25 00:00:00.12309213" to datetime, ignoring milliseconds
+    """
+    if x is None:
+        return x
+    else:
+        return datetime.fromisoformat(x.split(".")[0])
+
+
 def dummy_cards(s):
     """Returns a list of card numbers to ignore"""
     try:
@@ -157,15 +166,21 @@ if __name__ == "__main__":
     print("Building Summary from {0} to {1}".format(startdate, enddate))
 
     try:
-        con = sqlite3.connect(args.file)
+        con = scriptHelper.connectDB(args.file, readonly=True)
         cur = con.cursor()
         con.text_factory = str
-        cur.execute(
-            "SELECT timestamp_payed, cardnumber, oldbalance, amount, newbalance,  datum, status, info, payed, ID FROM MagPosLog WHERE datum >= ? AND datum <= ? ORDER BY datum ASC",
-            (startdate, enddate),
+        # datum is stored by the default sqlite3 adapter
+        query, parameters = scriptHelper.dateRangeQuery(
+            "MagPosLog",
+            "datum",
+            lambda date: date.isoformat(" "),
+            from_date=startdate,
+            until_date=enddate + timedelta(microseconds=1),
+            columns="timestamp_payed, cardnumber, oldbalance, amount, newbalance,  datum, status, info, payed, ID",
         )
+        cur.execute(query, parameters)
 
-        conKb = sqlite3.connect(args.kassenbuch)
+        conKb = scriptHelper.connectDB(args.kassenbuch, readonly=True)
         curKb = conKb.cursor()
         conKb.text_factory = str
     except sqlite3.OperationalError as e:
@@ -192,16 +207,6 @@ if __name__ == "__main__":
         counter = 0
         # Write one row for each row in database
         for row in cur.fetchall():
-
-            def str2date(x):
-                """
-                convert string x in format "2023-05-25 00:00:00.12309213" to datetime, ignoring milliseconds
-                """
-                if x is None:
-                    return x
-                else:
-                    return datetime.strptime(x.split(".")[0], "%Y-%m-%d %H:%M:%S")
-
             timestamp = str2date(row[0])
             datum = str2date(row[5])
 
@@ -307,9 +312,9 @@ if __name__ == "__main__":
 
             if safetyCounter == 0:  # need to skip last action as no rechnungsnr found
                 continue
+            lastbooking = datetime.fromisoformat(rowKb[1])
             if firstbooking is None:
-                firstbooking = datetime.strptime(rowKb[1], "%Y-%m-%d %H:%M:%S.%f")
-            lastbooking = datetime.strptime(rowKb[1], "%Y-%m-%d %H:%M:%S.%f")
+                firstbooking = lastbooking
             rechnungsliste += [rechnungsnr]  # add rechnungs nr.
 
         # Close magposlog csv file
@@ -101,6 +101,9 @@ class Kassenterminal(Ui_Kassenterminal, QtWidgets.QMainWindow):
             0, lambda: self.setWindowState(QtCore.Qt.WindowMaximized)
         )
         self.shoppingBackend = ShoppingBackend(cfg)
+        if "--debug" in sys.argv:
+            # check the running order total against a full recalculation
+            self.shoppingBackend.verify_total = True
         """time when the program was started, used for auto-restart"""
         self.startup_time = time.monotonic()
 
@@ -670,8 +673,7 @@ class Kassenterminal(Ui_Kassenterminal, QtWidgets.QMainWindow):
     def getSelectedOrderLineId(self):
         order_idx = self.table_order.currentIndex()
         if order_idx.model() and order_idx.isValid():
-            order_line_id = order_idx.model().item(order_idx.row(), 0).data()
-            return order_line_id
+            return order_idx.sibling(order_idx.row(), 0).data(QtCore.Qt.UserRole + 1)
         else:
             return None
 
@@ -802,7 +804,7 @@ class Kassenterminal(Ui_Kassenterminal, QtWidgets.QMainWindow):
 
         # Currently no open cart
         if self.shoppingBackend.get_current_order() is None:
-            self.table_order.setModel(QtGui.QStandardItemModel(0, 0))
+            self.table_order.update_cart(self.shoppingBackend)
             self.summe.setText("0,00 €")
             self.pushButton_payup.setEnabled(False)
             self.pushButton_clearCart.setEnabled(False)
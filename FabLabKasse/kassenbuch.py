@@ -33,16 +33,19 @@ from __future__ import absolute_import
 import sqlite3
 import argparse
 from datetime import datetime, timedelta
-from decimal import Decimal, InvalidOperation
+from decimal import Decimal, InvalidOperation, ROUND_CEILING
 import dateutil.parser
 import csv
 import io
+import json
 import codecs
 import re
 import sys
 import os
 import random
+import itertools
 import doctest
+from contextlib import contextmanager
 from typing import Optional
 
 import locale
@@ -64,6 +67,19 @@ from FabLabKasse import scriptHelper
 
 # format for serializing the date to SQLite
 DATE_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+# format of the day in the table tagessaldo, a prefix of DATE_FORMAT
+TAG_FORMAT = "%Y-%m-%d"
+
+
+def _fetch_chunked(cur, chunk_size=1000):
+    """
+    iterate over the result rows of a cursor, fetching ``chunk_size`` rows at once
+    """
+    while True:
+        rows = cur.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield from rows
 
 
 def date2str(date: datetime) -> str:
@@ -78,7 +94,88 @@ def str2date(datestr: str) -> datetime:
     """
     Deserialize datetime from string stored in SQLite DB
     """
-    return datetime.strptime(datestr, DATE_FORMAT)
+    return datetime.fromisoformat(datestr)
+
+
+# dates are additionally stored as integer microseconds since EPOCH (column datum_us),
+# so that SQLite can compare them without string formatting and parsing.
+# The dates are naive local time, like the TEXT column datum, so no timezone is applied.
+EPOCH = datetime(1970, 1, 1)
+
+
+def date2int(date: datetime) -> int:
+    """
+    Serialize datetime to integer microseconds for storing in SQLite DB
+
+    >>> date2int(datetime(1970, 1, 2, 0, 0, 0, 42))
+    86400000042
+    """
+    assert isinstance(date, datetime)
+    return (date - EPOCH) // timedelta(microseconds=1)
+
+
+def int2date(value: int) -> datetime:
+    """
+    Deserialize datetime from integer microseconds stored in SQLite DB
+
+    >>> int2date(86400000042)
+    datetime.datetime(1970, 1, 2, 0, 0, 0, 42)
+    """
+    return EPOCH + timedelta(microseconds=value)
+
+
+def _date_from_db(value) -> datetime:
+    """
+    Deserialize datetime from the integer column datum_us,
+    or from the TEXT column datum if given a string
+    """
+    if isinstance(value, str):
+        return str2date(value)
+    return int2date(value)
+
+
+# amounts are additionally stored as integer number of minor units with a fixed scale,
+# so that SQLite can sum and compare them without parsing the TEXT columns.
+# (table, TEXT column) -> (INTEGER column, scale)
+MINOR_UNIT_COLUMNS = {
+    ("buchung", "betrag"): ("betrag_e2", 2),
+    ("kundenbuchung", "betrag"): ("betrag_e2", 2),
+    ("position", "anzahl"): ("anzahl_e4", 4),
+    ("position", "einzelpreis"): ("einzelpreis_e4", 4),
+}
+
+
+def to_minor_units(value, scale: int) -> Optional[int]:
+    """
+    Serialize an amount to an integer number of minor units (``value * 10**scale``)
+    for storing in SQLite.
+
+    Returns ``None`` if the value cannot be represented exactly with the given scale.
+    In this case, only the TEXT column is authoritative.
+
+    >>> to_minor_units(Decimal("-12.34"), 2)
+    -1234
+    >>> to_minor_units(Decimal("0.015"), 2) is None
+    True
+    >>> to_minor_units(None, 2) is None
+    True
+    """
+    if value is None:
+        return None
+    scaled = Decimal(value).scaleb(scale)
+    if scaled != scaled.to_integral_value():
+        return None
+    return int(scaled)
+
+
+def from_minor_units(value: int, scale: int) -> Decimal:
+    """
+    Deserialize an amount stored as integer number of minor units
+
+    >>> from_minor_units(-1234, 2)
+    Decimal('-12.34')
+    """
+    return Decimal(value).scaleb(-scale)
 
 
 def moneyfmt(value, places=2, curr="", sep=".", dp=",", pos="", neg="-", trailneg=""):
@@ -142,6 +239,63 @@ class NoDataFound(Exception):
     pass
 
 
+class SchemaOutdated(Exception):
+    """the database needs an upgrade, but was opened read-only"""
+
+    pass
+
+
+class _DecimalSum(object):
+    """
+    SQLite aggregate function ``decimal_sum(x)``: exact sum of amounts stored as TEXT
+
+    The result is returned as TEXT, convert it with ``Decimal(...)``.
+    """
+
+    def __init__(self):
+        self.summe = Decimal(0)
+
+    def step(self, value):
+        if value is not None:
+            self._add(Decimal(value))
+
+    def _add(self, value):
+        self.summe += value
+
+    def finalize(self):
+        return str(self.summe)
+
+
+class _DecimalHaben(_DecimalSum):
+    """
+    SQLite aggregate function ``decimal_haben(betrag)``: exact sum of all positive amounts
+    """
+
+    def _add(self, value):
+        if value > 0:
+            self.summe += value
+
+
+class _DecimalSoll(_DecimalSum):
+    """
+    SQLite aggregate function ``decimal_soll(betrag)``: exact sum of all other amounts, negated
+    """
+
+    def _add(self, value):
+        if not value > 0:
+            self.summe -= value
+
+
+def _betrag_from_row(row):
+    """
+    get the amount of a row ``(id, datum_us, konto/kunde, rechnung, betrag, kommentar[, betrag_e2])``
+    from buchung or kundenbuchung, preferring the integer column
+    """
+    if len(row) > 6 and row[6] is not None:
+        return from_minor_units(row[6], 2)
+    return Decimal(row[4])
+
+
 class Rechnung(object):
     __slots__ = ["id", "datum", "positionen"]
 
@@ -199,23 +353,29 @@ class Rechnung(object):
             (self.id,),
         )
         for row in cur:
-            self.positionen.append(
-                {
-                    "id": row[0],
-                    "rechnung": row[1],
-                    "anzahl": Decimal(row[2]),
-                    "einheit": str(row[3]),
-                    "artikel": str(row[4]),
-                    "einzelpreis": Decimal(row[5]),
-                    "produkt_ref": row[6],
-                }
-            )
+            self.positionen.append(self._position_from_row(row))
 
         self.positionen.sort(key=lambda p: p["id"])
 
+    @staticmethod
+    def _position_from_row(row):
+        """
+        convert a row ``(id, rechnung, anzahl, einheit, artikel, einzelpreis, produkt_ref)``
+        of the position table to the dict format of :attr:`positionen`
+        """
+        return {
+            "id": row[0],
+            "rechnung": row[1],
+            "anzahl": Decimal(row[2]),
+            "einheit": str(row[3]),
+            "artikel": str(row[4]),
+            "einzelpreis": Decimal(row[5]),
+            "produkt_ref": row[6],
+        }
+
     @classmethod
     def load_from_id(cls, id, cur):
-        cur.execute("SELECT id, datum FROM rechnung WHERE id = ?", (id,))
+        cur.execute("SELECT id, datum_us FROM rechnung WHERE id = ?", (id,))
         row = cur.fetchone()
 
         if row is None:
@@ -225,20 +385,24 @@ class Rechnung(object):
 
     @classmethod
     def load_from_row(cls, row, cur):
-        datum = str2date(row[1])
+        datum = _date_from_db(row[1])
         b = cls(id=row[0], datum=datum)
         b._load_positionen(cur)
         return b
 
     def store(self, cur):
-        cur.execute("INSERT INTO rechnung (datum) VALUES (?)", (date2str(self.datum),))
+        cur.execute(
+            "INSERT INTO rechnung (datum, datum_us) VALUES (?, ?)",
+            (date2str(self.datum), date2int(self.datum)),
+        )
         self.id = cur.lastrowid
 
+        # row by row, the ids of one executemany() are not guaranteed to be consecutive
         for pos in self.positionen:
             pos["rechnung"] = self.id
             cur.execute(
                 "INSERT INTO position (rechnung, anzahl, einheit, artikel, einzelpreis, "
-                + "produkt_ref) VALUES (?, ?, ?, ?, ?, ?)",
+                + "produkt_ref, anzahl_e4, einzelpreis_e4) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
                 (
                     pos["rechnung"],
                     str(pos["anzahl"]),
@@ -246,6 +410,8 @@ class Rechnung(object):
                     pos["artikel"],
                     str(pos["einzelpreis"]),
                     pos["produkt_ref"],
+                    to_minor_units(pos["anzahl"], 4),
+                    to_minor_units(pos["einzelpreis"], 4),
                 ),
             )
             pos["id"] = cur.lastrowid
@@ -352,7 +518,8 @@ class Buchung(object):
     @classmethod
     def load_from_id(cls, id, cur):
         cur.execute(
-            "SELECT id, datum, konto, rechnung, betrag, kommentar FROM buchung WHERE id = ?",
+            "SELECT id, datum_us, konto, rechnung, betrag, kommentar, betrag_e2 "
+            + "FROM buchung WHERE id = ?",
             (id,),
         )
         row = cur.fetchone()
@@ -364,29 +531,81 @@ class Buchung(object):
 
     @classmethod
     def load_from_row(cls, row):
+        """
+        :param row: ``(id, datum_us, konto, rechnung, betrag, kommentar[, betrag_e2])``,
+                    datum_us may also be the TEXT column datum
+        """
         b = cls(
             id=row[0],
-            datum=str2date(row[1]),
+            datum=_date_from_db(row[1]),
             konto=row[2],
             rechnung=row[3],
-            betrag=Decimal(row[4]),
+            betrag=_betrag_from_row(row),
             kommentar=row[5],
         )
         return b
 
     def _store(self, cur):
+        Buchung._store_many([self], cur)
+
+    @staticmethod
+    def _store_many(buchungen, cur):
+        """
+        insert new bookings and add them to the table tagessaldo
+
+        does not commit, see :meth:`Kasse.transaction`
+        """
+        # cur.lastrowid is only reliable after a single INSERT
+        for b in buchungen:
+            cur.execute(
+                "INSERT INTO buchung (datum, konto, rechnung, betrag, kommentar, betrag_e2, "
+                + "datum_us) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    date2str(b.datum),
+                    b.konto,
+                    b.rechnung,
+                    str(b.betrag),
+                    b.kommentar,
+                    to_minor_units(b.betrag, 2),
+                    date2int(b.datum),
+                ),
+            )
+            b.id = cur.lastrowid
+            b._add_to_tagessaldo(cur)
+
+    def _add_to_tagessaldo(self, cur):
+        """
+        add this booking to the daily account totals in the table tagessaldo
+
+        must be called in the same transaction as storing the booking,
+        see :meth:`Kasse.rebuild_tagessaldo`
+        """
+        betrag = Decimal(self.betrag)
+        tag = self.datum.strftime(TAG_FORMAT)
         cur.execute(
-            "INSERT INTO buchung (datum, konto, rechnung, betrag, kommentar) VALUES "
-            + "(?, ?, ?, ?, ?)",
-            (
-                date2str(self.datum),
-                self.konto,
-                self.rechnung,
-                str(self.betrag),
-                self.kommentar,
-            ),
+            "SELECT haben, soll FROM tagessaldo WHERE tag=? AND konto=?",
+            (tag, self.konto),
         )
-        self.id = cur.lastrowid
+        row = cur.fetchone()
+        if row is None:
+            haben, soll = Decimal(0), Decimal(0)
+        else:
+            haben, soll = Decimal(row[0]), Decimal(row[1])
+        if betrag > 0:
+            haben += betrag
+        else:
+            soll -= betrag
+
+        if row is None:
+            cur.execute(
+                "INSERT INTO tagessaldo (tag, konto, haben, soll) VALUES (?, ?, ?, ?)",
+                (tag, self.konto, str(haben), str(soll)),
+            )
+        else:
+            cur.execute(
+                "UPDATE tagessaldo SET haben=?, soll=? WHERE tag=? AND konto=?",
+                (str(haben), str(soll), tag, self.konto),
+            )
 
     @property
     def beschreibung(self):
@@ -436,10 +655,35 @@ class Buchung(object):
 
 
 class Kasse(object):
-    def __init__(self, sqlite_file=":memory:"):
-        self.con = sqlite3.connect(sqlite_file)
+    def __init__(self, sqlite_file=":memory:", readonly=False):
+        """
+        open the cash book, create or upgrade the database if necessary
+
+        :param sqlite_file: path of the database file or ":memory:"
+        :param readonly: open an existing, up-to-date database read-only, e.g. for reports.
+            A read-only Kasse never delays a sale in the GUI.
+        :type readonly: bool
+        """
+        self.con = scriptHelper.connectDB(sqlite_file, readonly=readonly)
         self.cur = self.con.cursor()
+        # nesting level of transaction()
+        self._transaction_depth = 0
         self.con.text_factory = str
+        # exact aggregation of the amounts stored as TEXT
+        self.con.create_aggregate("decimal_sum", 1, _DecimalSum)
+        self.con.create_aggregate("decimal_haben", 1, _DecimalHaben)
+        self.con.create_aggregate("decimal_soll", 1, _DecimalSoll)
+
+        if readonly:
+            version = self.cur.execute("PRAGMA user_version").fetchone()[0]
+            if version < self.SCHEMA_VERSION:
+                raise SchemaOutdated(
+                    "database schema of {0} is outdated, run 'kassenbuch.py upgrade' "
+                    "or open it once without read-only mode to upgrade it".format(
+                        sqlite_file
+                    )
+                )
+            return
 
         cur = self.cur
         cur.execute(
@@ -449,11 +693,13 @@ class Kasse(object):
             konto,
             rechnung INT,
             betrag TEXT,
-            kommentar TEXT)"""
+            kommentar TEXT,
+            betrag_e2 INTEGER,
+            datum_us INTEGER)"""
         )
         cur.execute(
             """CREATE TABLE IF NOT EXISTS rechnung(
-            id INTEGER PRIMARY KEY AUTOINCREMENT, datum)"""
+            id INTEGER PRIMARY KEY AUTOINCREMENT, datum, datum_us INTEGER)"""
         )
         cur.execute(
             """CREATE TABLE IF NOT EXISTS position(
@@ -463,7 +709,9 @@ class Kasse(object):
             einheit TEXT,
             artikel TEXT,
             einzelpreis TEXT,
-            produkt_ref TEXT)"""
+            produkt_ref TEXT,
+            anzahl_e4 INTEGER,
+            einzelpreis_e4 INTEGER)"""
         )
         cur.execute(
             """CREATE TABLE IF NOT EXISTS bargeld(
@@ -494,7 +742,11 @@ class Kasse(object):
             email,
             telefon,
             adresse,
-            kommentar)"""
+            kommentar,
+            saldo TEXT DEFAULT '0',
+            letzte_zahlung_us INTEGER,
+            letzte_belastung_us INTEGER,
+            saldo_e2 INTEGER DEFAULT 0)"""
         )
         cur.execute(
             """CREATE TABLE IF NOT EXISTS kundenbuchung(
@@ -503,7 +755,9 @@ class Kasse(object):
             kunde,
             rechnung INT,
             betrag TEXT,
-            kommentar TEXT)"""
+            kommentar TEXT,
+            betrag_e2 INTEGER,
+            datum_us INTEGER)"""
         )
         cur.execute(
             """CREATE TABLE IF NOT EXISTS statistik(
@@ -514,6 +768,25 @@ class Kasse(object):
             rechnung INT,
             betrag)"""
         )
+        # sum of all bookings per account and day, split into haben (> 0) and soll (<= 0)
+        # -> summaries don't need to load the whole history
+        cur.execute(
+            """CREATE TABLE IF NOT EXISTS tagessaldo(
+            tag TEXT,
+            konto,
+            haben TEXT,
+            soll TEXT,
+            PRIMARY KEY (tag, konto))"""
+        )
+        # bookmarks of incremental exports, see export_incremental()
+        # datei and laenge: file being appended to and its length before the current chunk
+        cur.execute(
+            """CREATE TABLE IF NOT EXISTS export_stand(
+            name TEXT PRIMARY KEY,
+            letzte_id INTEGER,
+            datei TEXT,
+            laenge INTEGER)"""
+        )
 
         # search indexes for faster execution
         cur.execute("CREATE INDEX IF NOT EXISTS buchungDateIndex ON buchung(datum)")
@@ -536,35 +809,218 @@ class Kasse(object):
             "CREATE INDEX IF NOT EXISTS statistikRechnungIndex ON statistik(rechnung)"
         )
 
+        self._migrate()
+
+    @contextmanager
+    def transaction(self):
+        """
+        unit of work: everything written in the ``with`` block is committed at once,
+        or rolled back completely if an exception occurs.
+
+        A whole sale therefore costs only one commit (one sync of the database file)::
+
+            with kasse.transaction() as cur:
+                rechnung.store(cur)
+                kasse.buchen([b1, b2])
+
+        Nested calls (e.g. :meth:`buchen`) join the outer transaction and don't commit.
+
+        :return: cursor for writing in the transaction
+        :rtype: sqlite3.Cursor
+        """
+        if self._transaction_depth == 0 and not self.con.in_transaction:
+            # take the write lock at once, waiting for the busy timeout if necessary
+            self.cur.execute("BEGIN IMMEDIATE")
+        self._transaction_depth += 1
+        try:
+            yield self.cur
+        except BaseException:
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self.con.rollback()
+            raise
+        self._transaction_depth -= 1
+        if self._transaction_depth == 0:
+            self.con.commit()
+
+    # version of the database schema, stored as PRAGMA user_version. see _migrate()
+    SCHEMA_VERSION = 5
+
+    def _migrate(self):
+        """
+        upgrade a database created by an older version to :attr:`SCHEMA_VERSION`
+
+        The tables are always created with the current schema, so every migration step
+        must also work if it has already been (partially) applied.
+        """
+        version = self.cur.execute("PRAGMA user_version").fetchone()[0]
+        if version < 1:
+            self._migrate_minor_units()
+        if version < 2:
+            # table tagessaldo was added
+            self.rebuild_tagessaldo()
+        if version < 3:
+            self._migrate_datum_us()
+        if version < 5:
+            # version 4 cached the balance only as TEXT, version 5 added saldo_e2
+            self._migrate_kundensaldo()
+        if version < Kasse.SCHEMA_VERSION:
+            self.cur.execute(f"PRAGMA user_version = {Kasse.SCHEMA_VERSION}")
+            self.con.commit()
+
+    def _migrate_minor_units(self, batch_size=10000):
+        """
+        add the integer columns of :data:`MINOR_UNIT_COLUMNS` and fill them from the
+        TEXT columns, committing after each batch of rows
+        """
+        for (table, column), (int_column, scale) in MINOR_UNIT_COLUMNS.items():
+            self._add_integer_column(
+                table,
+                int_column,
+                column,
+                lambda value: to_minor_units(value, scale),
+                batch_size,
+            )
+
+    def _migrate_datum_us(self, batch_size=10000):
+        """
+        add the integer column datum_us (see :func:`date2int`) and fill it from the
+        TEXT column datum, committing after each batch of rows
+        """
+
+        def convert(datestr):
+            if datestr is None:
+                return None
+            try:
+                return date2int(str2date(datestr))
+            except ValueError:
+                # very old or manually edited entry
+                return date2int(dateutil.parser.parse(datestr))
+
+        for table in ["buchung", "rechnung", "kundenbuchung"]:
+            self._add_integer_column(table, "datum_us", "datum", convert, batch_size)
+            self.cur.execute(
+                f"CREATE INDEX IF NOT EXISTS {table}DatumUsIndex ON {table}(datum_us)"
+            )
+            self.con.commit()
+
+    def _migrate_kundensaldo(self):
+        """
+        add the cached balance and dates of each client to table kunde
+        (see :meth:`rebuild_kundensaldo`)
+        """
+        existing_columns = [
+            row[1] for row in self.cur.execute("PRAGMA table_info(kunde)")
+        ]
+        for column, definition in [
+            ("saldo", "TEXT DEFAULT '0'"),
+            ("letzte_zahlung_us", "INTEGER"),
+            ("letzte_belastung_us", "INTEGER"),
+            ("saldo_e2", "INTEGER DEFAULT 0"),
+        ]:
+            if column not in existing_columns:
+                self.cur.execute(f"ALTER TABLE kunde ADD COLUMN {column} {definition}")
+        self.con.commit()
+        self.rebuild_kundensaldo()
+
+    def _add_integer_column(self, table, int_column, column, convert, batch_size):
+        """
+        add an INTEGER column (if it doesn't exist yet) and fill all its NULL entries with
+        ``convert(value of column)``, committing after each batch of rows
+        """
+        existing_columns = [
+            row[1] for row in self.cur.execute(f"PRAGMA table_info({table})")
+        ]
+        if int_column not in existing_columns:
+            self.cur.execute(f"ALTER TABLE {table} ADD COLUMN {int_column} INTEGER")
+            self.con.commit()
+
+        last_id = -1
+        while True:
+            rows = self.cur.execute(
+                f"SELECT id, {column} FROM {table} WHERE id > ? AND {int_column} IS NULL "
+                + "ORDER BY id LIMIT ?",
+                (last_id, batch_size),
+            ).fetchall()
+            if not rows:
+                break
+            self.cur.executemany(
+                f"UPDATE {table} SET {int_column}=? WHERE id=?",
+                [(convert(value), id) for (id, value) in rows],
+            )
+            self.con.commit()
+            last_id = rows[-1][0]
+
+    # tables supported by _date_query_generator:
+    # table -> (date column, columns for filtering, date_reference)
+    # The date of a position is the date of its rechnung.
+    _QUERY_TABLES = {
+        "buchung": ("datum_us", ["konto", "rechnung"], None),
+        "rechnung": ("datum_us", [], None),
+        "kundenbuchung": ("datum_us", ["kunde", "rechnung"], None),
+        "position": ("datum_us", ["rechnung"], ("rechnung", "rechnung")),
+    }
+
     @staticmethod
-    def _date_query_generator(from_table=None, from_date=None, until_date=None):
+    def _date_query_generator(
+        from_table=None,
+        from_date=None,
+        until_date=None,
+        columns="id",
+        after_id=None,
+        **filters,
+    ):
         """
-        returns a string for a SQL query to rechnung or buchung
+        returns a parameterised SQL query to one of the tables in :attr:`_QUERY_TABLES`,
+        see :func:`scriptHelper.dateRangeQuery`
 
         :param from_table: which table should be queried
-        :param from_date: datetime start date (included)
-        :param until_date: datetime end date (not included)
-        :type from_date: datetime.datetime | None
-        :type until_date: datetime.datetime | None
-        :return: query string
+        :param filters: only return rows with the given values, e.g. ``konto="Barkasse"``.
+                        Allowed keys depend on the table, see :attr:`_QUERY_TABLES`
+        :return: ``(query string, parameters)`` for :meth:`sqlite3.Cursor.execute`
+        :rtype: (str, list)
         """
-        known_tables = ["buchung", "rechnung"]
-        if from_table not in known_tables:
+        if from_table not in Kasse._QUERY_TABLES:
             raise NotImplementedError(f"unimplemented table {from_table}")
+        date_column, filter_columns, date_reference = Kasse._QUERY_TABLES[from_table]
+        for column in filters:
+            if column not in filter_columns:
+                raise NotImplementedError(
+                    f"unimplemented filter {column} for table {from_table}"
+                )
+        return scriptHelper.dateRangeQuery(
+            from_table,
+            date_column,
+            date2int,
+            from_date,
+            until_date,
+            columns,
+            after_id,
+            date_reference,
+            **filters,
+        )
 
-        query = f"SELECT id FROM {from_table}"
-        if from_date and until_date:
-            query = (
-                query
-                + f" WHERE datum >= '{date2str(from_date)}' AND datum < '{date2str(until_date)}'"
-            )
-        elif from_date:
-            query = query + f" WHERE datum >= '{date2str(from_date)}'"
-        elif until_date:
-            query = query + f" WHERE datum < '{date2str(until_date)}'"
+    def select(
+        self,
+        from_table,
+        columns="id",
+        from_date=None,
+        until_date=None,
+        after_id=None,
+        **filters,
+    ):
+        """
+        query rows of a table, see :meth:`_date_query_generator` for the parameters
 
-        query = query + " ORDER BY datum ASC"
-        return query
+        The rows are fetched lazily while iterating over the returned cursor.
+
+        :return: a new cursor, close it when you don't iterate until the end
+        :rtype: sqlite3.Cursor
+        """
+        query, parameters = Kasse._date_query_generator(
+            from_table, from_date, until_date, columns, after_id, **filters
+        )
+        return self.con.cursor().execute(query, parameters)
 
     @property
     def buchungen(self):
@@ -581,16 +1037,36 @@ class Kasse(object):
         :type from_date: datetime.datetime | None
         :type until_date: datetime.datetime | None
         """
-        buchungen = []
+        return list(self.iter_buchungen(from_date, until_date))
 
-        query = Kasse._date_query_generator(
-            from_table="buchung", from_date=from_date, until_date=until_date
-        )
-        self.cur.execute(query)
-        for row in self.cur.fetchall():
-            buchungen.append(Buchung.load_from_id(row[0], self.cur))
+    def iter_buchungen(self, from_date=None, until_date=None, after_id=None):
+        """
+        iterate over accounting records between the given dates.
 
-        return buchungen
+        Like :meth:`get_buchungen`, but all records are fetched with a single
+        query and yielded one by one, so the whole ledger never has to be kept in
+        memory. A separate cursor is used, so :attr:`cur` may be used while iterating.
+
+        :param from_date: start datetime (included)
+        :param until_date: end datetime (not included)
+        :param after_id: only records with a greater id, ordered by id instead of date
+        :type from_date: datetime.datetime | None
+        :type until_date: datetime.datetime | None
+        :type after_id: int | None
+        :rtype: collections.abc.Iterator[Buchung]
+        """
+        cur = self.select(
+            "buchung",
+            "id, datum_us, konto, rechnung, betrag, kommentar, betrag_e2",
+            from_date,
+            until_date,
+            after_id,
+        )
+        try:
+            for row in _fetch_chunked(cur):
+                yield Buchung.load_from_row(row)
+        finally:
+            cur.close()
 
     @property
     def rechnungen(self):
@@ -611,16 +1087,123 @@ class Kasse(object):
         :type from_date: datetime.datetime | None
         :type until_date: datetime.datetime | None
         """
-        rechnungen = []
+        return list(self.iter_rechnungen(from_date, until_date))
+
+    def iter_rechnungen(
+        self,
+        from_date: Optional[datetime] = None,
+        until_date: Optional[datetime] = None,
+        after_id: Optional[int] = None,
+    ):
+        """
+        iterate over invoices between the given dates, including their positions.
+
+        Invoices and positions are fetched with one ordered JOIN and grouped into
+        :class:`Rechnung` objects in a single pass. Each invoice is yielded as soon
+        as it is complete, so large exports don't need to hold all invoices in memory.
+        A separate cursor is used, so :attr:`cur` may be used while iterating.
 
-        query = Kasse._date_query_generator(
-            from_table="rechnung", from_date=from_date, until_date=until_date
+        :param from_date: start datetime (included)
+        :param until_date: end datetime (not included)
+        :param after_id: only invoices with a greater id, ordered by id instead of date
+        :type from_date: datetime.datetime | None
+        :type until_date: datetime.datetime | None
+        :type after_id: int | None
+        :rtype: collections.abc.Iterator[Rechnung]
+        """
+        rechnung_query, parameters = Kasse._date_query_generator(
+            from_table="rechnung",
+            from_date=from_date,
+            until_date=until_date,
+            columns="id, datum_us",
+            after_id=after_id,
         )
-        self.cur.execute(query)
-        for row in self.cur.fetchall():
-            rechnungen.append(Rechnung.load_from_id(row[0], self.cur))
+        order = "r.datum_us ASC, r.id ASC" if after_id is None else "r.id ASC"
+        query = (
+            "SELECT r.id, r.datum_us, p.id, p.rechnung, p.anzahl, p.einheit, p.artikel, "
+            + "p.einzelpreis, p.produkt_ref "
+            + f"FROM ({rechnung_query}) AS r LEFT JOIN position AS p ON p.rechnung = r.id "
+            + f"ORDER BY {order}, p.id ASC"
+        )
+        cur = self.con.cursor()
+        try:
+            rechnung = None
+            for row in _fetch_chunked(cur.execute(query, parameters)):
+                if rechnung is None or rechnung.id != row[0]:
+                    if rechnung is not None:
+                        yield rechnung
+                    rechnung = Rechnung(id=row[0], datum=int2date(row[1]))
+                if row[2] is not None:
+                    rechnung.positionen.append(Rechnung._position_from_row(row[2:]))
+            if rechnung is not None:
+                yield rechnung
+        finally:
+            cur.close()
 
-        return rechnungen
+    def iter_kunden(self, inactive=None, maxbalance=None, remove_zeros=False, now=None):
+        """
+        iterate over the clients with a single query, without loading their transactions
+
+        :attr:`Kunde.summe`, :attr:`Kunde.letzte_zahlung` and :attr:`Kunde.letzte_belastung`
+        are read from the cached columns of table kunde.
+
+        If ``inactive`` and/or ``maxbalance`` is given, only clients matching at least one
+        of these filters are returned.
+
+        :param inactive: only clients whose last charge is at least this many days ago
+        :type inactive: int | None
+        :param maxbalance: only clients with a balance below this value
+        :type maxbalance: Decimal | None
+        :param remove_zeros: skip clients with a balance of zero
+        :param now: reference time for ``inactive``, default: now
+        :type now: datetime | None
+        :rtype: collections.abc.Iterator[Kunde]
+        """
+        conditions = []
+        parameters = []
+        inactive_us = None
+        if inactive is not None:
+            inactive_us = date2int((now or datetime.now()) - timedelta(days=inactive))
+            conditions.append("letzte_belastung_us <= ?")
+            parameters.append(inactive_us)
+        if maxbalance is not None:
+            # saldo_e2 is NULL for balances with fractions of a cent,
+            # these few clients are checked exactly below
+            conditions.append("saldo_e2 < ? OR saldo_e2 IS NULL")
+            parameters.append(
+                int(Decimal(maxbalance).scaleb(2).to_integral_value(ROUND_CEILING))
+            )
+        query = f"SELECT {Kunde.COLUMNS} FROM kunde"
+        if conditions:
+            query += " WHERE (" + " OR ".join(conditions) + ")"
+        if remove_zeros:
+            query += " AND" if conditions else " WHERE"
+            query += " saldo_e2 IS NOT 0"
+        query += " ORDER BY id"
+
+        cur = self.con.cursor()
+        try:
+            cur.execute(query, parameters)
+            for row in cur:
+                kunde = Kunde.load_from_row(row, cur=None, load_buchungen=False)
+                if row[11] is None:
+                    # balance with fractions of a cent, apply its filters here
+                    if remove_zeros and abs(kunde.summe) < Decimal("0.005"):
+                        continue
+                    matches_inactive = (
+                        inactive_us is not None
+                        and row[10] is not None
+                        and row[10] <= inactive_us
+                    )
+                    if (
+                        maxbalance is not None
+                        and not matches_inactive
+                        and not kunde.summe < maxbalance
+                    ):
+                        continue
+                yield kunde
+        finally:
+            cur.close()
 
     @property
     def kunden(self):
@@ -653,9 +1236,8 @@ class Kasse(object):
             len(daten) == 1
         ), "Alle Buchungen in einem Buchungsfall muessen das selbe Datum haben."
 
-        for b in buchungen:
-            b._store(self.cur)
-        self.con.commit()
+        with self.transaction() as cur:
+            Buchung._store_many(buchungen, cur)
 
     def to_string(
         self, from_date=None, until_date=None, snapshot_time=None, show_receipts=True
@@ -690,8 +1272,7 @@ class Kasse(object):
             s += self.summary_to_string(from_date) + "\n\n\n"
         s += "Buchungen:\n"
         s += Buchung.header
-        buchungen = self.get_buchungen(from_date, filter_until_date)
-        for b in buchungen:
+        for b in self.iter_buchungen(from_date, filter_until_date):
             s += b.to_string() + "\n"
 
         if show_receipts:
@@ -700,9 +1281,7 @@ class Kasse(object):
             for r in rechnungen:
                 s += r.to_string() + "\n"
 
-        konto_saldi = {}
-        for b in buchungen:
-            konto_saldi[b.konto] = konto_saldi.get(b.konto, Decimal(0)) + b.betrag
+        konto_saldi = self.get_konto_summen(from_date, filter_until_date)[2]
 
         s += "\nKonten:\n"
         s += "KONTO               "
@@ -718,6 +1297,216 @@ class Kasse(object):
 
         return s
 
+    def get_konto_summen(self, from_date=None, until_date=None):
+        """
+        account totals of the bookings between the given dates, calculated by SQLite.
+
+        If a date is ``None``, no filter will be applied.
+        The accounts are ordered by their first booking.
+
+        :param from_date: start datetime (included)
+        :param until_date: end datetime (not included)
+        :type from_date: datetime.datetime | None
+        :type until_date: datetime.datetime | None
+        :return: ``(konto_haben, konto_soll, konto_saldi)``, each a dict ``{konto: Decimal}``.
+                 haben is the sum of the positive amounts, soll the negated sum of the others.
+        :rtype: tuple
+        """
+        buchung_query, parameters = Kasse._date_query_generator(
+            from_table="buchung",
+            from_date=from_date,
+            until_date=until_date,
+            columns="id, datum_us, konto, betrag, betrag_e2",
+        )
+        return self._konto_summen_from_query(
+            f"SELECT konto, {Kasse._HABEN_SOLL_COLUMNS} "
+            + f"FROM ({buchung_query}) GROUP BY konto ORDER BY MIN(datum_us), MIN(id)",
+            parameters,
+        )
+
+    # sums of amounts in table buchung, used with GROUP BY:
+    # integer sums of betrag_e2, and exact Decimal sums of the rows where betrag_e2 is NULL
+    _HABEN_SOLL_COLUMNS = (
+        "SUM(betrag_e2) FILTER (WHERE betrag_e2 > 0), "
+        + "-SUM(betrag_e2) FILTER (WHERE betrag_e2 <= 0), "
+        + "decimal_haben(betrag) FILTER (WHERE betrag_e2 IS NULL), "
+        + "decimal_soll(betrag) FILTER (WHERE betrag_e2 IS NULL)"
+    )
+
+    @staticmethod
+    def _haben_soll_from_row(row):
+        """
+        convert the part of a row queried with :attr:`_HABEN_SOLL_COLUMNS` to ``(haben, soll)``
+        """
+        haben = from_minor_units(row[0] or 0, 2) + Decimal(row[2] or 0)
+        soll = from_minor_units(row[1] or 0, 2) + Decimal(row[3] or 0)
+        return haben, soll
+
+    def _konto_summen_from_query(self, query, parameters=()):
+        """
+        run a query returning rows ``(konto, <_HABEN_SOLL_COLUMNS>)``
+        and collect the result as ``(konto_haben, konto_soll, konto_saldi)``
+
+        see :meth:`get_konto_summen`
+        """
+        konto_haben = {}
+        konto_soll = {}
+        konto_saldi = {}
+        cur = self.con.cursor()
+        try:
+            for row in cur.execute(query, parameters):
+                haben, soll = Kasse._haben_soll_from_row(row[1:])
+                konto_haben[row[0]] = haben
+                konto_soll[row[0]] = soll
+                konto_saldi[row[0]] = haben - soll
+        finally:
+            cur.close()
+        return konto_haben, konto_soll, konto_saldi
+
+    def _tagessaldo_from_buchungen(self):
+        """
+        calculate the daily account totals (see table tagessaldo) from all bookings
+
+        :return: ``{(tag, konto): (haben, soll)}``, ordered by day
+        :rtype: dict
+        """
+        tagessaldo = {}
+        cur = self.con.cursor()
+        try:
+            for row in cur.execute(
+                f"SELECT substr(datum, 1, 10) AS tag, konto, {Kasse._HABEN_SOLL_COLUMNS} "
+                + "FROM buchung GROUP BY tag, konto ORDER BY tag, MIN(id)"
+            ):
+                tagessaldo[(row[0], row[1])] = Kasse._haben_soll_from_row(row[2:])
+        finally:
+            cur.close()
+        return tagessaldo
+
+    def rebuild_tagessaldo(self):
+        """
+        recalculate the table tagessaldo from all bookings
+
+        Normally the table is kept up to date by :meth:`buchen`, so this is only
+        needed for upgrading old databases or after manual changes to the bookings.
+        """
+        tagessaldo = self._tagessaldo_from_buchungen()
+        self.cur.execute("DELETE FROM tagessaldo")
+        self.cur.executemany(
+            "INSERT INTO tagessaldo (tag, konto, haben, soll) VALUES (?, ?, ?, ?)",
+            (
+                (tag, konto, str(haben), str(soll))
+                for (tag, konto), (haben, soll) in tagessaldo.items()
+            ),
+        )
+        self.con.commit()
+
+    def verify_tagessaldo(self):
+        """
+        compare the table tagessaldo with the bookings
+
+        :return: list of differences ``(tag, konto, expected, actual)``, where expected and
+                 actual are tuples ``(haben, soll)`` or ``None`` if the entry is missing.
+                 An empty list means that the table is consistent.
+        :rtype: list
+        """
+        expected = self._tagessaldo_from_buchungen()
+        actual = {}
+        for row in self.cur.execute("SELECT tag, konto, haben, soll FROM tagessaldo"):
+            actual[(row[0], row[1])] = (Decimal(row[2]), Decimal(row[3]))
+
+        differences = []
+        for key in list(expected.keys()) + [k for k in actual if k not in expected]:
+            if expected.get(key) != actual.get(key):
+                differences.append(key + (expected.get(key), actual.get(key)))
+        return differences
+
+    def rebuild_kundensaldo(self):
+        """
+        recalculate the cached balance and dates of all clients in table kunde
+
+        Normally they are kept up to date by :meth:`Kundenbuchung.store`, so this is only
+        needed for upgrading old databases or after manual changes to the transactions.
+        """
+        kundensaldo = Kundenbuchung._kundensaldo_from_buchungen(self.cur)
+        with self.transaction() as cur:
+            cur.execute(
+                "UPDATE kunde SET saldo='0', saldo_e2=0, letzte_zahlung_us=NULL, "
+                + "letzte_belastung_us=NULL"
+            )
+            cur.executemany(
+                "UPDATE kunde SET saldo=?, saldo_e2=?, letzte_zahlung_us=?, "
+                + "letzte_belastung_us=? WHERE id=?",
+                (
+                    (
+                        str(saldo),
+                        to_minor_units(saldo, 2),
+                        letzte_zahlung_us,
+                        letzte_belastung_us,
+                        kunde,
+                    )
+                    for kunde, (
+                        saldo,
+                        letzte_zahlung_us,
+                        letzte_belastung_us,
+                    ) in kundensaldo.items()
+                ),
+            )
+
+    def verify_kundensaldo(self):
+        """
+        compare the cached balance and dates in table kunde with the client transactions
+
+        :return: list of differences ``(kunde, expected, actual)``, where expected and
+                 actual are tuples ``(saldo, letzte_zahlung_us, letzte_belastung_us)``.
+                 An empty list means that the cache is consistent.
+        :rtype: list
+        """
+        expected = Kundenbuchung._kundensaldo_from_buchungen(self.cur)
+        differences = []
+        for row in self.cur.execute(
+            "SELECT id, saldo, letzte_zahlung_us, letzte_belastung_us, saldo_e2 "
+            + "FROM kunde ORDER BY id"
+        ).fetchall():
+            expected_row = expected.get(row[0], (Decimal(0), None, None))
+            actual = (Decimal(row[1] or 0), row[2], row[3])
+            if actual[0] == expected_row[0] and row[4] != to_minor_units(
+                expected_row[0], 2
+            ):
+                # only the integer copy saldo_e2 is wrong
+                actual = (
+                    None if row[4] is None else from_minor_units(row[4], 2),
+                ) + actual[1:]
+            if expected_row != actual:
+                differences.append((row[0], expected_row, actual))
+        return differences
+
+    def _konto_summen(self, date):
+        """
+        account totals of all bookings before the given date
+
+        The totals of all days before ``date`` are read from the table tagessaldo,
+        only the bookings on the day of ``date`` itself are summed up from the table buchung.
+
+        :param date: end datetime (not included)
+        :type date: datetime.datetime
+        :return: see :meth:`get_konto_summen`
+        :rtype: tuple
+        """
+        konto_haben, konto_soll, konto_saldi = self._konto_summen_from_query(
+            "SELECT konto, NULL, NULL, decimal_sum(haben), decimal_sum(soll) FROM tagessaldo "
+            + "WHERE tag < ? GROUP BY konto ORDER BY MIN(tag), MIN(rowid)",
+            (date.strftime(TAG_FORMAT),),
+        )
+
+        start_of_day = datetime(date.year, date.month, date.day)
+        tail = self.get_konto_summen(from_date=start_of_day, until_date=date)
+        for konto in tail[2]:
+            konto_haben[konto] = konto_haben.get(konto, Decimal(0)) + tail[0][konto]
+            konto_soll[konto] = konto_soll.get(konto, Decimal(0)) + tail[1][konto]
+            konto_saldi[konto] = konto_saldi.get(konto, Decimal(0)) + tail[2][konto]
+
+        return konto_haben, konto_soll, konto_saldi
+
     def summary_to_string(self, date=None, snapshot_time=None):
         """
         Output account totals at given date.
@@ -729,29 +1518,26 @@ class Kasse(object):
         string = ""
         date = date or snapshot_time or datetime.now()
 
-        buchungen = self.get_buchungen(from_date=None, until_date=date)
+        self.cur.execute(
+            "SELECT id, datum_us, konto, rechnung, betrag, kommentar, betrag_e2 FROM buchung "
+            + "WHERE datum_us < ? ORDER BY datum_us DESC, id DESC LIMIT 1",
+            (date2int(date),),
+        )
+        row = self.cur.fetchone()
 
         string += "Kassenstand am {0}:\n".format(date)
-        if not buchungen:
+        if row is None:
             string += "(noch keine Buchungen an diesem Datum -- 0 EUR)\n"
             return string
         else:
+            last_buchung = Buchung.load_from_row(row)
             string += (
                 "(letzte darin enthaltene Buchung ist '{title}' vom {end})\n".format(
-                    title=buchungen[-1].beschreibung, end=buchungen[-1].datum
+                    title=last_buchung.beschreibung, end=last_buchung.datum
                 )
             )
 
-        konto_haben = {}
-        konto_soll = {}
-        konto_saldi = {}
-        for b in buchungen:
-            if b.betrag > 0:
-                konto_haben[b.konto] = konto_haben.get(b.konto, Decimal(0)) + b.betrag
-            else:
-                konto_soll[b.konto] = konto_soll.get(b.konto, Decimal(0)) - b.betrag
-
-            konto_saldi[b.konto] = konto_saldi.get(b.konto, Decimal(0)) + b.betrag
+        konto_haben, konto_soll, konto_saldi = self._konto_summen(date)
 
         string += "{:<16} {:>10} {:>10} {:>10}\n".format(
             "KONTO", "HABEN", "SOLL", "SALDO"
@@ -767,6 +1553,12 @@ class Kasse(object):
 
 
 class Kunde(object):
+    # columns of table kunde for load_from_row()
+    COLUMNS = (
+        "id, name, pin, schuldengrenze, email, telefon, adresse, kommentar, "
+        + "saldo, letzte_zahlung_us, letzte_belastung_us, saldo_e2"
+    )
+
     def __init__(
         self,
         name,
@@ -788,37 +1580,44 @@ class Kunde(object):
         self.kommentar = kommentar
 
         self.buchungen = []
+        # balance of the stored transactions that were not loaded into self.buchungen
+        self._summe_nicht_geladen = Decimal(0)
+        # date of the last payment (amount > 0) and charge (amount < 0) when loaded,
+        # cached in table kunde
+        self.letzte_zahlung = None
+        self.letzte_belastung = None
+        # content of the database row at the last load/store, None if not stored yet
+        self._db_values = None
 
     @classmethod
-    def load_from_id(cls, id, cur):
-        cur.execute(
-            "SELECT id, name, pin, schuldengrenze, email, telefon, adresse, kommentar "
-            + "FROM kunde WHERE id = ?",
-            (id,),
-        )
+    def load_from_id(cls, id, cur, load_buchungen=True):
+        cur.execute(f"SELECT {cls.COLUMNS} FROM kunde WHERE id = ?", (id,))
         row = cur.fetchone()
 
         if row is None:
             raise NoDataFound()
 
-        return cls.load_from_row(row, cur)
+        return cls.load_from_row(row, cur, load_buchungen)
 
     @classmethod
-    def load_from_name(cls, name, cur):
-        cur.execute(
-            "SELECT id, name, pin, schuldengrenze, email, telefon, adresse, kommentar "
-            + "FROM kunde WHERE name = ?",
-            (name,),
-        )
+    def load_from_name(cls, name, cur, load_buchungen=True):
+        cur.execute(f"SELECT {cls.COLUMNS} FROM kunde WHERE name = ?", (name,))
         row = cur.fetchone()
 
         if row is None:
             raise NoDataFound()
 
-        return cls.load_from_row(row, cur)
+        return cls.load_from_row(row, cur, load_buchungen)
 
     @classmethod
-    def load_from_row(cls, row, cur):
+    def load_from_row(cls, row, cur, load_buchungen=True):
+        """
+        :param row: row of the columns :attr:`COLUMNS` of table kunde
+        :param load_buchungen: load all transactions into :attr:`buchungen`.
+            If False, the cached balance is used: :attr:`summe` is still correct and
+            :attr:`buchungen` only contains the transactions added afterwards.
+        :type load_buchungen: bool
+        """
         b = cls(
             id=row[0],
             name=row[1],
@@ -829,13 +1628,42 @@ class Kunde(object):
             adresse=row[6],
             kommentar=row[7],
         )
+        b._db_values = b._values()
+        b.letzte_zahlung = None if row[9] is None else int2date(row[9])
+        b.letzte_belastung = None if row[10] is None else int2date(row[10])
 
-        b._load_buchungen(cur)
+        if load_buchungen:
+            b._load_buchungen(cur)
+        else:
+            b.buchungen = []
+            if row[11] is not None:
+                b._summe_nicht_geladen = from_minor_units(row[11], 2)
+            else:
+                b._summe_nicht_geladen = Decimal(row[8] or 0)
 
         return b
 
+    def _values(self):
+        """values of the row in table kunde, for detecting changes"""
+        return (
+            self.name,
+            self.pin,
+            str(self.schuldengrenze),
+            self.email,
+            self.telefon,
+            self.adresse,
+            self.kommentar,
+        )
+
     def store(self, cur) -> None:
-        if self.id is None:
+        """
+        store the client and its new or changed transactions
+
+        Unchanged rows are not written again.
+        """
+        if self._db_values == self._values():
+            pass  # unchanged
+        elif self.id is None:
             cur.execute(
                 "INSERT INTO kunde (name, pin, schuldengrenze, email, telefon, adresse, "
                 + "kommentar) VALUES (?, ?, ?, ?, ?, ?, ?)",
@@ -865,6 +1693,7 @@ class Kunde(object):
                     self.id,
                 ),
             )
+        self._db_values = self._values()
 
         for b in self.buchungen:
             b.store(cur)
@@ -881,13 +1710,14 @@ class Kunde(object):
         :type cur: sqlite3.Cursor
         """
         self.buchungen = []
+        self._summe_nicht_geladen = Decimal(0)
 
         if self.id is None:
             return
 
         cur.execute(
-            "SELECT id, datum, kunde, rechnung, betrag, kommentar FROM kundenbuchung "
-            + "WHERE kunde=? ORDER BY id ASC",
+            "SELECT id, datum_us, kunde, rechnung, betrag, kommentar, betrag_e2 "
+            + "FROM kundenbuchung WHERE kunde=? ORDER BY id ASC",
             (self.id,),
         )
 
@@ -903,7 +1733,7 @@ class Kunde(object):
 
     @property
     def summe(self):
-        summe = Decimal(0)
+        summe = self._summe_nicht_geladen
 
         for b in self.buchungen:
             summe += b.betrag
@@ -977,6 +1807,8 @@ class Kundenbuchung(object):
         self.rechnung = rechnung
         self.betrag = betrag
         self.kommentar = kommentar
+        # content of the database row at the last load/store, None if not stored yet
+        self._db_values = None
 
         if not rechnung and not kommentar:
             raise ValueError(
@@ -986,8 +1818,8 @@ class Kundenbuchung(object):
     @classmethod
     def load_from_id(cls, id, cur):
         cur.execute(
-            "SELECT id, datum, kunde, rechnung, betrag, kommentar FROM kundenbuchung "
-            + "WHERE id = ?",
+            "SELECT id, datum_us, kunde, rechnung, betrag, kommentar, betrag_e2 "
+            + "FROM kundenbuchung WHERE id = ?",
             (id,),
         )
         row = cur.fetchone()
@@ -999,46 +1831,172 @@ class Kundenbuchung(object):
 
     @classmethod
     def load_from_row(cls, row):
+        """
+        :param row: ``(id, datum_us, kunde, rechnung, betrag, kommentar[, betrag_e2])``,
+                    datum_us may also be the TEXT column datum
+        """
         b = cls(
             id=row[0],
-            datum=str2date(row[1]),
+            datum=_date_from_db(row[1]),
             kunde=row[2],
             rechnung=row[3],
-            betrag=Decimal(row[4]),
+            betrag=_betrag_from_row(row),
             kommentar=row[5],
         )
+        b._db_values = b._values()
         return b
 
+    def _values(self):
+        """values of the row in table kundenbuchung, for detecting changes"""
+        return (
+            date2str(self.datum),
+            self.kunde,
+            self.rechnung,
+            str(self.betrag),
+            self.kommentar,
+        )
+
     def store(self, cur):
-        if self.id is None:
+        """
+        insert or update the transaction, unless it is unchanged since the last load/store
+        """
+        if self.id is not None and self._db_values == self._values():
+            return self.id
+
+        neu = self.id is None
+        if neu:
             cur.execute(
-                "INSERT INTO kundenbuchung (datum, kunde, rechnung, betrag, kommentar) "
-                + "VALUES (?, ?, ?, ?, ?)",
+                "INSERT INTO kundenbuchung (datum, kunde, rechnung, betrag, kommentar, "
+                + "betrag_e2, datum_us) VALUES (?, ?, ?, ?, ?, ?, ?)",
                 (
                     date2str(self.datum),
                     self.kunde,
                     self.rechnung,
                     str(self.betrag),
                     self.kommentar,
+                    to_minor_units(self.betrag, 2),
+                    date2int(self.datum),
                 ),
             )
             self.id = cur.lastrowid
         else:
+            # the client may change, both need an update of their cached balance
+            row = cur.execute(
+                "SELECT kunde FROM kundenbuchung WHERE id=?", (self.id,)
+            ).fetchone()
+            kunden = {self.kunde} if row is None else {self.kunde, row[0]}
             cur.execute(
                 "UPDATE kundenbuchung SET datum=?, kunde=?, rechnung=?, betrag=?, "
-                + "kommentar=? WHERE id=?",
+                + "kommentar=?, betrag_e2=?, datum_us=? WHERE id=?",
                 (
                     date2str(self.datum),
                     self.kunde,
                     self.rechnung,
                     str(self.betrag),
                     self.kommentar,
+                    to_minor_units(self.betrag, 2),
+                    date2int(self.datum),
                     self.id,
                 ),
             )
+        self._db_values = self._values()
+
+        if neu:
+            self._add_to_kundensaldo(cur)
+        else:
+            # changes are rare, simply recalculate the affected clients
+            Kundenbuchung._update_kundensaldo(cur, kunden)
 
         return self.id
 
+    def _add_to_kundensaldo(self, cur):
+        """
+        add this transaction to the cached balance and dates of the client in table kunde
+
+        must be called in the same transaction as storing the transaction,
+        see :meth:`Kasse.rebuild_kundensaldo`
+        """
+        cur.execute(
+            "SELECT saldo, letzte_zahlung_us, letzte_belastung_us, saldo_e2 FROM kunde "
+            + "WHERE id=?",
+            (self.kunde,),
+        )
+        row = cur.fetchone()
+        if row is None:
+            return  # no such client
+        saldo = Decimal(row[0] or 0) + self.betrag
+        betrag_e2 = to_minor_units(self.betrag, 2)
+        if row[3] is not None and betrag_e2 is not None:
+            saldo_e2 = row[3] + betrag_e2
+        else:
+            # amounts with fractions of a cent may add up to whole cents
+            saldo_e2 = to_minor_units(saldo, 2)
+        letzte_zahlung_us, letzte_belastung_us = row[1], row[2]
+        datum_us = date2int(self.datum)
+        if self.betrag > 0:
+            letzte_zahlung_us = max(letzte_zahlung_us or datum_us, datum_us)
+        elif self.betrag < 0:
+            letzte_belastung_us = max(letzte_belastung_us or datum_us, datum_us)
+        cur.execute(
+            "UPDATE kunde SET saldo=?, saldo_e2=?, letzte_zahlung_us=?, "
+            + "letzte_belastung_us=? WHERE id=?",
+            (str(saldo), saldo_e2, letzte_zahlung_us, letzte_belastung_us, self.kunde),
+        )
+
+    @staticmethod
+    def _kundensaldo_from_buchungen(cur, kunden=None):
+        """
+        calculate balance and dates of the last payment and charge from the transactions
+
+        :param cur: sqlite cursor of a :class:`Kasse` (needs the aggregate ``decimal_sum``)
+        :param kunden: ids of the clients, None for all clients
+        :return: ``{kunde: (saldo, letzte_zahlung_us, letzte_belastung_us)}``,
+                 clients without transactions are missing
+        :rtype: dict
+        """
+        # betrag_e2 is only NULL for amounts with fractions of a cent, which are never zero
+        positive = "betrag_e2 > 0 OR (betrag_e2 IS NULL AND betrag NOT LIKE '-%')"
+        negative = "betrag_e2 < 0 OR (betrag_e2 IS NULL AND betrag LIKE '-%')"
+        query = (
+            "SELECT kunde, SUM(betrag_e2), decimal_sum(betrag) FILTER (WHERE betrag_e2 IS NULL), "
+            + f"MAX(datum_us) FILTER (WHERE {positive}), "
+            + f"MAX(datum_us) FILTER (WHERE {negative}) "
+            + "FROM kundenbuchung"
+        )
+        parameters = []
+        if kunden is not None:
+            kunden = list(kunden)
+            query += " WHERE kunde IN ({0})".format(", ".join("?" * len(kunden)))
+            parameters = kunden
+        query += " GROUP BY kunde"
+        result = {}
+        for row in cur.execute(query, parameters).fetchall():
+            saldo = from_minor_units(row[1] or 0, 2) + Decimal(row[2] or 0)
+            result[row[0]] = (saldo, row[3], row[4])
+        return result
+
+    @staticmethod
+    def _update_kundensaldo(cur, kunden):
+        """
+        recalculate the cached balance and dates of the given clients in table kunde
+        """
+        kundensaldo = Kundenbuchung._kundensaldo_from_buchungen(cur, kunden)
+        for kunde in kunden:
+            saldo, letzte_zahlung_us, letzte_belastung_us = kundensaldo.get(
+                kunde, (Decimal(0), None, None)
+            )
+            cur.execute(
+                "UPDATE kunde SET saldo=?, saldo_e2=?, letzte_zahlung_us=?, "
+                + "letzte_belastung_us=? WHERE id=?",
+                (
+                    str(saldo),
+                    to_minor_units(saldo, 2),
+                    letzte_zahlung_us,
+                    letzte_belastung_us,
+                    kunde,
+                ),
+            )
+
     @property
     def beschreibung(self):
         s = ""
@@ -1076,6 +2034,212 @@ class Kundenbuchung(object):
         return s
 
 
+def _csv_money(value):
+    return locale.currency(value, symbol=False)
+
+
+# columns of ``kassenbuch.py export``: what -> [(header, CSV formatting or None)]
+EXPORT_COLUMNS = {
+    "book": [
+        ("DATUM", str),
+        ("KONTO", str),
+        ("BETRAG", _csv_money),
+        ("RECH.NR.", str),
+        ("KOMMENTAR", str),
+    ],
+    "invoices": [
+        ("RECH.NR.", str),
+        ("DATUM", str),
+        ("ARTIKEL", None),
+        ("ANZAHL", str),
+        ("EINHEIT", None),
+        ("EINZELPREIS", _csv_money),
+        ("SUMME", _csv_money),
+        ("PRODUKT NR.", None),
+    ],
+}
+EXPORT_FORMATS = ["csv", "jsonl", "columnar"]
+
+
+def _iter_export_objects(kasse, what, from_date=None, until_date=None, after_id=None):
+    """Buchung or Rechnung objects to export, see :meth:`Kasse.iter_buchungen`"""
+    if what == "book":
+        return kasse.iter_buchungen(from_date, until_date, after_id)
+    elif what == "invoices":
+        return kasse.iter_rechnungen(from_date, until_date, after_id)
+    else:
+        raise NotImplementedError(what)
+
+
+def _export_rows(obj):
+    """rows of a Buchung or Rechnung for :func:`write_export`"""
+    if isinstance(obj, Buchung):
+        return [[obj.datum, obj.konto, obj.betrag, obj.rechnung, obj.kommentar]]
+    rows = [
+        [
+            obj.id,
+            obj.datum,
+            p["artikel"],
+            p["anzahl"],
+            p["einheit"],
+            p["einzelpreis"],
+            obj.summe_position(p),
+            p["produkt_ref"],
+        ]
+        for p in obj.positionen
+    ]
+    return rows + [None]
+
+
+def iter_export_rows(kasse, what, from_date=None, until_date=None):
+    """
+    rows for :func:`write_export`, streamed from the database
+
+    :param what: "book" or "invoices", see :data:`EXPORT_COLUMNS`
+    :return: iterator of value lists, ``None`` marks the end of an invoice
+    """
+    for obj in _iter_export_objects(kasse, what, from_date, until_date):
+        yield from _export_rows(obj)
+
+
+def export_incremental(
+    kasse, what, directory, fileformat="csv", name=None, chunk_size=1000, today=None
+):
+    """
+    export only the records added since the last run
+
+    The rows are appended to the daily file ``<directory>/<what>_<YYYY-MM-DD>.<format>``.
+    The id of the last exported record is stored in the table export_stand after each
+    chunk. If an export was interrupted, the next run first truncates the file to the
+    state of the last stored bookmark, so no row is exported twice.
+
+    :param what: "book" or "invoices", see :data:`EXPORT_COLUMNS`
+    :param name: name of the bookmark, for independent exports of the same data.
+                 default: ``what``
+    :param today: date for the filename, default: today
+    :return: number of exported records
+    :rtype: int
+    """
+    name = name or what
+    row = kasse.cur.execute(
+        "SELECT letzte_id, datei, laenge FROM export_stand WHERE name=?", (name,)
+    ).fetchone()
+    (letzte_id, datei, laenge) = row or (0, None, None)
+    if datei is not None and os.path.exists(datei) and os.path.getsize(datei) > laenge:
+        # remove the rows of an interrupted run
+        os.truncate(datei, laenge)
+
+    filename = os.path.join(
+        directory,
+        "{0}_{1:%Y-%m-%d}.{2}".format(what, today or datetime.now(), fileformat),
+    )
+    anzahl = 0
+    objects = _iter_export_objects(kasse, what, after_id=letzte_id)
+    while True:
+        chunk = list(itertools.islice(objects, chunk_size))
+        if not chunk:
+            return anzahl
+        with open(filename, "a", encoding="utf8", newline="") as f:
+            laenge = f.tell()
+            with kasse.transaction() as cur:
+                cur.execute(
+                    "INSERT OR REPLACE INTO export_stand (name, letzte_id, datei, laenge) "
+                    + "VALUES (?, ?, ?, ?)",
+                    (name, letzte_id, filename, laenge),
+                )
+            write_export(
+                f,
+                what,
+                itertools.chain.from_iterable(_export_rows(obj) for obj in chunk),
+                fileformat,
+                chunk_size,
+                header=(laenge == 0),
+            )
+            f.flush()
+            os.fsync(f.fileno())
+        letzte_id = chunk[-1].id
+        anzahl += len(chunk)
+        with kasse.transaction() as cur:
+            cur.execute(
+                "UPDATE export_stand SET letzte_id=?, laenge=? WHERE name=?",
+                (letzte_id, os.path.getsize(filename), name),
+            )
+
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime):
+        return str(value)
+    return value
+
+
+def write_export(outfile, what, rows, fileformat="csv", chunk_size=1000, header=True):
+    """
+    write rows from :func:`iter_export_rows` as soon as they arrive
+
+    Formats:
+
+    - csv: German number format, an empty line after each invoice
+    - jsonl: one JSON object per row
+    - columnar: one JSON object per group of ``chunk_size`` rows, with a list of
+      values for each column (like the row groups of Parquet)
+
+    Amounts are exported as exact decimal strings in the JSON formats.
+
+    :param outfile: text file
+    :param what: "book" or "invoices", see :data:`EXPORT_COLUMNS`
+    :param fileformat: one of :data:`EXPORT_FORMATS`
+    :param header: write the header line (csv only)
+    """
+    columns = EXPORT_COLUMNS[what]
+    names = [name for (name, _) in columns]
+    if fileformat == "csv":
+        writer = csv.writer(outfile)
+        if header:
+            writer.writerow(names)
+        for row in rows:
+            if row is None:
+                writer.writerow([])
+                continue
+            writer.writerow(
+                [
+                    value if fmt is None else fmt(value)
+                    for ((_, fmt), value) in zip(columns, row)
+                ]
+            )
+    elif fileformat == "jsonl":
+        for row in rows:
+            if row is not None:
+                outfile.write(
+                    json.dumps(
+                        dict(zip(names, map(_json_value, row))), ensure_ascii=False
+                    )
+                    + "\n"
+                )
+    elif fileformat == "columnar":
+        group = [[] for _ in columns]
+
+        def write_group():
+            if group[0]:
+                outfile.write(
+                    json.dumps(dict(zip(names, group)), ensure_ascii=False) + "\n"
+                )
+            for column in group:
+                column.clear()
+
+        for row in rows:
+            if row is None:
+                continue
+            for column, value in zip(group, row):
+                column.append(_json_value(value))
+            if len(group[0]) >= chunk_size:
+                write_group()
+        write_group()
+    else:
+        raise NotImplementedError(fileformat)
+
+
 def parse_date(value):
     """
     parse date from string or None
@@ -1132,47 +2296,50 @@ def argparse_parse_currency(amount):
         raise argparse.ArgumentTypeError(e.message)
 
 
-def argparse_parse_client(value):
-    """get a client out of the database by name or id"""
-    cfg = scriptHelper.getConfig()
-    k = Kasse(cfg.get("general", "db_file"))
+def find_client(value, cur):
+    """
+    get a client out of the database by name or id
+
+    :raises NoDataFound: if there is no such client
+    """
     try:
-        return Kunde.load_from_id(int(value), k.cur)
+        return Kunde.load_from_id(int(value), cur)
     except (ValueError, NoDataFound):
         pass  # ok, maybe it's not an ID but a name:
-    try:
-        return Kunde.load_from_name(value, k.cur)
-    except NoDataFound:
-        raise argparse.ArgumentTypeError(
-            "Konnte keinen Kunde unter '{0}' finden.".format(value)
-        )
+    return Kunde.load_from_name(value, cur)
 
 
 def client_argcomplete(prefix, **kwargs):
     """tab completion for clients"""
     cfg = scriptHelper.getConfig()
-    k = Kasse(cfg.get("general", "db_file"))
+    try:
+        k = Kasse(cfg.get("general", "db_file"), readonly=True)
+    except SchemaOutdated:
+        return []
     lst = [c.name for c in k.kunden if c.name.startswith(prefix)]
     lst += [str(c.id) for c in k.kunden if str(c.id).startswith(prefix)]
     return lst
 
 
-def argparse_parse_receipt(rid):
-    """get the receipt from its id"""
-    cfg = scriptHelper.getConfig()
-    k = Kasse(cfg.get("general", "db_file"))
+def find_receipt(rid, cur):
+    """
+    get the receipt from its id
+
+    :raises NoDataFound: if there is no such receipt
+    """
     try:
-        return Rechnung.load_from_id(int(rid), k.cur)
-    except (ValueError, NoDataFound):
-        raise argparse.ArgumentTypeError(
-            "Konnte keine Rechnung mit der ID '{0}' finden.".format(rid)
-        )
+        return Rechnung.load_from_id(int(rid), cur)
+    except ValueError:
+        raise NoDataFound()
 
 
 def receipt_argcomplete(prefix, **kwargs):
     """tab completion for receipts"""
     cfg = scriptHelper.getConfig()
-    k = Kasse(cfg.get("general", "db_file"))
+    try:
+        k = Kasse(cfg.get("general", "db_file"), readonly=True)
+    except SchemaOutdated:
+        return []
     return [str(r.id) for r in k.rechnungen if str(r.id).startswith(prefix)]
 
 
@@ -1234,10 +2401,27 @@ def parse_args(argv=sys.argv[1:]):
     parser_export.add_argument(
         "outfile",
         action="store",
+        nargs="?",
         type=argparse.FileType(mode="w", encoding="utf8"),
         default="-",
         help="the output file, - for stdout. keep in mind that this uses utf-8 even for stdout",
     )
+    parser_export.add_argument(
+        "--incremental",
+        action="store",
+        type=os.path.abspath,
+        metavar="directory",
+        dest="incremental",
+        help="only export the records added since the last incremental export, append "
+        + "them to a daily file in the given directory. Cannot be used with --from/--until",
+    )
+    parser_export.add_argument(
+        "--bookmark",
+        action="store",
+        metavar="name",
+        dest="bookmark",
+        help="name for remembering the progress of --incremental (default: book or invoices)",
+    )
     parser_export.add_argument(
         "--from",
         action="store",
@@ -1260,8 +2444,25 @@ def parse_args(argv=sys.argv[1:]):
         dest="format",
         metavar="fileformat",
         default="csv",
-        choices=["csv"],
-        help="format for the output file (default csv)",
+        choices=EXPORT_FORMATS,
+        help="format for the output file: csv, jsonl (JSON Lines) or columnar "
+        + "(JSON Lines, one line with a list per column for each group of rows). default csv",
+    )
+    # upgrade
+    subparsers.add_parser(
+        "upgrade",
+        help="upgrade the database schema, required before the read-only reports work on an outdated database",
+    )
+    # snapshot
+    parser_snapshot = subparsers.add_parser(
+        "snapshot",
+        help="rebuild or verify the daily account totals used by summary and the cached client balances",
+    )
+    parser_snapshot.add_argument(
+        "snapshot_action",
+        action="store",
+        choices=["rebuild", "verify"],
+        help="rebuild: recalculate from all bookings, verify: compare with all bookings",
     )
     # summary
     parser_summary = subparsers.add_parser(
@@ -1329,7 +2530,7 @@ def parse_args(argv=sys.argv[1:]):
         "receipt",
         metavar="id",
         action="store",
-        type=argparse_parse_receipt,
+        type=str,
         help="the receipt ID (Rechnungsnummer)",
     ).completer = receipt_argcomplete
     # client
@@ -1379,7 +2580,7 @@ def parse_args(argv=sys.argv[1:]):
     parser_client_edit.add_argument(
         "client",
         action="store",
-        type=argparse_parse_client,
+        type=str,
         help="The name or id of the client",
     ).completer = client_argcomplete
 
@@ -1391,7 +2592,7 @@ def parse_args(argv=sys.argv[1:]):
     parser_client_disable.add_argument(
         "client",
         action="store",
-        type=argparse_parse_client,
+        type=str,
         help="The name or id of the client",
     ).completer = client_argcomplete
     # client show
@@ -1403,7 +2604,7 @@ def parse_args(argv=sys.argv[1:]):
     parser_client_show.add_argument(
         "client",
         action="store",
-        type=argparse_parse_client,
+        type=str,
         help="The name or id of the client",
     ).completer = client_argcomplete
     parser_client_show.add_argument(
@@ -1421,7 +2622,7 @@ def parse_args(argv=sys.argv[1:]):
     parser_client_charge.add_argument(
         "client",
         action="store",
-        type=argparse_parse_client,
+        type=str,
         help="The name or id of the client",
     ).completer = client_argcomplete
     parser_client_charge.add_argument(
@@ -1445,7 +2646,7 @@ def parse_args(argv=sys.argv[1:]):
     parser_client_payup.add_argument(
         "client",
         action="store",
-        type=argparse_parse_client,
+        type=str,
         help="The name or id of the client",
     ).completer = client_argcomplete
     parser_client_payup.add_argument(
@@ -1478,7 +2679,18 @@ def main():
     os.chdir(os.path.dirname(os.path.realpath(__file__)))
 
     cfg = scriptHelper.getConfig()
-    k = Kasse(cfg.get("general", "db_file"))
+    # reports only read, so they must not delay a sale in the GUI
+    readonly = (
+        args.action in ["show", "summary", "receipt"]
+        or (args.action == "export" and not args.incremental)
+        or (args.action == "snapshot" and args.snapshot_action == "verify")
+        or (args.action == "client" and args.client_action in ["show", "list"])
+    )
+    try:
+        k = Kasse(cfg.get("general", "db_file"), readonly=readonly)
+    except SchemaOutdated as e:
+        print("[!] {0}".format(e), file=sys.stderr)
+        sys.exit(1)
 
     # r = Rechnung()
     # r.add_position("Plexiglas 5mm gruen", Decimal("0.015"), anzahl=100, einheit='qcm', produkt_ref='1000')
@@ -1506,6 +2718,28 @@ def main():
     if "comment" in args:
         args.comment = " ".join(args.comment)
 
+    # clients and receipts are looked up only now, in the upgraded database
+    if "client" in args:
+        try:
+            args.client = find_client(args.client, k.cur)
+        except NoDataFound:
+            print(
+                "[!] Konnte keinen Kunde unter '{0}' finden.".format(args.client),
+                file=sys.stderr,
+            )
+            sys.exit(2)
+    if "receipt" in args:
+        try:
+            args.receipt = find_receipt(args.receipt, k.cur)
+        except NoDataFound:
+            print(
+                "[!] Konnte keine Rechnung mit der ID '{0}' finden.".format(
+                    args.receipt
+                ),
+                file=sys.stderr,
+            )
+            sys.exit(2)
+
     if args.action == "show":
         print(
             k.to_string(
@@ -1515,56 +2749,57 @@ def main():
                 show_receipts=not args.hide_receipts,
             )
         )
-    elif args.action == "export":
-        if args.what == "book":
-            # TODO Use csv.DictWriter
-            writer = csv.writer(args.outfile)
-            # Header
-            writer.writerow(["DATUM", "KONTO", "BETRAG", "RECH.NR.", "KOMMENTAR"])
-            # Content
-            for b in k.buchungen:
-                writer.writerow(
-                    [
-                        str(b.datum),
-                        str(b.konto),
-                        locale.currency(b.betrag, symbol=False),
-                        str(b.rechnung),
-                        str(b.kommentar),
-                    ]
-                )
-        elif args.what == "invoices":
-            writer = csv.writer(args.outfile)
-            # Header
-            writer.writerow(
-                [
-                    "RECH.NR.",
-                    "DATUM",
-                    "ARTIKEL",
-                    "ANZAHL",
-                    "EINHEIT",
-                    "EINZELPREIS",
-                    "SUMME",
-                    "PRODUKT NR.",
-                ]
+    elif args.action == "export" and args.incremental:
+        if args.from_date or args.until_date:
+            print(
+                "[!] --incremental cannot be used with --from/--until", file=sys.stderr
             )
-            # Content
-            for r in k.rechnungen:
-                for p in r.positionen:
-                    writer.writerow(
-                        [
-                            str(r.id),
-                            str(r.datum),
-                            p["artikel"],
-                            str(p["anzahl"]),
-                            p["einheit"],
-                            locale.currency(p["einzelpreis"], symbol=False),
-                            locale.currency(r.summe_position(p), symbol=False),
-                            p["produkt_ref"],
-                        ]
-                    )
-                writer.writerow([])
+            sys.exit(1)
+        anzahl = export_incremental(
+            k, args.what, args.incremental, args.format, name=args.bookmark
+        )
+        print("[i] exported {0} new records".format(anzahl), file=sys.stderr)
+    elif args.action == "export":
+        write_export(
+            args.outfile,
+            args.what,
+            iter_export_rows(k, args.what, args.from_date, args.until_date),
+            args.format,
+        )
     elif args.action == "summary":
         print(k.summary_to_string(date=args.until_date, snapshot_time=startup_time))
+    elif args.action == "snapshot":
+        if args.snapshot_action == "rebuild":
+            k.rebuild_tagessaldo()
+            k.rebuild_kundensaldo()
+            print("[i] done")
+        elif args.snapshot_action == "verify":
+            differences = k.verify_tagessaldo()
+            for tag, konto, expected, actual in differences:
+                print(
+                    "[!] {tag} {konto}: expected (haben, soll) {expected}, found {actual}".format(
+                        tag=tag, konto=konto, expected=expected, actual=actual
+                    ),
+                    file=sys.stderr,
+                )
+            kunden_differences = k.verify_kundensaldo()
+            for kunde, expected, actual in kunden_differences:
+                print(
+                    "[!] client {kunde}: expected (saldo, letzte_zahlung_us, letzte_belastung_us) {expected}, found {actual}".format(
+                        kunde=kunde, expected=expected, actual=actual
+                    ),
+                    file=sys.stderr,
+                )
+            if differences or kunden_differences:
+                print(
+                    "[!] snapshot is inconsistent, run 'kassenbuch.py snapshot rebuild'",
+                    file=sys.stderr,
+                )
+                sys.exit(1)
+            print("[i] snapshot is consistent")
+    elif args.action == "upgrade":
+        # the migrations already ran when opening k
+        print("[i] database schema is up to date")
     elif args.action == "transfer":
 
         b1 = Buchung(args.source, -args.amount, kommentar=args.comment)
@@ -1805,47 +3040,28 @@ KdNr|                     Name|  Kontostand|  Grenze| Letzte Zahlung | Letzte Bu
 ----+-------------------------+------------+--------+----------------+----------------+"""
             )
 
-            for k in k.kunden:
-                last_payment = sorted(
-                    [b.datum for b in k.buchungen if b.betrag > 0], reverse=True
-                )[:1]
-                last_charge = sorted(
-                    [b.datum for b in k.buchungen if b.betrag < 0], reverse=True
-                )[:1]
-
-                # Using a skip flag, to allow overlapping filtering, where any filter will allow
-                # an entry to pass
-                skip = True
-                if args.inactive is not None and last_charge:
-                    # skip sufficiently active clients
-                    if (datetime.now() - last_charge[0]).days >= args.inactive:
-                        skip = False
-                if args.maxbalance is not None and k.summe < args.maxbalance:
-                    # skip clients with sufficient balance
-                    skip = False
-                if args.maxbalance is None and args.inactive is None:
-                    # Let everything pass if not filters were given
-                    skip = False
-                if args.remove_zeros and abs(k.summe) < 0.005:
-                    skip = True
-                if skip:
-                    continue
-
-                if not last_payment:
+            # any of the filters --inactive and --maxbalance allows an entry to pass
+            for kunde in k.iter_kunden(
+                inactive=args.inactive,
+                maxbalance=args.maxbalance,
+                remove_zeros=args.remove_zeros,
+                now=startup_time,
+            ):
+                if kunde.letzte_zahlung is None:
                     last_payment = "n/a"
                 else:
-                    last_payment = last_payment[0].strftime("%Y-%m-%d")
-                if not last_charge:
+                    last_payment = kunde.letzte_zahlung.strftime("%Y-%m-%d")
+                if kunde.letzte_belastung is None:
                     last_charge = "n/a"
                 else:
-                    last_charge = last_charge[0].strftime("%Y-%m-%d")
+                    last_charge = kunde.letzte_belastung.strftime("%Y-%m-%d")
 
                 print(
                     "{0:>4}|{1:>25}|{2:>8} EUR|{3:>8}| {4:>14} | {5:>14}".format(
-                        k.id,
-                        k.name,
-                        moneyfmt(k.summe),
-                        moneyfmt(k.schuldengrenze),
+                        kunde.id,
+                        kunde.name,
+                        moneyfmt(kunde.summe),
+                        moneyfmt(kunde.schuldengrenze),
                         last_payment,
                         last_charge,
                     )
@@ -1,6 +1,21 @@
+"""
+schema of the product JSON (price list) and fast decoding of the whole catalogue
+
+The product JSON is decoded as a stream, record by record, so that the dozens of
+unused fields per product are never held in memory for the whole catalogue.
+
+Usage: ``python3 -m FabLabKasse.product_record products.json`` decodes a downloaded
+product list and prints the time needed and all invalid records.
+"""
+
 from dataclasses import dataclass
 from dataclasses_json import dataclass_json
-from typing import List
+from decimal import Decimal, InvalidOperation
+from typing import List, Optional
+import json
+import re
+import sys
+import time
 
 
 @dataclass_json
@@ -9,6 +24,324 @@ class ProductRecord:
     code: str  # AKA plu
     name: str
     _uom_str: str  # AKA basiseinheit
-    lst_price: float  # AKA basispreis FIXME Never use float for price, use BigDecimal or similar
+    lst_price: Decimal  # AKA basispreis
     _categ_list: List[str]
     input_mode: str = "DECIMAL"
+    _location_str: str = ""
+    categ_id: Optional[int] = None  # in JSON: [id, "category path"]
+    _uom_rounding: Decimal = Decimal(1)
+
+
+@dataclass
+class RecordError:
+    """an invalid record of the catalogue"""
+
+    key: str  # key of the record in the catalogue
+    message: str
+
+
+def _decode_str(value):
+    if not isinstance(value, str):
+        raise ValueError("expected a string, got {0!r}".format(value))
+    return value
+
+
+def _decode_optional_str(value):
+    # unset fields are exported as false
+    if value is False or value is None:
+        return ""
+    return _decode_str(value)
+
+
+def _decode_code(value):
+    if not isinstance(value, str) or not value.isdigit():
+        raise ValueError("expected a numeric string, got {0!r}".format(value))
+    return value
+
+
+def _decode_decimal(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float, Decimal, str)):
+        raise ValueError("expected a number, got {0!r}".format(value))
+    if isinstance(value, float):
+        # shortest representation, 0.15 -> Decimal("0.15")
+        value = repr(value)
+    try:
+        value = Decimal(value)
+    except InvalidOperation:
+        raise ValueError("expected a number, got {0!r}".format(value))
+    if not value.is_finite():
+        raise ValueError("expected a finite number, got {0!r}".format(value))
+    return value
+
+
+def _decode_str_list(value):
+    if not isinstance(value, list) or not all(isinstance(i, str) for i in value):
+        raise ValueError("expected a list of strings, got {0!r}".format(value))
+    return value
+
+
+def _decode_categ_id(value):
+    if (
+        not isinstance(value, list)
+        or len(value) != 2
+        or not isinstance(value[0], int)
+        or isinstance(value[0], bool)
+    ):
+        raise ValueError("expected [id, name], got {0!r}".format(value))
+    return value[0]
+
+
+# (JSON field, decoder, required) for every field of ProductRecord
+_FIELDS = [
+    ("code", _decode_code, True),
+    ("name", _decode_str, True),
+    ("_uom_str", _decode_str, True),
+    ("lst_price", _decode_decimal, True),
+    ("_categ_list", _decode_str_list, True),
+    ("input_mode", _decode_str, False),
+    ("_location_str", _decode_optional_str, False),
+    ("categ_id", _decode_categ_id, False),
+    ("_uom_rounding", _decode_decimal, False),
+]
+
+
+def _decode_record_checked(raw):
+    """decode_record() with validation of every field, for precise error messages"""
+    if not isinstance(raw, dict):
+        raise ValueError("expected an object, got {0!r}".format(raw))
+    values = {}
+    for (field, decode, required) in _FIELDS:
+        try:
+            value = raw[field]
+        except KeyError:
+            if required:
+                raise ValueError("missing field {0}".format(field))
+            continue
+        try:
+            values[field] = decode(value)
+        except ValueError as e:
+            raise ValueError("field {0}: {1}".format(field, e))
+    return ProductRecord(**values)
+
+
+def decode_record(raw):
+    """
+    validate one record of the product JSON and convert it to a ProductRecord
+
+    Fields not in ProductRecord are ignored. Prices are decoded exactly: pass
+    ``parse_float=Decimal`` to the JSON decoder, plain floats are converted by their
+    shortest representation.
+
+    :param raw: decoded JSON object of a product
+    :type raw: dict
+    :rtype: ProductRecord
+    :raises ValueError: if the record does not match the schema
+    """
+    # fast path for the usual, complete record with Decimal prices. Anything
+    # else is handled by the field-by-field validation. The checks must match
+    # _FIELDS, test_product_record tests every invalid value with both paths.
+    try:
+        code = raw["code"]
+        name = raw["name"]
+        uom_str = raw["_uom_str"]
+        lst_price = raw["lst_price"]
+        categ_list = raw["_categ_list"]
+        input_mode = raw.get("input_mode", "DECIMAL")
+        location_str = raw["_location_str"]
+        categ_id = raw["categ_id"]
+        uom_rounding = raw["_uom_rounding"]
+    except (KeyError, TypeError, AttributeError):
+        return _decode_record_checked(raw)
+    if (
+        type(code) is str
+        and code.isdigit()
+        and type(name) is str
+        and type(uom_str) is str
+        and type(lst_price) is Decimal
+        and lst_price.is_finite()
+        and type(categ_list) is list
+        and all(type(i) is str for i in categ_list)
+        and type(input_mode) is str
+        and type(location_str) is str
+        and type(categ_id) is list
+        and len(categ_id) == 2
+        and type(categ_id[0]) is int
+        and type(uom_rounding) is Decimal
+        and uom_rounding.is_finite()
+    ):
+        return ProductRecord(
+            code,
+            name,
+            uom_str,
+            lst_price,
+            categ_list,
+            input_mode,
+            location_str,
+            categ_id[0],
+            uom_rounding,
+        )
+    return _decode_record_checked(raw)
+
+
+def _decode_items(items, errors):
+    """decode (key, raw record) pairs, see iter_catalogue()"""
+    for (key, raw) in items:
+        try:
+            yield decode_record(raw)
+        except ValueError as e:
+            errors.append(RecordError(key=key, message=str(e)))
+
+
+def decode_catalogue(products_raw):
+    """
+    decode all records of the product JSON. Invalid records are skipped and reported.
+
+    :param products_raw: decoded product JSON ``{key: product}``
+    :type products_raw: dict
+    :return: ``(records, errors)``
+    :rtype: (list[ProductRecord], list[RecordError])
+    """
+    errors = []
+    records = list(_decode_items(products_raw.items(), errors))
+    return (records, errors)
+
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# rest of the buffer after a number that may still continue it, like "" or "1e"
+_NUMBER_CONTINUATION = re.compile(r"[0-9.eE+-]*\Z")
+
+
+class _JSONStream(object):
+
+    """reads the JSON values of a text file object one by one"""
+
+    def __init__(self, f, chunk_size):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buffer = ""
+        self.pos = 0
+        self.decoder = json.JSONDecoder(parse_float=Decimal)
+
+    def _read_more(self):
+        """append the next chunk to the unread part of the buffer. Return False at the end of the file."""
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.buffer = self.buffer[self.pos :] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """:return: the next character that is not whitespace, or "" at the end of the file"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._read_more():
+                return ""
+
+    def expect(self, char):
+        """consume the next character that is not whitespace, it must be ``char``"""
+        found = self.peek()
+        if found != char:
+            raise ValueError("expected {0!r}, got {1!r}".format(char, found))
+        self.pos += 1
+
+    def value(self):
+        """decode the next value"""
+        self.peek()
+        while True:
+            try:
+                (value, end) = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # incomplete value, unless the file ends here
+                if not self._read_more():
+                    raise
+                continue
+            # a number at the end of the buffer may continue in the next chunk,
+            # also if the next chunk only holds an incomplete part like "." or "e"
+            if (
+                not _NUMBER_CONTINUATION.match(self.buffer, end)
+                or not self._read_more()
+            ):
+                self.pos = end
+                return value
+
+
+def iter_json_object(f, chunk_size=65536):
+    """
+    decode a JSON object from a text file object incrementally, member by member
+
+    Only the current member and a chunk of the text are kept in memory.
+    Numbers with a fraction are decoded as Decimal.
+
+    :param f: text file object
+    :return: iterator of ``(key, value)``
+    :raises ValueError: if the document is not a valid JSON object
+    """
+    stream = _JSONStream(f, chunk_size)
+    stream.expect("{")
+    if stream.peek() == "}":
+        stream.pos += 1
+    else:
+        while True:
+            key = stream.value()
+            if not isinstance(key, str):
+                raise ValueError("expected a key, got {0!r}".format(key))
+            stream.expect(":")
+            yield (key, stream.value())
+            if stream.peek() != ",":
+                break
+            stream.pos += 1
+        stream.expect("}")
+    if stream.peek() != "":
+        raise ValueError("extra data after the JSON object")
+
+
+def iter_catalogue(f, errors):
+    """
+    stream the product JSON from a text file object and decode it record by record
+
+    Each record is converted to a ProductRecord right after it was read, so only
+    the fields of ProductRecord are kept. Invalid records are skipped and reported.
+
+    :param errors: list to which a RecordError is appended for every invalid record
+    :type errors: list[RecordError]
+    :return: iterator of ProductRecord
+    :raises ValueError: if the document is not a valid JSON object
+    """
+    return _decode_items(iter_json_object(f), errors)
+
+
+def load_catalogue(f):
+    """
+    read and decode the product JSON from a text file object, see iter_catalogue()
+
+    :rtype: (list[ProductRecord], list[RecordError])
+    """
+    errors = []
+    records = list(iter_catalogue(f, errors))
+    return (records, errors)
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+    if len(argv) != 1:
+        print("usage: python3 -m FabLabKasse.product_record products.json")
+        sys.exit(1)
+    start = time.perf_counter()
+    with open(argv[0], encoding="utf-8") as f:
+        (records, errors) = load_catalogue(f)
+    duration = time.perf_counter() - start
+    for error in errors:
+        print("{0}: {1}".format(error.key, error.message))
+    print(
+        "{0} records, {1} errors in {2:.1f} ms".format(
+            len(records), len(errors), duration * 1000
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
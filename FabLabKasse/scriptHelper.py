@@ -23,6 +23,8 @@ import signal
 import logging
 import logging.handlers
 import sys
+import os
+import pathlib
 import portalocker
 import sqlite3
 from configparser import ConfigParser
@@ -127,9 +129,114 @@ def getConfig(path="./"):
     return cfg
 
 
-def getDB():
+def connectDB(sqlite_file, readonly=False, timeout=30):
+    """
+    open a SQLite database that is shared between the GUI and the scripts
+
+    Writable connections switch the database to write-ahead-log mode, so that
+    readers (reports, exports) never block a sale and vice versa.
+    Concurrent writers wait up to ``timeout`` seconds for each other instead of
+    failing with "database is locked".
+
+    :param sqlite_file: path of the database file or ":memory:"
+    :param readonly: open the file read-only. It must already exist.
+        Use this for reporting tools, they can then never delay a checkout.
+    :param timeout: busy timeout in seconds
+    :rtype: sqlite3.Connection
+    """
+    if readonly:
+        con = sqlite3.connect(
+            pathlib.Path(os.path.abspath(sqlite_file)).as_uri() + "?mode=ro",
+            timeout=timeout,
+            uri=True,
+        )
+    else:
+        con = sqlite3.connect(sqlite_file, timeout=timeout)
+        # the journal mode is stored in the file, it stays WAL for all later connections
+        # (":memory:" databases silently stay in mode "memory")
+        con.execute("PRAGMA journal_mode=WAL")
+        # a booked sale must survive a power cut. In WAL mode this only costs one
+        # sync of the log per commit.
+        con.execute("PRAGMA synchronous=FULL")
+    # page cache per connection, negative value: size in KiB
+    con.execute("PRAGMA cache_size=-8192")
+    return con
+
+
+def getDB(readonly=False):
     cfg = getConfig()
-    return sqlite3.connect(cfg.get("general", "db_file"))
+    return connectDB(cfg.get("general", "db_file"), readonly=readonly)
+
+
+def dateRangeQuery(
+    table,
+    date_column,
+    serialize_date,
+    from_date=None,
+    until_date=None,
+    columns="id",
+    after_id=None,
+    date_reference=None,
+    **filters,
+):
+    """
+    build a parameterised SQL query for the rows of a table in a date range,
+    ordered by date, or by id if ``after_id`` is given
+
+    The query string only depends on which arguments are used, not on their values,
+    so SQLite's statement cache can reuse it.
+
+    :param table: which table should be queried
+    :param date_column: column with the date of a row
+    :param serialize_date: function that converts a datetime to the storage format of ``date_column``
+    :param from_date: start date (included)
+    :param until_date: end date (not included)
+    :param columns: comma-separated list of columns to select
+    :param after_id: only return rows with a greater id, ordered by id
+    :param date_reference: ``(other table, column)`` if the date of a row is the date of the
+        row of the other table it references, e.g. ``("rechnung", "rechnung")``.
+        ``date_column`` is then a column of the other table. Rows are ordered by the reference.
+    :param filters: only return rows with the given values, e.g. ``konto="Barkasse"``.
+        Filters with the value None are ignored.
+    :type from_date: datetime.datetime | None
+    :type until_date: datetime.datetime | None
+    :return: ``(query string, parameters)`` for :meth:`sqlite3.Cursor.execute`
+    :rtype: (str, list)
+    """
+    conditions = []
+    parameters = []
+    if from_date:
+        conditions.append(f"{date_column} >= ?")
+        parameters.append(serialize_date(from_date))
+    if until_date:
+        conditions.append(f"{date_column} < ?")
+        parameters.append(serialize_date(until_date))
+    if date_reference is not None and conditions:
+        (date_table, reference_column) = date_reference
+        conditions = [
+            f"{reference_column} IN (SELECT id FROM {date_table} WHERE "
+            + " AND ".join(conditions)
+            + ")"
+        ]
+
+    for column, value in filters.items():
+        if value is not None:
+            conditions.append(f"{column} = ?")
+            parameters.append(value)
+    if after_id is not None:
+        conditions.append("id > ?")
+        parameters.append(after_id)
+
+    query = f"SELECT {columns} FROM {table}"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    if after_id is not None:
+        query += " ORDER BY id ASC"
+    elif date_reference is not None:
+        query += f" ORDER BY {date_reference[1]} ASC, id ASC"
+    else:
+        query += f" ORDER BY {date_column} ASC, id ASC"
+    return query, parameters
 
 
 class FileLock(object):
@@ -125,6 +125,9 @@ def format_money(amount):
 class Category(object):
     """represents a category of Products"""
 
+    # no __dict__: saves memory for large catalogues
+    __slots__ = ["categ_id", "name", "parent_id"]
+
     def __init__(self, categ_id, name, parent_id=None):
         self.categ_id = categ_id
         self.name = name
@@ -165,6 +168,17 @@ class Product(object):
     :type qty_rounding: int | Decimal
     """
 
+    __slots__ = [
+        "prod_id",
+        "name",
+        "price",
+        "location",
+        "categ_id",
+        "unit",
+        "text_entry_required",
+        "qty_rounding",
+    ]
+
     def __init__(
         self,
         prod_id,
@@ -213,6 +227,16 @@ class OrderLine(object):
        [ usually True, set to False for products that also may as comment limes costing nothing ]
     """
 
+    __slots__ = [
+        "order_line_id",
+        "qty",
+        "unit",
+        "name",
+        "price_per_unit",
+        "price_subtotal",
+        "delete_if_zero_qty",
+    ]
+
     def __init__(
         self,
         order_line_id,
@@ -286,6 +310,10 @@ class AbstractShoppingBackend(object):
 
     __metaclass__ = ABCMeta
 
+    # debug mode: backends that keep a running order total check it against
+    # the sum of all order lines in get_current_total()
+    verify_total = False
+
     def __init__(self, cfg):
         """:param cfg: config from ScriptHelper.getConfig()"""
         self.cfg = cfg
@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# FabLabKasse, a Point-of-Sale Software for FabLabs and other public and trust-based workshops.
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program. If not,
+# see <http://www.gnu.org/licenses/>.
+
+"""local cache of the product catalogue (categories and products) downloaded from the web
+
+The parsed catalogue is stored as a versioned JSON snapshot, together with the
+ETag and Last-Modified headers of the downloads. At startup, the catalogue is
+read from the snapshot without network access. The snapshot is then revalidated
+with conditional GET requests in a background thread, so that an updated
+catalogue is used from the next start on.
+"""
+
+import io
+import json
+import logging
+import os
+import threading
+import urllib.error
+import urllib.request
+from decimal import Decimal
+
+from .abstract import Category, Product
+
+
+def category_to_dict(category):
+    return {
+        "categ_id": category.categ_id,
+        "name": category.name,
+        "parent_id": category.parent_id,
+    }
+
+
+def category_from_dict(d):
+    return Category(categ_id=d["categ_id"], name=d["name"], parent_id=d["parent_id"])
+
+
+def product_to_dict(product):
+    # Decimal is stored as string to keep the exact value
+    return {
+        "prod_id": product.prod_id,
+        "name": product.name,
+        "price": str(product.price),
+        "unit": product.unit,
+        "location": product.location,
+        "categ_id": product.categ_id,
+        "qty_rounding": str(product.qty_rounding),
+        "text_entry_required": product.text_entry_required,
+    }
+
+
+def product_from_dict(d):
+    return Product(
+        prod_id=d["prod_id"],
+        name=d["name"],
+        price=Decimal(d["price"]),
+        unit=d["unit"],
+        location=d["location"],
+        categ_id=d["categ_id"],
+        qty_rounding=Decimal(d["qty_rounding"]),
+        text_entry_required=d["text_entry_required"],
+    )
+
+
+def conditional_get(url, etag=None, last_modified=None, timeout=30):
+    """
+    download a resource unless it is unchanged since the last download
+
+    :param etag: value of the ETag header of the last download, or None
+    :param last_modified: value of the Last-Modified header of the last download, or None
+    :return: ``(body, etag, last_modified)`` of the new download.
+        ``body`` is None if the server answered "304 Not Modified".
+    :rtype: (bytes | None, str | None, str | None)
+    :raises: urllib.error.URLError, OSError on network or server errors
+    """
+    headers = {}
+    if etag is not None:
+        headers["If-None-Match"] = etag
+    if last_modified is not None:
+        headers["If-Modified-Since"] = last_modified
+    request = urllib.request.Request(url, headers=headers)
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return (
+                response.read(),
+                response.headers.get("ETag"),
+                response.headers.get("Last-Modified"),
+            )
+    except urllib.error.HTTPError as e:
+        if e.code == 304:
+            return (None, etag, last_modified)
+        raise
+
+
+class CatalogueCache(object):
+
+    """
+    catalogue snapshot on disk, revalidated against the categories and products URLs
+
+    :param filename: path of the JSON snapshot
+    :param categories_url: URL of the category JSON
+    :param products_url: URL of the product JSON
+    :param read_categories: function (text file object with the category JSON) -> (list of Category, root_category_id)
+    :param read_products: function (text file object with the product JSON) -> list of Product
+    :param timeout: network timeout in seconds
+    """
+
+    # increase when the snapshot format changes, older snapshots are then ignored
+    VERSION = 1
+
+    def __init__(
+        self,
+        filename,
+        categories_url,
+        products_url,
+        read_categories,
+        read_products,
+        timeout=30,
+    ):
+        self.filename = filename
+        self.categories_url = categories_url
+        self.products_url = products_url
+        self.read_categories = read_categories
+        self.read_products = read_products
+        self.timeout = timeout
+        self._refresh_thread = None
+
+    def _read_snapshot(self):
+        """
+        :return: the decoded snapshot, or None if it is missing, unreadable,
+            of another version or for other URLs
+        :rtype: dict | None
+        """
+        try:
+            with open(self.filename, encoding="utf-8") as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(
+                "ignoring unreadable catalogue cache {0}: {1}".format(self.filename, e)
+            )
+            return None
+        if snapshot.get("version") != self.VERSION:
+            logging.info("ignoring catalogue cache of an other version")
+            return None
+        if (
+            snapshot["categories"]["url"] != self.categories_url
+            or snapshot["products"]["url"] != self.products_url
+        ):
+            logging.info("ignoring catalogue cache for other URLs")
+            return None
+        return snapshot
+
+    def _write_snapshot(self, snapshot):
+        """atomically replace the snapshot file"""
+        directory = os.path.dirname(self.filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_filename = self.filename + ".tmp"
+        with open(tmp_filename, "w", encoding="utf-8") as f:
+            json.dump(snapshot, f, separators=(",", ":"), ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_filename, self.filename)
+
+    def load(self):
+        """
+        read the catalogue from the snapshot, without network access
+
+        :return: ``(categories, root_category_id, products)``, or None if there is no valid snapshot
+        """
+        snapshot = self._read_snapshot()
+        if snapshot is None:
+            return None
+        categories_data = snapshot["categories"]["data"]
+        return (
+            [category_from_dict(c) for c in categories_data["categories"]],
+            categories_data["root_category_id"],
+            [product_from_dict(p) for p in snapshot["products"]["data"]],
+        )
+
+    def refresh(self):
+        """
+        revalidate the snapshot and download and parse the parts that have changed
+
+        :return: True if the snapshot was updated
+        :rtype: bool
+        :raises: network errors, parser errors of the download. The snapshot is left unchanged then.
+        """
+        old_snapshot = self._read_snapshot()
+        snapshot = {"version": self.VERSION}
+        changed = old_snapshot is None
+        for (key, url) in [
+            ("categories", self.categories_url),
+            ("products", self.products_url),
+        ]:
+            etag = last_modified = None
+            if old_snapshot is not None:
+                etag = old_snapshot[key]["etag"]
+                last_modified = old_snapshot[key]["last_modified"]
+            (body, etag, last_modified) = conditional_get(
+                url, etag, last_modified, self.timeout
+            )
+            if body is None:
+                logging.debug("catalogue cache: {0} not modified".format(url))
+                data = old_snapshot[key]["data"]
+            else:
+                logging.info("catalogue cache: downloaded {0}".format(url))
+                f = io.TextIOWrapper(io.BytesIO(body), encoding="utf-8")
+                if key == "categories":
+                    (categories, root_category_id) = self.read_categories(f)
+                    data = {
+                        "root_category_id": root_category_id,
+                        "categories": [category_to_dict(c) for c in categories],
+                    }
+                else:
+                    data = [product_to_dict(p) for p in self.read_products(f)]
+                changed = changed or data != old_snapshot[key]["data"]
+            snapshot[key] = {
+                "url": url,
+                "etag": etag,
+                "last_modified": last_modified,
+                "data": data,
+            }
+        if changed or snapshot != old_snapshot:
+            self._write_snapshot(snapshot)
+        return changed
+
+    def _refresh_logging_errors(self):
+        try:
+            if self.refresh():
+                logging.info(
+                    "catalogue cache updated, the new catalogue is used after the next restart"
+                )
+        except Exception as e:
+            logging.warning(
+                "catalogue cache could not be refreshed, using cached version",
+                exc_info=e,
+            )
+
+    def refresh_in_background(self):
+        """
+        start refresh() in a background thread. Errors are only logged.
+
+        :return: the thread
+        :rtype: threading.Thread
+        """
+        self._refresh_thread = threading.Thread(
+            target=self._refresh_logging_errors,
+            name="CatalogueCache refresh",
+            daemon=True,
+        )
+        self._refresh_thread.start()
+        return self._refresh_thread
+
+    def get(self):
+        """
+        return the cached catalogue and refresh it in the background.
+
+        Only if there is no cached catalogue yet, it is downloaded synchronously.
+
+        :return: ``(categories, root_category_id, products)``
+        :raises: network and parser errors if there is no cached catalogue and the download fails
+        """
+        catalogue = self.load()
+        if catalogue is not None:
+            self.refresh_in_background()
+            return catalogue
+        logging.info("no catalogue cache yet, downloading catalogue")
+        self.refresh()
+        return self.load()
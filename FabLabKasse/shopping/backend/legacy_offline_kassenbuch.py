@@ -24,11 +24,17 @@ from __future__ import absolute_import
 
 import logging
 from .abstract import Product, Category, PrinterError
-from .offline_base import AbstractOfflineShoppingBackend, Client
+from .offline_base import (
+    AbstractOfflineShoppingBackend,
+    Client,
+    count_products_recursive,
+)
+from .catalogue_cache import CatalogueCache
 from decimal import Decimal
 from ..payment_methods import ManualCashPayment, FAUCardPayment
 from ... import scriptHelper
 from ...kassenbuch import Kasse, Rechnung, Buchung, Kunde
+from ...product_record import iter_catalogue
 import socket
 import itertools
 import sqlite3
@@ -37,6 +43,7 @@ import urllib.parse  # for url encoding for "caching" the json
 import json
 import logging
 import contextlib  # for "caching" the json
+import io
 import os
 
 
@@ -45,7 +52,7 @@ def load_json_from_url(url):
     Fetch JSON from URL and decode it
     """
     with download_with_fallback(url) as f:
-        return json.load(f)
+        return json.load(f, parse_float=Decimal)
 
 
 @contextlib.contextmanager
@@ -75,7 +82,7 @@ def download_with_fallback(url):
                 f"Failed to download from {url}. In addition, no cached version exists. Falling back to direct download…"
             )
             with urllib.request.urlopen(url) as f:
-                yield f
+                yield io.TextIOWrapper(f, encoding="utf-8")
 
 
 def load_categories_from_web(cfg) -> (list[Category], int):
@@ -95,9 +102,26 @@ def load_categories_from_web(cfg) -> (list[Category], int):
     ]
     root_category_id=0
     """
-    categories = []
     CATEGORIES_JSON_URL = cfg.get("backend", "categories_json")
-    categories_raw = load_json_from_url(CATEGORIES_JSON_URL)
+    return parse_categories(load_json_from_url(CATEGORIES_JSON_URL))
+
+
+def read_categories(f) -> (list[Category], int):
+    """
+    Read and parse the category JSON from a text file object, see load_categories_from_web
+
+    return: (categories, root_category_id)
+    """
+    return parse_categories(json.load(f, parse_float=Decimal))
+
+
+def parse_categories(categories_raw) -> (list[Category], int):
+    """
+    Parse the decoded category JSON, see load_categories_from_web
+
+    return: (categories, root_category_id)
+    """
+    categories = []
     # [{'id': 1, 'property_stock_location': False, 'name': 'Alle Produkte', 'parent_id': False}, ..., {'id': 118, 'property_stock_location': False, 'name': 'Lasermaterial', 'parent_id': [117, 'Alle Produkte / Laser']}]
     root_category_id = None
     for c in categories_raw:
@@ -153,26 +177,38 @@ def load_products_from_web(cfg):
     }
     """
     PRODUCTS_JSON_URL = cfg.get("backend", "products_json")
+    with download_with_fallback(PRODUCTS_JSON_URL) as f:
+        return read_products(f)
+
 
+def read_products(f) -> list[Product]:
+    """
+    Read and parse the product JSON from a text file object, see load_products_from_web
+
+    The JSON is streamed: each product is built right after its record was read,
+    the unused fields are dropped immediately.
+    Invalid products are logged and skipped.
+    """
+    errors = []
     products = []
-    products_raw = load_json_from_url(PRODUCTS_JSON_URL)
-    for p in products_raw.values():
-        price = Decimal(str(p["lst_price"]))
-        if price <= 0:
+    for r in iter_catalogue(f, errors):
+        if r.lst_price <= 0:
             # skip products with price 0 until we have a better UI (price labels show "please donate" if the price is 0, the GUI here doesn't support that)
             continue
         products.append(
             Product(
-                prod_id=int(p["code"].lstrip("0")),
-                name=p["name"],  # or _name_and_description if we have more space
-                price=price,
-                unit=p["_uom_str"],
-                location=p["_location_str"],
-                categ_id=p["categ_id"][0],
-                text_entry_required=("Kommentar" in p["name"]),
-                qty_rounding=Decimal(str(p["_uom_rounding"])),
+                prod_id=int(r.code),
+                name=r.name,  # or _name_and_description if we have more space
+                price=r.lst_price,
+                unit=r._uom_str,
+                location=r._location_str,
+                categ_id=r.categ_id,
+                text_entry_required=("Kommentar" in r.name),
+                qty_rounding=r._uom_rounding,
             )
         )
+    for error in errors:
+        logging.warning(f"Skipping invalid product {error.key}: {error.message}")
     return products
 
 
@@ -181,26 +217,38 @@ def remove_empty_categories(
 ) -> list[Category]:
     """
     take a list of Products and Categories. Recursively remove all categories that contain no products.
+
+    Root categories (without parent) are always kept.
     """
-    # iterate until nothing changes (simplified: just iterate enough times)
-    for i in range(99):
-        # keep a category if...
-        # it is the root category
-        keep_categories = [c.categ_id for c in categories if c.parent_id is None]
-        # or it contains another category
-        keep_categories += [c.parent_id for c in categories]
-        # or it contains a product
-        keep_categories += [p.categ_id for p in products]
-        categories = list([c for c in categories if c.categ_id in keep_categories])
-    return categories
+    product_counts = count_products_recursive(products, categories)
+    return [
+        c for c in categories if c.parent_id is None or product_counts[c.categ_id] > 0
+    ]
 
 
 class ShoppingBackend(AbstractOfflineShoppingBackend):
     def __init__(self, cfg):
         self._kasse = Kasse(cfg.get("general", "db_file"))
 
-        products = load_products_from_web(cfg)
-        (categories, root_category_id) = load_categories_from_web(cfg)
+        # start from the local copy of the catalogue, an update is downloaded in
+        # the background and used after the next restart
+        self._catalogue_cache = CatalogueCache(
+            os.path.join("out", "catalogue.json"),
+            categories_url=cfg.get("backend", "categories_json"),
+            products_url=cfg.get("backend", "products_json"),
+            read_categories=read_categories,
+            read_products=read_products,
+        )
+        try:
+            (categories, root_category_id, products) = self._catalogue_cache.get()
+        except Exception as exc:
+            # no cache yet and the download failed: try the raw downloads of older versions
+            logging.error(
+                "Failed to download the catalogue, trying the old download cache.",
+                exc_info=exc,
+            )
+            products = load_products_from_web(cfg)
+            (categories, root_category_id) = load_categories_from_web(cfg)
         categories = remove_empty_categories(products, categories)
 
         assert (
@@ -221,7 +269,8 @@ class ShoppingBackend(AbstractOfflineShoppingBackend):
 
     def list_clients(self):
         clients = {}
-        for k in self._kasse.kunden:
+        # single query, balances are cached in the table kunde
+        for k in self._kasse.iter_kunden():
             debt_limit = k.schuldengrenze
             if debt_limit < 0:
                 debt_limit = Decimal("Infinity")
@@ -264,13 +313,16 @@ class ShoppingBackend(AbstractOfflineShoppingBackend):
             raise Exception("unsupported payment method")
         rechnung = self._rechnung_from_order_lines()
         assert rechnung.summe == method.amount_paid - method.amount_returned
-        rechnung.store(self._kasse.cur)
+        # invoice and bookings are stored atomically, with a single commit
+        with self._kasse.transaction() as cur:
+            rechnung.store(cur)
+            b1 = Buchung(str(destination), rechnung.summe, rechnung=rechnung.id)
+            b2 = Buchung(
+                str(origin), -rechnung.summe, rechnung=rechnung.id, datum=b1.datum
+            )
+            self._kasse.buchen([b1, b2])
         logging.info("stored payment in Rechnung#{0}".format(rechnung.id))
 
-        b1 = Buchung(str(destination), rechnung.summe, rechnung=rechnung.id)
-        b2 = Buchung(str(origin), -rechnung.summe, rechnung=rechnung.id, datum=b1.datum)
-        self._kasse.buchen([b1, b2])  # implies database commit
-
         self._get_current_order_obj().rechnung_for_receipt = rechnung
 
     def _rechnung_from_order_lines(self):
@@ -320,11 +372,12 @@ class ShoppingBackend(AbstractOfflineShoppingBackend):
         raise NotImplementedError()
 
     def _store_client_payment(self, client):
-        kunde = Kunde.load_from_id(client.client_id, self._kasse.cur)
+        kunde = Kunde.load_from_id(
+            client.client_id, self._kasse.cur, load_buchungen=False
+        )
         rechnung = self._rechnung_from_order_lines()
-        rechnung.store(self._kasse.cur)
+        with self._kasse.transaction() as cur:
+            rechnung.store(cur)
+            kunde.add_buchung(-rechnung.summe, rechnung=rechnung.id)
+            kunde.store(cur)
         logging.info("stored client payment in Rechnung#{0}".format(rechnung.id))
-
-        kunde.add_buchung(-rechnung.summe, rechnung=rechnung.id)
-        kunde.store(self._kasse.cur)
-        self._kasse.con.commit()
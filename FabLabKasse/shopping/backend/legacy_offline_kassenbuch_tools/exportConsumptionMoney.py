@@ -28,6 +28,7 @@
 
 from __future__ import print_function
 import sys
+import collections
 
 import FabLabKasse.kassenbuch as kassenbuch
 import re
@@ -35,7 +36,11 @@ import datetime
 
 
 def aggregate_consumption(rechnungen):
-    """Returns consumption from given rechnungen"""
+    """Returns consumption from given rechnungen
+
+    rechnungen may be any iterable of Rechnung objects, it is only traversed once.
+    For large databases pass the generator ``Kasse.iter_rechnungen()`` instead of a list.
+    """
     consumption = {}
     consumptionUnits = {}
     name = {}
@@ -165,6 +170,20 @@ def printFiltered(
     print("")
 
 
+def iterRechnungen(kasse, dateFrom=None, dateTo=None):
+    """stream the invoices with ``dateFrom < datum < dateTo`` from the database
+
+    Both limits are exclusive. If they are None, all invoices are returned.
+    """
+    zeitraum = {}
+    if dateFrom is not None:
+        zeitraum = {"from_date": dateFrom, "until_date": dateTo}
+    for r in kasse.iter_rechnungen(**zeitraum):
+        # iter_rechnungen includes from_date
+        if dateFrom is None or dateFrom < r.datum:
+            yield r
+
+
 if __name__ == "__main__":
     print(
         "warning: this script operates on snapshotOhnePins.sqlite3 and not on the fresh database!"
@@ -174,73 +193,60 @@ if __name__ == "__main__":
         print("This script must be run with UTF8 IO encoding")
         sys.exit(1)
 
-    rechnungen = k.get_rechnungen()
-    dateFrom = datetime.datetime.min
-    dateTo = datetime.datetime.max
+    dateFrom = None
+    dateTo = None
     if len(sys.argv) == 3:
         dateFrom = datetime.datetime.strptime(sys.argv[1], "%Y-%m-%d")
         dateTo = datetime.datetime.strptime(sys.argv[2], "%Y-%m-%d")
         print("filtering from {0} to {1}".format(dateFrom, dateTo))
-        rechnungen = filter(lambda r: dateFrom < r.datum < dateTo, rechnungen)
 
-    dauer = rechnungen[-1].datum - rechnungen[0].datum
+    # how often each invoice is referenced by a client transaction
+    kundenrechnungen = collections.Counter()
+    for (rechnung,) in k.select("kundenbuchung", "rechnung"):
+        if rechnung is not None:
+            kundenrechnungen[rechnung] += 1
+
+    # a single pass over the invoices collects everything needed for the integrity check,
+    # only the sum of each invoice is kept
+    rechnungsSummen = {}
+    ersteRechnung = None
+    letzteRechnung = None
+    summeKunden = 0
+    summeOhneKunden = 0
+    for r in iterRechnungen(k, dateFrom, dateTo):
+        rechnungsSummen[r.id] = r.summe
+        if ersteRechnung is None or r.datum < ersteRechnung:
+            ersteRechnung = r.datum
+        if letzteRechnung is None or r.datum > letzteRechnung:
+            letzteRechnung = r.datum
+        if r.id in kundenrechnungen:
+            summeKunden += r.summe * kundenrechnungen[r.id]
+        else:
+            summeOhneKunden += r.summe
+
+    dauer = letzteRechnung - ersteRechnung
     hochrechnenFaktor = round(365.0 / dauer.days, 2)
     print(
         "Auswertung von {0} bis {1}, {2} Tage, Faktor für 1 Jahr: *{3}".format(
-            rechnungen[0].datum, rechnungen[-1].datum, dauer.days, hochrechnenFaktor
+            ersteRechnung, letzteRechnung, dauer.days, hochrechnenFaktor
         )
     )
-    tageSeitLetzterRechnung = (datetime.datetime.now() - rechnungen[-1].datum).days
+    tageSeitLetzterRechnung = (datetime.datetime.now() - letzteRechnung).days
     print("{0} Tage seit letzter Rechnung".format(tageSeitLetzterRechnung))
     if tageSeitLetzterRechnung > 5:
         print(
             "ACHTUNG: Datenbank ist alt! Bitte neuen Snapshot erstellen (letzte Rechnung aelter als 5 Tage)."
         )
 
-    kunden = k.kunden
-
     print("--- start of integrity check ---")
-    summeAlles = 0
-    kundenrechnungen = []
-    for kunde in kunden:
-        summe = 0
-        for b in kunde.buchungen:
-            if b.rechnung != None:
-                kundenrechnungen.append(b.rechnung)
-            for r in rechnungen:
-                if r.id != b.rechnung:
-                    continue
-                for p in r.positionen:
-                    summe += p["anzahl"] * p["einzelpreis"]
-        # print "{}: {}".format(kunde.name, summe)
-        summeAlles += summe
-    print(summeAlles)
-
-    summe = 0
-    for r in rechnungen:
-        if r.id in kundenrechnungen:
-            continue
-        for p in r.positionen:
-            summe += p["anzahl"] * p["einzelpreis"]
-            # print summe,  p['anzahl']*p['einzelpreis']
-    print(summe)
-
-    rechnungen = k.get_rechnungen()
-    import copy
-
-    alleRechnungen = copy.deepcopy(k.get_rechnungen())
-    if len(sys.argv) == 3:
-        dateFrom = datetime.datetime.strptime(sys.argv[1], "%Y-%m-%d")
-        dateTo = datetime.datetime.strptime(sys.argv[2], "%Y-%m-%d")
-        print("filtering from {0} to {1}".format(dateFrom, dateTo))
-        rechnungen = filter(lambda r: dateFrom < r.datum < dateTo, rechnungen)
+    print(summeKunden)
+    print(summeOhneKunden)
 
     summeBuchungen = 0
-    buchungen = k.get_buchungen()
     habenBuchung = False  # alternate between positive and negative entries
     buchungsRechnungen = set()
-    for b in buchungen:
-        if not dateFrom < b.datum < dateTo:
+    for b in k.iter_buchungen(dateFrom, dateTo):
+        if dateFrom is not None and not dateFrom < b.datum:
             continue
         if b.konto == "Besucher":
             summeBuchungen += b.betrag
@@ -249,43 +255,41 @@ if __name__ == "__main__":
                 print("Warning: Buchung ohne Rechnung wird nicht berücksichtigt", b)
             continue
         buchungsRechnungen.add(b.rechnung)
-        foundRechnung = False
-        for r in alleRechnungen:
-            if r.id == b.rechnung:
-                foundRechnung = True
-                habenBuchung = not habenBuchung
-                if habenBuchung:
-                    assert r.summe == b.betrag
-                else:
-                    assert r.summe == -b.betrag
-                # print r.datum, b.datum
-                # print rechnungssumme,  b.betrag
-                break
-        assert foundRechnung, "cannot find rechnung {0}".format(b.rechnung)
-    rechnungsIds = set(map(lambda r: r.id, rechnungen))
-    assert buchungsRechnungen.difference(rechnungsIds) == set()
+        if b.rechnung in rechnungsSummen:
+            rechnungssumme = rechnungsSummen[b.rechnung]
+        else:
+            # invoice outside of the time range, reported by the assertion below
+            try:
+                rechnungssumme = kassenbuch.Rechnung.load_from_id(
+                    b.rechnung, k.cur
+                ).summe
+            except kassenbuch.NoDataFound:
+                raise AssertionError("cannot find rechnung {0}".format(b.rechnung))
+        habenBuchung = not habenBuchung
+        if habenBuchung:
+            assert rechnungssumme == b.betrag
+        else:
+            assert rechnungssumme == -b.betrag
+    assert buchungsRechnungen.difference(rechnungsSummen.keys()) == set()
     print("Buchungen:", summeBuchungen)
-    print("alle Rechnungen:", sum(map(lambda r: r.summe, rechnungen)))
+    print("alle Rechnungen:", sum(rechnungsSummen.values()))
 
     print("--- end of integrity check ---")
 
-    # FabLab-Eigenverbrauch herausfiltern
-    fablabId = None
-    for kunde in kunden:
-        if kunde.name == "fablab":
-            fablabKunde = kunde
-            break
-
-    fablabRechnungen = []
-    for b in fablabKunde.buchungen:
-        if b.rechnung != None:
-            fablabRechnungen.append(b.rechnung)
-
-    rechnungenOhneFablab = filter(lambda r: r.id not in fablabRechnungen, rechnungen)
-    rechnungenFablab = filter(lambda r: r.id in fablabRechnungen, rechnungen)
+    # FabLab-Eigenverbrauch herausfiltern, anhand der Rechnungs-IDs der Kundenbuchungen
+    fablabKunde = kassenbuch.Kunde.load_from_name("fablab", k.cur, load_buchungen=False)
+    fablabRechnungen = set()
+    for (rechnung,) in k.select("kundenbuchung", "rechnung", kunde=fablabKunde.id):
+        if rechnung is not None:
+            fablabRechnungen.add(rechnung)
 
-    consumption = aggregate_consumption(rechnungenOhneFablab)
-    consumptionFablab = aggregate_consumption(rechnungenFablab)
+    # the invoices are streamed from the database, once for each part
+    consumption = aggregate_consumption(
+        r for r in iterRechnungen(k, dateFrom, dateTo) if r.id not in fablabRechnungen
+    )
+    consumptionFablab = aggregate_consumption(
+        r for r in iterRechnungen(k, dateFrom, dateTo) if r.id in fablabRechnungen
+    )
 
     print("Eigenverbrauch:")
     printFiltered(consumptionFablab, "", scaleFactor=hochrechnenFaktor)
@@ -328,7 +332,7 @@ if __name__ == "__main__":
     printFiltered(
         consumption,
         "Fräs",
-        scaleFactor=365.0 / (rechnungen[-1].datum - fraesenstart).days,
+        scaleFactor=365.0 / (letzteRechnung - fraesenstart).days,
     )
     printFiltered(consumption, "Dreh", scaleFactor=hochrechnenFaktor)
     printFiltered(consumption, "Alu", scaleFactor=hochrechnenFaktor)
@@ -336,9 +340,9 @@ if __name__ == "__main__":
     print("Fräsenflat aus freier Preiseingabe:")
     summeFraesenflat = 0
 
-    def printFilteredFreiePreiseingabe(rechnungen, searchwords):
+    def printFilteredFreiePreiseingabe(searchwords):
         summe = 0
-        for r in rechnungen:
+        for r in iterRechnungen(k, dateFrom, dateTo):
             for p in r.positionen:
                 if p["produkt_ref"] != "9997":
                     continue
@@ -353,13 +357,11 @@ if __name__ == "__main__":
             "{0}:  {1} , hochgerechnet {2} ".format(
                 searchwords,
                 summe,
-                summe * 365.0 / (rechnungen[-1].datum - rechnungen[0].datum).days,
+                summe * 365.0 / dauer.days,
             )
         )
 
-    printFilteredFreiePreiseingabe(rechnungen, ["flat"])
-    printFilteredFreiePreiseingabe(
-        rechnungen, ["reichelt", "bestell", "PO", "MEW", "MW"]
-    )
+    printFilteredFreiePreiseingabe(["flat"])
+    printFilteredFreiePreiseingabe(["reichelt", "bestell", "PO", "MEW", "MW"])
 
     printFiltered(consumption, "freie preiseingabe", scaleFactor=hochrechnenFaktor)
@@ -15,16 +15,26 @@ from .abstract import (
     ProductNotFound,
     PrinterError,
 )
+from collections import defaultdict
 from decimal import Decimal
 from ... import scriptHelper
-from natsort import natsorted
+from natsort import natsort_keygen
+import argparse
+import heapq
+import itertools
+import json
 import re
+import sys
+import time
 
 
 class ProductBasedOrderLine(OrderLine):
 
     """OrderLine that references a Product"""
 
+    # the qty slot of OrderLine is replaced by the qty property, stored in _qty
+    __slots__ = ["product", "_qty"]
+
     def __init__(self, product, qty, comment=None):
         """create order line automatically just from Product instance and quantity
         The product can later be accessed by this.product
@@ -75,10 +85,323 @@ class ProductBasedOrderLine(OrderLine):
         self.qty = qty.normalize()  # use normalize() to strip trailing ,0000
 
 
+class SearchIndex(object):
+
+    """
+    n-gram index for finding all entries whose text contains all given keywords
+
+    For each substring of ``n`` characters (n-gram), the keys of the entries containing
+    it are stored as a sorted tuple. A keyword of at least ``n`` characters only checks
+    the entries with its rarest n-gram. Shorter keywords are searched in the texts,
+    but only in those of the entries that match the longer keywords of the search.
+    The cost of a search therefore mostly depends on the number of matches, not on
+    the number of entries.
+    """
+
+    def __init__(self, n=3):
+        self.n = n
+        self._texts = {}
+        # n-gram -> sorted tuple of keys
+        self._ngrams = {}
+        # n-gram -> keys added since the last build()
+        self._added = defaultdict(list)
+
+    def add(self, key, text):
+        """add an entry with an already simplified text"""
+        assert key not in self._texts, "entry already exists"
+        self._texts[key] = text
+        n = self.n
+        added = self._added
+        for ngram in {text[i : i + n] for i in range(len(text) - n + 1)}:
+            added[ngram].append(key)
+
+    def build(self):
+        """
+        merge the entries added since the last call into the index
+
+        This is done automatically before each search, call it after adding many
+        entries to have the first search as fast as the following ones.
+        """
+        for (ngram, keys) in self._added.items():
+            self._ngrams[ngram] = tuple(
+                sorted(self._ngrams.get(ngram, ()) + tuple(keys))
+            )
+        self._added.clear()
+
+    def _keys_containing(self, keyword, candidates=None):
+        """
+        :param candidates: only search these keys, None for all
+        :type candidates: collections.abc.Collection | None
+        :return: keys of the entries whose text contains the (non-empty) keyword
+        :rtype: set
+        """
+        texts = self._texts
+        if len(keyword) >= self.n:
+            n = self.n
+            rarest = min(
+                (
+                    self._ngrams.get(keyword[i : i + n], ())
+                    for i in range(len(keyword) - n + 1)
+                ),
+                key=len,
+            )
+            if candidates is None or len(rarest) < len(candidates):
+                return set(
+                    key
+                    for key in rarest
+                    if keyword in texts[key]
+                    and (candidates is None or key in candidates)
+                )
+        if candidates is None:
+            candidates = texts
+        return set(key for key in candidates if keyword in texts[key])
+
+    def search(self, keywords):
+        """
+        :param keywords: list of simplified keywords, empty keywords are ignored
+        :return: keys of all entries whose text contains every keyword
+        :rtype: set
+        """
+        self.build()
+        result = None
+        # long keywords first, they usually have the fewest matches
+        for keyword in sorted(set(keywords), key=len, reverse=True):
+            if keyword == "":
+                continue
+            result = self._keys_containing(keyword, result)
+            if not result:
+                break
+        if result is None:
+            return set(self._texts)
+        return result
+
+
+def edit_distance(a, b, limit):
+    """
+    Levenshtein distance of two strings, bounded by ``limit``
+
+    The calculation stops early once the distance is known to exceed the limit.
+
+    :param limit: maximum distance of interest
+    :type limit: int
+    :return: the distance, or ``limit + 1`` if it is larger than ``limit``
+    :rtype: int
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(
+                min(
+                    previous[j] + 1,
+                    current[j - 1] + 1,
+                    previous[j - 1] + (char_a != char_b),
+                )
+            )
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+
+class RankedSearchIndex(SearchIndex):
+
+    """
+    SearchIndex that can also rank its matches and tolerate typos
+
+    Every keyword of the search contributes a score to an entry:
+
+    - 3 if it matches a whole word, 2 if it matches the start of a word,
+      1 if it is only contained somewhere inside a word,
+    - 1 extra point if the text starts with the keyword,
+    - 0.5 if the keyword is not contained in the text, but a word of the text
+      (or the start of a word) is at most one typo away, two typos for keywords
+      of 8 or more characters. Keywords shorter than 4 characters must match exactly.
+
+    Only entries that match every keyword are returned.
+    """
+
+    # score of a keyword that only matches with typos
+    TYPO_SCORE = 0.5
+
+    def __init__(self, n=3):
+        SearchIndex.__init__(self, n)
+        # word -> sorted tuple of the keys of the entries containing this word
+        self._vocabulary = {}
+        # word -> keys added since the last build()
+        self._added_words = defaultdict(list)
+        # keyword -> keys found by _keys_with_typos(), reset on add()
+        self._typo_cache = {}
+
+    def add(self, key, text):
+        SearchIndex.add(self, key, text)
+        for word in set(re.findall(r"\w+", text)):
+            self._added_words[word].append(key)
+        self._typo_cache.clear()
+
+    def build(self):
+        SearchIndex.build(self)
+        for (word, keys) in self._added_words.items():
+            self._vocabulary[word] = tuple(
+                sorted(self._vocabulary.get(word, ()) + tuple(keys))
+            )
+        self._added_words.clear()
+
+    @staticmethod
+    def _max_typos(keyword):
+        if len(keyword) < 4:
+            return 0
+        if len(keyword) < 8:
+            return 1
+        return 2
+
+    def _score(self, keyword, text):
+        """score of a keyword that is contained in the text"""
+        score = 1
+        start = text.find(keyword)
+        while start >= 0 and score < 3:
+            end = start + len(keyword)
+            if start == 0 or not text[start - 1].isalnum():
+                if end == len(text) or not text[end].isalnum():
+                    score = 3
+                else:
+                    score = max(score, 2)
+            start = text.find(keyword, start + 1)
+        if text.startswith(keyword):
+            score += 1
+        return score
+
+    def _keys_with_typos(self, keyword, deadline):
+        """
+        keys of the entries with a word that is within _max_typos() of the keyword
+
+        :param deadline: value of time.monotonic() after which the search is aborted
+        :return: (keys, True if the search was complete)
+        :rtype: (set, bool)
+        """
+        if keyword in self._typo_cache:
+            return self._typo_cache[keyword], True
+        limit = self._max_typos(keyword)
+        # with at most ``limit`` typos, one of ``limit + 1`` pieces of the keyword is intact
+        step = len(keyword) // (limit + 1)
+        pieces = [keyword[i * step : (i + 1) * step] for i in range(limit)]
+        pieces.append(keyword[limit * step :])
+        keys = set()
+        for i, (word, word_keys) in enumerate(self._vocabulary.items()):
+            if i % 64 == 0 and time.monotonic() > deadline:
+                return keys, False
+            if len(word) + limit < len(keyword):
+                continue
+            if not any(piece in word for piece in pieces):
+                continue
+            # the customer may still be typing: also compare with the start of the word
+            if (
+                edit_distance(keyword, word, limit) <= limit
+                or edit_distance(keyword, word[: len(keyword)], limit) <= limit
+            ):
+                keys.update(word_keys)
+        self._typo_cache[keyword] = keys
+        return keys, True
+
+    def rank(self, keywords, limit=None, time_budget=None, tiebreak_key=None):
+        """
+        search entries that match every keyword, best matches first
+
+        :param keywords: list of simplified keywords, empty keywords are ignored
+        :param limit: maximum number of results, None for all
+        :param time_budget: maximum time in seconds for the typo-tolerant part of the search.
+            Exact matches are always found; when the budget is exhausted, some matches with
+            typos may be missing. None for no limit.
+        :param tiebreak_key: function key -> sort key to order entries with the same score
+        :return: keys of the matching entries
+        :rtype: list
+        """
+        self.build()
+        deadline = float("inf")
+        if time_budget is not None:
+            deadline = time.monotonic() + time_budget
+        scores = None
+        # long keywords first, they usually have the fewest matches
+        for keyword in sorted(set(keywords), key=len, reverse=True):
+            if keyword == "":
+                continue
+            keyword_scores = {}
+            if self._max_typos(keyword) > 0:
+                typo_keys, _ = self._keys_with_typos(keyword, deadline)
+                if scores is not None:
+                    typo_keys = typo_keys & scores.keys()
+                keyword_scores = dict.fromkeys(typo_keys, self.TYPO_SCORE)
+            for key in self._keys_containing(keyword, scores):
+                keyword_scores[key] = self._score(keyword, self._texts[key])
+            if scores is None:
+                scores = keyword_scores
+            else:
+                scores = {
+                    key: scores[key] + score for key, score in keyword_scores.items()
+                }
+            if not scores:
+                return []
+        if scores is None:
+            scores = dict.fromkeys(self._texts, 0)
+        if tiebreak_key is None:
+            tiebreak_key = lambda key: key
+        sort_key = lambda key: (-scores[key], tiebreak_key(key))
+        if limit is None:
+            return sorted(scores, key=sort_key)
+        return heapq.nsmallest(limit, scores, key=sort_key)
+
+
+def count_products_recursive(products, categories):
+    """
+    count the products in each category, including all its subcategories
+
+    Runs in linear time: the categories are visited once from the top, then
+    the counts are summed up from the bottom.
+
+    :param products: list of Product
+    :param categories: list of Category
+    :return: ``{categ_id: number of products}`` for every category
+    :rtype: dict
+    """
+    counts = {c.categ_id: 0 for c in categories}
+    for product in products:
+        if product.categ_id in counts:
+            counts[product.categ_id] += 1
+    parents = {}
+    children = defaultdict(list)
+    for c in categories:
+        parents[c.categ_id] = c.parent_id
+        children[c.parent_id].append(c.categ_id)
+
+    # start at the root categories (and at categories with a missing parent)
+    stack = [c.categ_id for c in categories if c.parent_id not in counts]
+    top_down = []
+    visited = set()
+    while stack:
+        categ_id = stack.pop()
+        if categ_id in visited:
+            continue
+        visited.add(categ_id)
+        top_down.append(categ_id)
+        stack.extend(children[categ_id])
+    # every category comes after its parent in top_down
+    for categ_id in reversed(top_down):
+        if parents[categ_id] in counts:
+            counts[parents[categ_id]] += counts[categ_id]
+    return counts
+
+
 class OfflineCategoryTree(object):
 
     """local storage for a tree of categories and products"""
 
+    # default maximum number of results of rank_products()
+    SEARCH_RESULT_LIMIT = 100
+    # default time budget for the typo-tolerant part of rank_products(), in seconds
+    SEARCH_TIME_BUDGET = 0.05
+
     def __init__(
         self,
         root_category_id,
@@ -93,6 +416,22 @@ class OfflineCategoryTree(object):
         self.root_category_id = root_category_id
         self.categories = {}
         self.products = {}
+        # parent id -> list of subcategories, category id -> list of products (unsorted)
+        self.children_by_parent = defaultdict(list)
+        self.products_by_category = defaultdict(list)
+        # search indexes of the simplified names, built once at startup
+        self._category_index = SearchIndex()
+        self._product_index = RankedSearchIndex()
+        # natural sort keys of the simplified names by id, calculated when first needed
+        self._category_sort_keys = {}
+        self._product_sort_keys = {}
+        # sorted results of get_subcategories() and get_products(), by category id
+        self._sorted_subcategories = {}
+        self._sorted_products = {}
+        # category id -> tuple of categories from below the root down to the category
+        self._category_paths = {}
+        # result of count_products_recursive(), None if not yet calculated
+        self._product_counts = None
         if generate_root_category:
             categories += [
                 Category(categ_id=root_category_id, name="root", parent_id=None)
@@ -102,6 +441,8 @@ class OfflineCategoryTree(object):
             self.add_category(i)
         for i in products:
             self.add_product(i)
+        self._category_index.build()
+        self._product_index.build()
 
         assert self.root_category_id in self.categories, "missing root category"
         cfg = scriptHelper.getConfig()
@@ -120,19 +461,32 @@ class OfflineCategoryTree(object):
             categ_id, repr(category.name), repr(self.categories[categ_id].name)
         )
         self.categories[categ_id] = category
+        self.children_by_parent[category.parent_id].append(category)
+        name = OfflineCategoryTree.simplify_searchstring(category.name)
+        self._category_index.add(categ_id, name)
+        self._sorted_subcategories.pop(category.parent_id, None)
+        self._category_paths.clear()
+        self._product_counts = None
 
     def add_product(self, product):
         prod_id = product.prod_id
         assert prod_id not in self.products, "Product already exists"
         self.products[prod_id] = product
+        self.products_by_category[product.categ_id].append(product)
+        name = OfflineCategoryTree.simplify_searchstring(product.name)
+        self._product_index.add(prod_id, name)
+        self._sorted_products.pop(product.categ_id, None)
+        self._product_counts = None
 
     def get_root_category(self):
         return self.categories[self.root_category_id]
 
     def get_subcategories(self, categ_id):
-        return self._sort_categories(
-            filter(lambda categ: categ.parent_id == categ_id, self.categories.values())
-        )
+        if categ_id not in self._sorted_subcategories:
+            self._sorted_subcategories[categ_id] = self._sort_categories(
+                self.children_by_parent.get(categ_id, [])
+            )
+        return list(self._sorted_subcategories[categ_id])
 
     @staticmethod
     def simplify_searchstring(string):
@@ -143,50 +497,92 @@ class OfflineCategoryTree(object):
         string = string.replace("\u2010", "-")  # unicode dash
         return string.lower().strip()
 
+    # natural sort order ("2mm" < "10mm") of simplified names
+    _natsort_key = staticmethod(natsort_keygen())
+
+    def _product_sort_key(self, prod_id):
+        try:
+            return self._product_sort_keys[prod_id]
+        except KeyError:
+            name = OfflineCategoryTree.simplify_searchstring(
+                self.products[prod_id].name
+            )
+            key = self._product_sort_keys[prod_id] = self._natsort_key(name)
+            return key
+
+    def _category_sort_key(self, categ_id):
+        try:
+            return self._category_sort_keys[categ_id]
+        except KeyError:
+            name = OfflineCategoryTree.simplify_searchstring(
+                self.categories[categ_id].name
+            )
+            key = self._category_sort_keys[categ_id] = self._natsort_key(name)
+            return key
+
     def _sort_products(self, product_list):
-        return natsorted(
-            product_list,
-            key=lambda prod: OfflineCategoryTree.simplify_searchstring(prod.name),
+        return sorted(
+            product_list, key=lambda prod: self._product_sort_key(prod.prod_id)
         )
 
     def _sort_categories(self, categ_list):
-        return natsorted(
-            categ_list,
-            key=lambda cat: OfflineCategoryTree.simplify_searchstring(cat.name),
-        )
+        return sorted(categ_list, key=lambda cat: self._category_sort_key(cat.categ_id))
 
     def get_products(self, categ_id):
-        return self._sort_products(
-            filter(lambda prod: prod.categ_id == categ_id, self.products.values())
-        )
+        if categ_id not in self._sorted_products:
+            self._sorted_products[categ_id] = self._sort_products(
+                self.products_by_category.get(categ_id, [])
+            )
+        return list(self._sorted_products[categ_id])
 
     def search_products(self, searchstr):
+        """products whose name contains every word of searchstr"""
         searchlist = OfflineCategoryTree.simplify_searchstring(searchstr).split(" ")
+        return self._sort_products(
+            self.products[prod_id] for prod_id in self._product_index.search(searchlist)
+        )
 
-        def matches(product):
-            for keyword in searchlist:
-                if keyword == "":
-                    continue
-                if not keyword in OfflineCategoryTree.simplify_searchstring(
-                    product.name
-                ):
-                    return False
-            return True
+    def rank_products(self, searchstr, limit=None, time_budget=None):
+        """
+        products that match every word of searchstr, best matches first
 
-        return self._sort_products(filter(matches, self.products.values()))
+        See RankedSearchIndex for the scoring. Products with the same score are
+        in natural sort order.
 
-    def search_categories(self, searchstr):
+        :param limit: maximum number of results, default: SEARCH_RESULT_LIMIT
+        :param time_budget: time budget in seconds for matches with typos,
+            default: SEARCH_TIME_BUDGET
+        :rtype: list of Product
+        """
+        if limit is None:
+            limit = self.SEARCH_RESULT_LIMIT
+        if time_budget is None:
+            time_budget = self.SEARCH_TIME_BUDGET
         searchlist = OfflineCategoryTree.simplify_searchstring(searchstr).split(" ")
+        prod_ids = self._product_index.rank(
+            searchlist,
+            limit=limit,
+            time_budget=time_budget,
+            tiebreak_key=self._product_sort_key,
+        )
+        return [self.products[prod_id] for prod_id in prod_ids]
 
-        def matches(categ):
-            if categ == self.get_root_category():
-                return False
-            for keyword in searchlist:
-                if not keyword in OfflineCategoryTree.simplify_searchstring(categ.name):
-                    return False
-            return True
+    def search_categories(self, searchstr):
+        """categories (except the root) whose name contains every word of searchstr"""
+        searchlist = OfflineCategoryTree.simplify_searchstring(searchstr).split(" ")
+        return self._sort_categories(
+            self.categories[categ_id]
+            for categ_id in self._category_index.search(searchlist)
+            if categ_id != self.root_category_id
+        )
 
-        return self._sort_categories(filter(matches, self.categories.values()))
+    def get_product_count(self, categ_id):
+        """number of products in the category, including all its subcategories"""
+        if self._product_counts is None:
+            self._product_counts = count_products_recursive(
+                self.products.values(), self.categories.values()
+            )
+        return self._product_counts[categ_id]
 
     def get_product(self, prod_id):
         try:
@@ -195,18 +591,25 @@ class OfflineCategoryTree(object):
             raise ProductNotFound()
 
     def get_category_path(self, categ_id):
-        path = []
         assert categ_id in self.categories, "invalid category id {0}".format(categ_id)
-        while categ_id not in [None, self.root_category_id]:
-            try:
-                path.insert(0, self.categories[categ_id])
-            except KeyError:
-                raise Exception(
-                    "category references non-existing parent category {0}".format(
-                        categ_id
-                    )
-                )
-            categ_id = self.categories[categ_id].parent_id
+        return list(self._category_path(categ_id))
+
+    def _category_path(self, categ_id):
+        """memoised path from below the root category down to categ_id, as tuple"""
+        if categ_id in [None, self.root_category_id]:
+            return ()
+        try:
+            return self._category_paths[categ_id]
+        except KeyError:
+            pass
+        try:
+            category = self.categories[categ_id]
+        except KeyError:
+            raise Exception(
+                "category references non-existing parent category {0}".format(categ_id)
+            )
+        path = self._category_path(category.parent_id) + (category,)
+        self._category_paths[categ_id] = path
         return path
 
 
@@ -215,38 +618,52 @@ class Order(object):
     """simple shopping cart for use in ShoppingBackend"""
 
     def __init__(self):
-        self._lines = []
+        # order_line_id -> ProductBasedOrderLine, in the order the lines were added
+        self._lines = {}
+        # sum of price_subtotal of all lines, updated on every change
+        self._total = Decimal(0)
         self._finished = False
 
-    def _idx_from_id(self, order_line_id):
-        for i, line in enumerate(self._lines):
-            if line.order_line_id == order_line_id:
-                return i
-        raise KeyError("invalid order_line_id")
-
     def update_quantity(self, order_line_id, qty):
         assert not self._finished, "finished orders may not be modified"
         assert isinstance(qty, (Decimal, int))
-        order_line = self._lines[self._idx_from_id(order_line_id)]
+        order_line = self.get_order_line(order_line_id)
+        old_subtotal = order_line.price_subtotal
         order_line.set_quantity_rounded(qty)
+        self._total += order_line.price_subtotal - old_subtotal
 
     def get_order_lines(self):
-        return self._lines
+        return list(self._lines.values())
 
     def get_order_line(self, order_line_id):
-        return self._lines[self._idx_from_id(order_line_id)]
+        try:
+            return self._lines[order_line_id]
+        except KeyError:
+            raise KeyError("invalid order_line_id")
 
     def delete_order_line(self, order_line_id):
         assert not self._finished, "finished orders may not be modified"
-        del self._lines[self._idx_from_id(order_line_id)]
+        self._total -= self.get_order_line(order_line_id).price_subtotal
+        del self._lines[order_line_id]
 
     def add_order_line(self, product, qty, comment=None):
         """add a Product() object with specified quantity to the cart"""
         assert not self._finished, "finished orders may not be modified"
         assert comment is None or isinstance(comment, str)
-        self._lines.append(ProductBasedOrderLine(product, qty, comment))
+        line = ProductBasedOrderLine(product, qty, comment)
+        self._lines[line.order_line_id] = line
+        self._total += line.price_subtotal
         # call update_quantity so that qty_rounding is checked
-        self.update_quantity(self._lines[-1].order_line_id, qty)
+        self.update_quantity(line.order_line_id, qty)
+
+    @property
+    def total(self):
+        """sum of price_subtotal of all lines, not rounded"""
+        return self._total
+
+    def calculate_total(self):
+        """recalculate total from all lines, for checking the running total"""
+        return sum((line.price_subtotal for line in self._lines.values()), Decimal(0))
 
     def set_finished(self):
         self._finished = True
@@ -282,7 +699,9 @@ class AbstractOfflineShoppingBackend(AbstractShoppingBackend):
             products=products,
             generate_root_category=generate_root_category,
         )
-        self.orders = []
+        # order id -> Order. The ids are generated by create_order()
+        self.orders = {}
+        self._order_ids = itertools.count(1)
 
     # ==============================
     # categories
@@ -332,40 +751,43 @@ class AbstractOfflineShoppingBackend(AbstractShoppingBackend):
         except ProductNotFound:
             matching_product = []
 
-        # 2. search by string
+        # 2. search by string, best matches first
         return (
             self.tree.search_categories(searchstr),
-            matching_product + self.tree.search_products(searchstr),
+            matching_product
+            + [
+                product
+                for product in self.tree.rank_products(searchstr)
+                if product not in matching_product
+            ],
         )
 
     # ==============================
     # order handling
     # ==============================
 
-    # TODO order_id must be a nonchanging unique id...
-    # use some uniqueIdFactory singleton class?
-
     def get_orders(self):
         # return [(o.order_id, "todo title") for o in self.orders]
         raise NotImplementedError()
 
     def create_order(self):
-        new_order = Order()
-        self.orders.append(new_order)
-        return id(new_order)
+        order_id = next(self._order_ids)
+        self.orders[order_id] = Order()
+        return order_id
 
     def delete_current_order(self):
-        self.orders.remove(self._get_current_order_obj())
+        self._get_current_order_obj()
+        del self.orders[self._current_order]
         self.set_current_order(None)
 
     def set_current_order(self, order_id):
         self._current_order = order_id
 
     def _get_order_by_id(self, order_id):
-        for i in self.orders:
-            if id(i) == order_id:
-                return i
-        raise KeyError("invalid order_id")
+        try:
+            return self.orders[order_id]
+        except KeyError:
+            raise KeyError("invalid order_id")
 
     def _get_current_order_obj(self):
         try:
@@ -389,6 +811,27 @@ class AbstractOfflineShoppingBackend(AbstractShoppingBackend):
     def update_quantity(self, order_line_id, amount):
         self._get_current_order_obj().update_quantity(order_line_id, amount)
 
+    def get_current_total(self):
+        """
+        total of the current order, see AbstractShoppingBackend.get_current_total
+
+        Uses the running total of the Order. The rounding is the same as for
+        the full recalculation, because the total is only rounded at the end.
+        If ``verify_total`` is set, the running total is checked against the
+        recalculation.
+        """
+        if self.get_current_order() is None:
+            return self.round_money(0)
+        order = self._get_current_order_obj()
+        total = order.total
+        if self.verify_total:
+            assert (
+                total == order.calculate_total()
+            ), "running total {0} differs from sum of order lines {1}".format(
+                total, order.calculate_total()
+            )
+        return self.round_money(total)
+
     def product_requires_text_entry(self, prod_id):
         return self.tree.products[prod_id].text_entry_required
 
@@ -473,3 +916,57 @@ class Client(AbstractClient):
 
     def is_admin(self):
         return self._admin
+
+
+def main(argv=None):
+    """
+    command line interface for trying out the product search without the GUI
+
+    The product list is read from a JSON file in the format of the ``products_json``
+    URL (see legacy_offline_kassenbuch.load_products_from_web), for example
+    the cached download in the ``out/`` directory.
+    """
+    parser = argparse.ArgumentParser(
+        description="search products like the search field of the GUI"
+    )
+    parser.add_argument("products", help="JSON product list")
+    parser.add_argument("query", nargs="+", help="search words")
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=OfflineCategoryTree.SEARCH_RESULT_LIMIT,
+        help="maximum number of results",
+    )
+    parser.add_argument(
+        "--budget",
+        type=float,
+        default=OfflineCategoryTree.SEARCH_TIME_BUDGET * 1000,
+        help="time budget for matches with typos, in milliseconds",
+    )
+    args = parser.parse_args(argv)
+    with open(args.products, encoding="utf-8") as f:
+        products_raw = json.load(f)
+    index = RankedSearchIndex()
+    names = {}
+    for p in products_raw.values():
+        names[p["code"]] = p["name"]
+        index.add(p["code"], OfflineCategoryTree.simplify_searchstring(p["name"]))
+    searchlist = OfflineCategoryTree.simplify_searchstring(" ".join(args.query))
+    start = time.monotonic()
+    result = index.rank(
+        searchlist.split(" "),
+        limit=args.limit,
+        time_budget=args.budget / 1000,
+        tiebreak_key=lambda code: OfflineCategoryTree._natsort_key(names[code]),
+    )
+    duration = time.monotonic() - start
+    for code in result:
+        print("{0}\t{1}".format(code, names[code]))
+    print(
+        "{0} results in {1:.1f} ms".format(len(result), duration * 1000),
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# FabLabKasse, a Point-of-Sale Software for FabLabs and other public and trust-based workshops.
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program. If not,
+# see <http://www.gnu.org/licenses/>.
+
+"""unittests for catalogue_cache.py, with a local HTTP server as stand-in for the web server"""
+
+import http.server
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import urllib.error
+from decimal import Decimal
+
+from .abstract import Category, Product
+from .catalogue_cache import CatalogueCache, conditional_get
+
+
+class CatalogueHandler(http.server.BaseHTTPRequestHandler):
+
+    """serves ``server.files``: path -> (JSON data, ETag), answers conditional GET requests"""
+
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.path not in self.server.files:
+            self.send_error(404)
+            return
+        (data, etag) = self.server.files[self.path]
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def read_categories(f):
+    categories_raw = json.load(f)
+    return (
+        [
+            Category(categ_id=c["id"], name=c["name"], parent_id=c["parent"])
+            for c in categories_raw
+        ],
+        0,
+    )
+
+
+def read_products(f):
+    products_raw = json.load(f)
+    return [
+        Product(
+            prod_id=int(code),
+            name=name,
+            price=Decimal(price),
+            unit="Stück",
+            location="-",
+            categ_id=1,
+            qty_rounding=Decimal("0.5"),
+        )
+        for (code, (name, price)) in products_raw.items()
+    ]
+
+
+class CatalogueCacheTest(unittest.TestCase):
+
+    """test CatalogueCache"""
+
+    def setUp(self):
+        self.server = http.server.HTTPServer(("127.0.0.1", 0), CatalogueHandler)
+        self.server.requests = []
+        self.server.files = {
+            "/categories.json": (
+                [
+                    {"id": 0, "name": "Alle", "parent": None},
+                    {"id": 1, "name": "Laser", "parent": 0},
+                ],
+                '"c1"',
+            ),
+            "/products.json": ({"1": ["Plexiglas", "1.05"]}, '"p1"'),
+        }
+        self.server_thread = threading.Thread(target=self.server.serve_forever)
+        self.server_thread.start()
+        self.directory = tempfile.mkdtemp()
+        self.url = "http://127.0.0.1:{0}".format(self.server.server_port)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.server_thread.join()
+        shutil.rmtree(self.directory)
+
+    def make_cache(self, products_path="/products.json"):
+        return CatalogueCache(
+            os.path.join(self.directory, "out", "catalogue.json"),
+            self.url + "/categories.json",
+            self.url + products_path,
+            read_categories,
+            read_products,
+        )
+
+    def test_conditional_get(self):
+        (body, etag, _) = conditional_get(self.url + "/products.json")
+        self.assertEqual(json.loads(body.decode("utf-8")), {"1": ["Plexiglas", "1.05"]})
+        self.assertEqual(etag, '"p1"')
+        self.assertEqual(
+            conditional_get(self.url + "/products.json", etag), (None, etag, None)
+        )
+        with self.assertRaises(urllib.error.HTTPError):
+            conditional_get(self.url + "/missing.json")
+
+    def test_cache(self):
+        cache = self.make_cache()
+        self.assertIsNone(cache.load())
+        # first start: synchronous download
+        (categories, root_category_id, products) = cache.get()
+        self.assertEqual([c.name for c in categories], ["Alle", "Laser"])
+        self.assertEqual(root_category_id, 0)
+        self.assertEqual(products[0].price, Decimal("1.05"))
+        self.assertEqual(products[0].qty_rounding, Decimal("0.5"))
+        self.assertEqual(len(self.server.requests), 2)
+
+        # unchanged: revalidation only
+        self.assertFalse(cache.refresh())
+        self.assertEqual(len(self.server.requests), 4)
+
+        # changed products: used from the next start on
+        self.server.files["/products.json"] = (
+            {"1": ["Plexiglas", "1.10"], "2": ["Holz", "2"]},
+            '"p2"',
+        )
+        (_, _, products) = cache.get()
+        self.assertEqual(products[0].price, Decimal("1.05"))
+        cache._refresh_thread.join()
+        (_, _, products) = self.make_cache().load()
+        self.assertEqual([p.price for p in products], [Decimal("1.10"), Decimal("2")])
+
+        # network error: the cache stays usable
+        self.server.files = {}
+        with self.assertRaises(urllib.error.HTTPError):
+            cache.refresh()
+        self.assertEqual(len(cache.load()[2]), 2)
+        with self.assertLogs(level="WARNING"):
+            cache.refresh_in_background().join()
+        self.assertEqual(len(cache.load()[2]), 2)
+
+        # snapshots for other URLs or versions are ignored
+        self.assertIsNone(self.make_cache(products_path="/other.json").load())
+        cache.VERSION = CatalogueCache.VERSION + 1
+        self.assertIsNone(cache.load())
+
+
+if __name__ == "__main__":
+    unittest.main()
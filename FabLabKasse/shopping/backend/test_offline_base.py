@@ -0,0 +1,549 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# FabLabKasse, a Point-of-Sale Software for FabLabs and other public and trust-based workshops.
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program. If not,
+# see <http://www.gnu.org/licenses/>.
+
+"""unittests for offline_base.py"""
+
+import unittest
+from unittest import mock
+from configparser import ConfigParser
+from decimal import Decimal
+import io
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+
+from .abstract import Category, OrderLine, Product
+from .offline_base import (
+    AbstractOfflineShoppingBackend,
+    OfflineCategoryTree,
+    ProductBasedOrderLine,
+    RankedSearchIndex,
+    SearchIndex,
+    count_products_recursive,
+    edit_distance,
+    main,
+)
+
+
+def example_config():
+    cfg = ConfigParser()
+    cfg.read_dict(
+        {
+            "payup_methods": {
+                "overpayment_product_id": "9999",
+                "payout_impossible_product_id": "9994",
+            }
+        }
+    )
+    return cfg
+
+
+def example_catalogue():
+    categories = [
+        Category(categ_id=1, name="Laser", parent_id=0),
+        Category(categ_id=2, name="Plexiglas", parent_id=1),
+        Category(categ_id=3, name="Holz", parent_id=1),
+    ]
+    products = [
+        Product(1, "Plexiglas 3mm rot", Decimal(5), "Platte", "", categ_id=2),
+        Product(2, "Plexiglas 5mm﻿  Rot", Decimal(7), "Platte", "", categ_id=2),
+        Product(3, "Pappelsperrholz 3mm", Decimal(2), "Platte", "", categ_id=3),
+        Product(9999, "Überzahlung", Decimal(1), "Euro", "-"),
+        Product(9994, "nicht rückzahlbarer Rest", Decimal(1), "Euro", "-"),
+    ]
+    return (categories, products)
+
+
+def example_tree():
+    """small category tree with the products required by the config"""
+    (categories, products) = example_catalogue()
+    with mock.patch(
+        "FabLabKasse.scriptHelper.getConfig", return_value=example_config()
+    ):
+        return OfflineCategoryTree(
+            root_category_id=0, categories=categories, products=products
+        )
+
+
+class ExampleBackend(AbstractOfflineShoppingBackend):
+
+    """offline backend with the example catalogue, which does not store anything"""
+
+    def __init__(self):
+        cfg = example_config()
+        (categories, products) = example_catalogue()
+        with mock.patch("FabLabKasse.scriptHelper.getConfig", return_value=cfg):
+            AbstractOfflineShoppingBackend.__init__(
+                self, cfg, categories, products, generate_root_category=True
+            )
+
+    def _store_payment(self, method):
+        pass
+
+    def _store_client_payment(self, client):
+        pass
+
+    def list_clients(self):
+        return {}
+
+
+# benchmarks only run on request: FABLABKASSE_BENCHMARK=1 python3 -m unittest ...
+benchmark = unittest.skipUnless(
+    os.environ.get("FABLABKASSE_BENCHMARK"),
+    "benchmark, set FABLABKASSE_BENCHMARK=1 to run it",
+)
+
+
+class SearchIndexTest(unittest.TestCase):
+
+    """test the n-gram search index"""
+
+    def test_search(self):
+        index = SearchIndex(n=3)
+        index.add(1, "plexiglas 3mm")
+        index.add(2, "sperrholz 3mm")
+        index.add(3, "glas")
+        self.assertEqual(index.search(["3mm"]), {1, 2})
+        self.assertEqual(index.search(["glas", "3"]), {1})
+        self.assertEqual(index.search(["las"]), {1, 3})
+        # longer than n: n-grams match, but not the whole keyword
+        self.assertEqual(index.search(["glas3"]), set())
+        self.assertEqual(index.search(["rholz"]), {2})
+        self.assertEqual(index.search(["3mm", "xyz"]), set())
+        self.assertEqual(index.search([""]), {1, 2, 3})
+        # shorter than n: searched in the texts
+        self.assertEqual(index.search(["la"]), {1, 3})
+        self.assertEqual(index.search(["m", "glas"]), {1})
+        self.assertEqual(index.search(["ly"]), set())
+        # entries added after a search
+        index.add(4, "3mm")
+        self.assertEqual(index.search(["3mm"]), {1, 2, 4})
+        self.assertEqual(index._ngrams["3mm"], (1, 2, 4))
+
+
+class RankedSearchIndexTest(unittest.TestCase):
+
+    """test ranking and typo tolerance"""
+
+    def example_index(self):
+        index = RankedSearchIndex()
+        index.add(1, "senkkopfschraube m3x10")
+        index.add(2, "schraube m3x10")
+        index.add(3, "zylinderschraube m3x10 innensechskant")
+        index.add(4, "schraubendreher")
+        index.add(5, "mutter m3")
+        return index
+
+    def test_edit_distance(self):
+        self.assertEqual(edit_distance("schraube", "schraube", 2), 0)
+        self.assertEqual(edit_distance("schruabe", "schraube", 2), 2)
+        self.assertEqual(edit_distance("schraub", "schraube", 2), 1)
+        self.assertEqual(edit_distance("mutter", "schraube", 2), 3)
+        self.assertEqual(edit_distance("", "abcdef", 1), 2)
+
+    def test_rank(self):
+        index = self.example_index()
+        # whole word at the start > word prefix > whole word > inside a word
+        self.assertEqual(index.rank(["schraube"]), [2, 4, 1, 3])
+        self.assertEqual(index.rank(["schraube"], limit=2), [2, 4])
+        self.assertEqual(index.rank(["m3"]), [5, 1, 2, 3])
+        self.assertEqual(index.rank(["m3", "innen"]), [3])
+        self.assertEqual(
+            index.rank(["schraube"], tiebreak_key=lambda key: -key), [2, 4, 3, 1]
+        )
+        self.assertEqual(index.rank([""], limit=3), [1, 2, 3])
+        self.assertEqual(index.rank(["xyz"]), [])
+
+    def test_typos(self):
+        index = self.example_index()
+        # one typo for short keywords, two for long ones, none below 4 characters
+        self.assertEqual(index.rank(["muter"]), [5])
+        self.assertEqual(index.rank(["schruabe"]), [2, 4])
+        self.assertEqual(index.rank(["mutte", "m3"]), [5])
+        self.assertEqual(index.rank(["mu3"]), [])
+        # exact matches are ranked before typos
+        index.add(6, "muster")
+        self.assertEqual(index.rank(["muter"]), [5, 6])
+        self.assertEqual(index.rank(["must"]), [6, 5])
+        # exhausted time budget: only exact matches
+        index = self.example_index()
+        self.assertEqual(index.rank(["muter"], time_budget=-1), [])
+        self.assertEqual(index.rank(["mutter"], time_budget=-1), [5])
+
+
+class CountProductsTest(unittest.TestCase):
+
+    """test count_products_recursive"""
+
+    def test_count(self):
+        categories = [
+            Category(categ_id=3, name="c", parent_id=2),
+            Category(categ_id=2, name="b", parent_id=1),
+            Category(categ_id=1, name="a", parent_id=None),
+            Category(categ_id=4, name="empty", parent_id=1),
+            Category(categ_id=5, name="orphan", parent_id=42),
+        ]
+        products = [
+            Product(1, "x", Decimal(1), "", "", categ_id=3),
+            Product(2, "y", Decimal(1), "", "", categ_id=3),
+            Product(3, "z", Decimal(1), "", "", categ_id=2),
+            Product(4, "hidden", Decimal(1), "", "", categ_id=None),
+        ]
+        self.assertEqual(
+            count_products_recursive(products, categories),
+            {1: 3, 2: 3, 3: 2, 4: 0, 5: 0},
+        )
+
+
+class SlotsTest(unittest.TestCase):
+
+    """catalogue and cart objects have no per-instance __dict__, but the same attributes"""
+
+    def test_slots(self):
+        product = Product(1, "Schraube", Decimal("0.10"), "Stück", "Regal", 2)
+        category = Category(2, "Mechanik", parent_id=0)
+        line = OrderLine(None, 2, "Stück", "Schraube", Decimal("0.10"), Decimal("0.20"))
+        product_line = ProductBasedOrderLine(product, 3)
+        for obj in [product, category, line, product_line]:
+            self.assertFalse(hasattr(obj, "__dict__"))
+            with self.assertRaises(AttributeError):
+                obj.misspelled_attribute = 1
+        product.price = Decimal("0.20")
+        self.assertEqual((product.price, product.qty_rounding), (Decimal("0.20"), 0))
+        self.assertEqual(category.parent_id, 0)
+        line.qty = 3
+        self.assertEqual(line.qty, 3)
+        self.assertEqual(product_line.price_subtotal, Decimal("0.30"))
+        product_line.qty = 4
+        self.assertEqual(product_line.price_subtotal, Decimal("0.40"))
+
+
+def without_slots(cls):
+    """copy of a class (and its base classes) with a per-instance __dict__ instead of __slots__"""
+    if cls is object:
+        return object
+    slots = cls.__dict__.get("__slots__", [])
+    namespace = {
+        key: value
+        for (key, value) in cls.__dict__.items()
+        if key not in slots and key not in ["__slots__", "__dict__", "__weakref__"]
+    }
+    return type(
+        cls.__name__, tuple(without_slots(base) for base in cls.__bases__), namespace
+    )
+
+
+@benchmark
+class SlotsMemoryBenchmark(unittest.TestCase):
+
+    """memory per object of a large synthetic catalogue, with and without __slots__"""
+
+    count = 50000
+
+    def memory_per_object(self, create):
+        """
+        :param create: function (index) -> new object
+        :return: bytes allocated per object
+        """
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        objects = [create(i) for i in range(self.count)]
+        size = tracemalloc.get_traced_memory()[0] - before
+        tracemalloc.stop()
+        del objects
+        return size / self.count
+
+    def test_memory(self):
+        names = ["Produkt {0}".format(i) for i in range(self.count)]
+        price = Decimal("0.15")
+        product = Product(1, "Schraube", price, "Stück", "Regal", 2)
+        factories = [
+            (Category, lambda cls, i: cls(i, names[i], parent_id=0)),
+            (
+                Product,
+                lambda cls, i: cls(i, names[i], price, "Stück", "Regal", categ_id=2),
+            ),
+            (OrderLine, lambda cls, i: cls(i, 1, "Stück", names[i], price, price)),
+            (ProductBasedOrderLine, lambda cls, i: cls(product, 1)),
+        ]
+        print()
+        for (cls, create) in factories:
+            unslotted_cls = without_slots(cls)
+            before = self.memory_per_object(lambda i: create(unslotted_cls, i))
+            after = self.memory_per_object(lambda i: create(cls, i))
+            print(
+                "{0}: {1:.0f} bytes per object without __slots__, {2:.0f} with __slots__".format(
+                    cls.__name__, before, after
+                )
+            )
+            self.assertLess(after, before)
+
+
+class OfflineCategoryTreeTest(unittest.TestCase):
+
+    """test OfflineCategoryTree"""
+
+    def test_search(self):
+        tree = example_tree()
+        self.assertEqual([p.prod_id for p in tree.search_products("plexi ROT")], [1, 2])
+        self.assertEqual([p.prod_id for p in tree.search_products("5mm rot")], [2])
+        self.assertEqual([p.prod_id for p in tree.search_products("3MM")], [3, 1])
+        self.assertEqual(tree.search_products("holz plexi"), [])
+        self.assertEqual(len(tree.search_products(" ")), 5)
+        self.assertEqual([c.categ_id for c in tree.search_categories("la")], [1, 2])
+        # the root category is never found
+        self.assertEqual(len(tree.search_categories("")), 3)
+
+    def test_rank_products(self):
+        tree = example_tree()
+        self.assertEqual([p.prod_id for p in tree.rank_products("rot")], [1, 2])
+        self.assertEqual([p.prod_id for p in tree.rank_products("holz")], [3])
+        self.assertEqual([p.prod_id for p in tree.rank_products("plexglas")], [1, 2])
+        self.assertEqual(len(tree.rank_products("", limit=2)), 2)
+
+    def test_main(self):
+        products = {
+            "0001": {"code": "0001", "name": "Senkkopfschraube M3x10"},
+            "0002": {"code": "0002", "name": "Schraube M3x10"},
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            filename = os.path.join(directory, "products.json")
+            with open(filename, "w") as f:
+                json.dump(products, f)
+            with mock.patch("sys.stdout", new=io.StringIO()) as stdout, mock.patch(
+                "sys.stderr", new=io.StringIO()
+            ) as stderr:
+                main([filename, "SCHRAUBE", "m3x10"])
+        self.assertEqual(
+            stdout.getvalue(),
+            "0002\tSchraube M3x10\n0001\tSenkkopfschraube M3x10\n",
+        )
+        self.assertIn("2 results in", stderr.getvalue())
+
+    def test_sorted_children(self):
+        tree = example_tree()
+        self.assertEqual([c.categ_id for c in tree.get_subcategories(1)], [3, 2])
+        self.assertEqual([p.prod_id for p in tree.get_products(2)], [1, 2])
+        tree.add_product(Product(4, "Plexiglas 10mm", Decimal(9), "Platte", "", 2))
+        tree.add_category(Category(categ_id=4, name="Acryl", parent_id=1))
+        # natural sort order: 3mm < 5mm < 10mm
+        self.assertEqual([p.prod_id for p in tree.get_products(2)], [1, 2, 4])
+        self.assertEqual([c.categ_id for c in tree.get_subcategories(1)], [4, 3, 2])
+        tree.get_products(2).clear()
+        self.assertEqual(len(tree.get_products(2)), 3)
+
+    def test_category_path(self):
+        tree = example_tree()
+        self.assertEqual([c.categ_id for c in tree.get_category_path(2)], [1, 2])
+        self.assertEqual(tree.get_category_path(0), [])
+        self.assertEqual([c.categ_id for c in tree.children_by_parent[1]], [2, 3])
+        self.assertEqual(
+            [p.prod_id for p in tree.products_by_category[None]], [9999, 9994]
+        )
+        tree.add_category(Category(categ_id=5, name="orphan", parent_id=42))
+        with self.assertRaises(Exception):
+            tree.get_category_path(5)
+        tree.add_category(Category(categ_id=42, name="parent", parent_id=3))
+        self.assertEqual([c.categ_id for c in tree.get_category_path(5)], [1, 3, 42, 5])
+
+        self.assertEqual(tree.get_product_count(1), 3)
+        tree.add_product(Product(6, "Eiche", Decimal(9), "Platte", "", categ_id=42))
+        self.assertEqual(tree.get_product_count(1), 4)
+        self.assertEqual(tree.get_product_count(5), 0)
+
+
+class OrderTest(unittest.TestCase):
+
+    """test the orders of AbstractOfflineShoppingBackend"""
+
+    def test_order_lines(self):
+        backend = ExampleBackend()
+        self.assertEqual(backend.get_order_lines(), [])
+        order_id = backend.create_order()
+        backend.set_current_order(order_id)
+        for prod_id in [3, 1, 2]:
+            backend.add_order_line(prod_id, 1)
+        lines = backend.get_order_lines()
+        self.assertEqual([l.product.prod_id for l in lines], [3, 1, 2])
+        backend.delete_order_line(lines[1].order_line_id)
+        backend.update_quantity(lines[2].order_line_id, 2)
+        self.assertEqual([l.product.prod_id for l in backend.get_order_lines()], [3, 2])
+        self.assertEqual(backend.get_order_line(lines[2].order_line_id).qty, 2)
+        with self.assertRaises(KeyError):
+            backend.get_order_line(lines[1].order_line_id)
+        with self.assertRaises(KeyError):
+            backend.delete_order_line(lines[1].order_line_id)
+        self.assertEqual(backend.get_current_total(), Decimal(16))
+
+    def test_orders(self):
+        backend = ExampleBackend()
+        first = backend.create_order()
+        second = backend.create_order()
+        self.assertNotEqual(first, second)
+        backend.set_current_order(first)
+        backend.add_order_line(1, 1)
+        backend.delete_current_order()
+        self.assertIsNone(backend.get_current_order())
+        with self.assertRaises(KeyError):
+            backend._get_order_by_id(first)
+        self.assertEqual(backend._get_order_by_id(second).get_order_lines(), [])
+        # ids are not reused
+        self.assertNotIn(backend.create_order(), [first, second])
+
+    def test_total(self):
+        backend = ExampleBackend()
+        backend.verify_total = True
+        self.assertEqual(backend.get_current_total(), Decimal("0.00"))
+        backend.set_current_order(backend.create_order())
+        backend.tree.add_product(Product(10, "a", Decimal("1.015"), "Stück", ""))
+        backend.tree.add_product(Product(11, "b", Decimal("0.99"), "Stück", ""))
+        # consistent rounding: 1.015 -> 1.02, 1.015 + 0.99 -> 2.01
+        backend.add_order_line(10, 1)
+        self.assertEqual(backend.get_current_total(), Decimal("1.02"))
+        backend.add_order_line(11, 1)
+        self.assertEqual(backend.get_current_total(), Decimal("2.01"))
+        (line_a, line_b) = backend.get_order_lines()
+        backend.update_quantity(line_a.order_line_id, 3)
+        self.assertEqual(backend.get_current_total(), Decimal("4.04"))
+        backend.delete_order_line(line_b.order_line_id)
+        self.assertEqual(backend.get_current_total(), Decimal("3.05"))
+        # the debug mode detects changes that bypass the Order
+        line_a.qty = 1
+        with self.assertRaises(AssertionError):
+            backend.get_current_total()
+        backend.verify_total = False
+        self.assertEqual(backend.get_current_total(), Decimal("3.05"))
+
+    def test_many_lines(self):
+        """large carts: each access to a line takes constant time"""
+        backend = ExampleBackend()
+        backend.verify_total = True
+        backend.set_current_order(backend.create_order())
+        for i in range(5000):
+            backend.add_order_line(1, 1)
+        lines = backend.get_order_lines()
+        for line in lines:
+            backend.update_quantity(line.order_line_id, 2)
+        for line in lines[::2]:
+            backend.delete_order_line(line.order_line_id)
+        self.assertEqual(len(backend.get_order_lines()), 2500)
+        self.assertEqual(backend.get_current_total(), Decimal(5 * 2 * 2500))
+
+
+@benchmark
+class SearchBenchmark(unittest.TestCase):
+
+    """build time, memory and search time of the search indexes, with 50000 products"""
+
+    count = 50000
+
+    @staticmethod
+    def rss():
+        """:return: resident memory of this process in bytes (Linux only)"""
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+    def test_search(self):
+        words = ["schraube", "mutter", "senkkopf", "zylinder", "plexiglas", "rot"]
+        words += ["sperrholz", "acryl", "m3x10", "5mm", "3mm", "led", "din", "912"]
+        (categories, products) = example_catalogue()
+        for i in range(self.count):
+            name = " ".join(words[(i * 7 + j * 5) % len(words)] for j in range(4))
+            products.append(
+                Product(10000 + i, "{0} {1}".format(name, i), Decimal(1), "Stück", "")
+            )
+        with mock.patch(
+            "FabLabKasse.scriptHelper.getConfig", return_value=example_config()
+        ):
+            rss = self.rss()
+            start = time.perf_counter()
+            tree = OfflineCategoryTree(0, list(categories), products)
+            duration = time.perf_counter() - start
+            rss = self.rss() - rss
+            # memory of a second tree, tracemalloc would distort the time
+            tracemalloc.start()
+            second_tree = OfflineCategoryTree(0, list(categories), products)
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del second_tree
+        print()
+        print(
+            "build: {0:.0f} ms, RSS +{1:.1f} MiB, {2:.1f} MiB allocated".format(
+                duration * 1000, rss / 2**20, memory / 2**20
+            )
+        )
+        self.assertLess(memory / self.count, 2000)
+        for query in ["schraube m3", "m", "3", "plexiglas rot 5mm", "schruabe", "4711"]:
+            start = time.perf_counter()
+            tree.rank_products(query)
+            duration = time.perf_counter() - start
+            start = time.perf_counter()
+            tree.rank_products(query)
+            print(
+                "search {0!r}: {1:.1f} ms, repeated {2:.1f} ms".format(
+                    query, duration * 1000, (time.perf_counter() - start) * 1000
+                )
+            )
+
+
+@benchmark
+class CartBenchmark(unittest.TestCase):
+
+    """time per add, update and delete of order lines in large carts"""
+
+    def time_per_operation(self, count):
+        """
+        fill a cart with ``count`` lines, update all, then delete all of them
+
+        :return: ``{operation: seconds per call}``
+        """
+        backend = ExampleBackend()
+        backend.set_current_order(backend.create_order())
+        result = {}
+        start = time.perf_counter()
+        for i in range(count):
+            backend.add_order_line(1, 1)
+        result["add"] = (time.perf_counter() - start) / count
+        lines = backend.get_order_lines()
+        start = time.perf_counter()
+        for line in lines:
+            backend.update_quantity(line.order_line_id, 2)
+        result["update"] = (time.perf_counter() - start) / count
+        start = time.perf_counter()
+        for line in lines:
+            backend.delete_order_line(line.order_line_id)
+        result["delete"] = (time.perf_counter() - start) / count
+        return result
+
+    def test_cart(self):
+        small = self.time_per_operation(500)
+        large = self.time_per_operation(5000)
+        print()
+        for operation in ["add", "update", "delete"]:
+            print(
+                "{0}: {1:.1f} µs per line with 500 lines, {2:.1f} µs with 5000 lines".format(
+                    operation, small[operation] * 1e6, large[operation] * 1e6
+                )
+            )
+            # constant time per line: with linear time, ten times more lines
+            # would take ten times longer per line
+            self.assertLess(large[operation], small[operation] * 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -19,6 +19,9 @@
 from __future__ import unicode_literals
 
 import unittest
+from unittest import mock
+from unittest.mock import ANY
+from configparser import ConfigParser
 from .kassenbuch import (
     Kasse,
     Kunde,
@@ -26,8 +29,13 @@ from .kassenbuch import (
     Rechnung,
     NoDataFound,
     parse_args,
+    main,
+    iter_export_rows,
+    export_incremental,
+    write_export,
 )
 from .kassenbuch import argparse_parse_date, argparse_parse_currency
+from . import scriptHelper
 from hypothesis import given, reproduce_failure
 from hypothesis.strategies import text, datetimes
 import dateutil
@@ -37,6 +45,9 @@ import subprocess
 import os
 import random
 import tempfile
+import io
+import json
+import sqlite3
 from pathlib import Path
 
 
@@ -105,7 +116,9 @@ class KassenbuchTestCase(unittest.TestCase):
             self.assertEqual(result.returncode, 0, "Command failed: " + repr(result))
             return result.stdout
 
+        call_kb("upgrade")
         call_kb("summary")
+        call_kb("snapshot verify")
         call_kb("show")
         call_kb("client list")
         randstr = str(random.randint(0, int(1e30)))
@@ -118,6 +131,11 @@ class KassenbuchTestCase(unittest.TestCase):
             self.assertTrue(comment in Path(f"{d}/book.csv").read_text())
             call_kb(f"export invoices {d}/invoices.csv")
             # output of invoices is currently not tested
+            call_kb(f"export book {d}/book.jsonl --format jsonl --from yesterday")
+            self.assertTrue(comment in Path(f"{d}/book.jsonl").read_text())
+            call_kb(f"export book --incremental {d} --bookmark test_{randstr}")
+            [daily_file] = Path(d).glob("book_*.csv")
+            self.assertTrue(comment in daily_file.read_text())
 
     def test_parsing(self):
         """test argument parsing helper"""
@@ -160,6 +178,115 @@ class KassenbuchTestCase(unittest.TestCase):
         # TODO test integrity checking (no double creation of same ID)
         # TODO code crashes when reading Kunde with "None" in e.g. schuldengrenze
 
+    def test_client_store(self):
+        """test that storing a client only writes new or changed rows"""
+        kasse = Kasse(sqlite_file=":memory:")
+        bob = Kunde("bob", schuldengrenze=Decimal(10))
+        bob.store(kasse.cur)
+        for betrag in ["10", "-2.50", "0.001"]:
+            bob.add_buchung(Decimal(betrag), kommentar="test")
+        bob.store(kasse.cur)
+        kasse.con.commit()
+
+        statements = []
+        kasse.con.set_trace_callback(statements.append)
+        bob = Kunde.load_from_name("bob", kasse.cur)
+        statements.clear()
+        bob.store(kasse.cur)
+        self.assertEqual(statements, [])
+
+        bob.buchungen[1].kommentar = "changed"
+        bob.add_buchung(Decimal(-1), kommentar="new")
+        bob.store(kasse.cur)
+        # writes to kundenbuchung, each followed by the update of the cached balance
+        self.assertEqual(
+            [
+                " ".join(statement.split()[:3])
+                for statement in statements
+                if statement.startswith(("INSERT", "UPDATE"))
+            ],
+            [
+                "UPDATE kundenbuchung SET",
+                "UPDATE kunde SET",
+                "INSERT INTO kundenbuchung",
+                "UPDATE kunde SET",
+            ],
+        )
+        kasse.con.set_trace_callback(None)
+        kasse.con.commit()
+
+        partial = Kunde.load_from_id(bob.id, kasse.cur, load_buchungen=False)
+        self.assertEqual(partial.buchungen, [])
+        self.assertEqual(partial.summe, Decimal("6.501"))
+        partial.add_buchung(Decimal(2), kommentar="new")
+        partial.store(kasse.cur)
+        self.assertEqual(partial.summe, Decimal("8.501"))
+        self.assertEqual(len(Kunde.load_from_id(bob.id, kasse.cur).buchungen), 5)
+        self.assertEqual(kasse.verify_kundensaldo(), [])
+
+        kasse.cur.execute("UPDATE kunde SET saldo='0'")
+        self.assertEqual(
+            kasse.verify_kundensaldo(),
+            [(bob.id, (Decimal("8.501"), ANY, ANY), (Decimal(0), ANY, ANY))],
+        )
+        kasse.rebuild_kundensaldo()
+        self.assertEqual(kasse.verify_kundensaldo(), [])
+        kasse.cur.execute("UPDATE kunde SET saldo_e2=850")
+        self.assertEqual(
+            kasse.verify_kundensaldo(),
+            [(bob.id, (Decimal("8.501"), ANY, ANY), (Decimal("8.50"), ANY, ANY))],
+        )
+        kasse.rebuild_kundensaldo()
+        self.assertEqual(kasse.verify_kundensaldo(), [])
+        [listed] = kasse.iter_kunden()
+        self.assertEqual((listed.name, listed.summe), ("bob", Decimal("8.501")))
+        self.assertEqual(listed.letzte_zahlung, partial.buchungen[0].datum)
+        self.assertEqual(listed.letzte_belastung, bob.buchungen[-1].datum)
+
+    def test_iter_kunden(self):
+        """test the filters of the client list"""
+        kasse = Kasse(sqlite_file=":memory:")
+        for name, betrag, datum in [
+            ("active", "-20", datetime(2022, 5, 30)),
+            ("inactive", "-1", datetime(2022, 1, 1)),
+            ("zero", "0", datetime(2022, 1, 1)),
+            ("new", None, None),
+            ("fraction", "-1.001", datetime(2022, 5, 30)),
+        ]:
+            kunde = Kunde(name, schuldengrenze=Decimal(0))
+            kunde.store(kasse.cur)
+            if betrag is not None:
+                kunde.add_buchung(Decimal(betrag), kommentar="test", datum=datum)
+                kunde.store(kasse.cur)
+        kasse.con.commit()
+
+        def names(**kwargs):
+            return [
+                k.name for k in kasse.iter_kunden(now=datetime(2022, 6, 1), **kwargs)
+            ]
+
+        self.assertEqual(names(), ["active", "inactive", "zero", "new", "fraction"])
+        self.assertEqual(names(remove_zeros=True), ["active", "inactive", "fraction"])
+        self.assertEqual(names(inactive=30), ["inactive"])
+        self.assertEqual(names(maxbalance=Decimal(-1)), ["active", "fraction"])
+        self.assertEqual(names(maxbalance=Decimal("-1.001")), ["active"])
+        self.assertEqual(names(maxbalance=Decimal("-1.0005")), ["active", "fraction"])
+        self.assertEqual(
+            names(inactive=30, maxbalance=Decimal("-1.5")), ["active", "inactive"]
+        )
+        self.assertEqual(
+            kasse.cur.execute(
+                "SELECT name, saldo_e2 FROM kunde ORDER BY id"
+            ).fetchall(),
+            [
+                ("active", -2000),
+                ("inactive", -100),
+                ("zero", 0),
+                ("new", 0),
+                ("fraction", None),
+            ],
+        )
+
     @given(
         from_date=datetimes(),
         until_date=datetimes(),
@@ -213,3 +340,473 @@ class KassenbuchTestCase(unittest.TestCase):
             self.assertTrue(query)
         else:
             self.assertFalse(query)
+
+    def test_iter_buchungen(self):
+        """test that iter_buchungen loads complete records in chronological order"""
+        kasse = Kasse(sqlite_file=":memory:")
+        start = datetime(2020, 1, 1)
+        for i in range(5):
+            datum = start + timedelta(days=4 - i)
+            kasse.buchen(
+                [
+                    Buchung("Barkasse", Decimal(i), kommentar=str(i), datum=datum),
+                    Buchung("Besucher", -Decimal(i), kommentar=str(i), datum=datum),
+                ]
+            )
+
+        buchungen = list(kasse.iter_buchungen())
+        self.assertEqual(len(buchungen), 10)
+        self.assertEqual(
+            [b.datum for b in buchungen], sorted(b.datum for b in buchungen)
+        )
+        self.assertEqual(buchungen[0].kommentar, "4")
+        self.assertEqual(buchungen[0].betrag, Decimal(4))
+        self.assertEqual(
+            [b.id for b in buchungen], [b.id for b in kasse.get_buchungen()]
+        )
+        self.assertEqual(
+            len(list(kasse.iter_buchungen(from_date=start + timedelta(days=3)))), 4
+        )
+
+    def test_iter_rechnungen(self):
+        """test that iter_rechnungen groups the positions into the right invoices"""
+        kasse = Kasse(sqlite_file=":memory:")
+        empty = Rechnung(datum=datetime(2020, 1, 4))
+        empty.store(kasse.cur)
+        stored = []
+        for i in range(3):
+            r = Rechnung(datum=datetime(2020, 1, 1 + i))
+            for j in range(i + 1):
+                r.add_position("Artikel {0}".format(j), Decimal("0.015"), anzahl=j + 1)
+            r.store(kasse.cur)
+            stored.append(r)
+        kasse.con.commit()
+
+        rechnungen = list(kasse.iter_rechnungen())
+        self.assertEqual(
+            [r.id for r in rechnungen],
+            [stored[0].id, stored[1].id, stored[2].id, empty.id],
+        )
+        for loaded, original in zip(rechnungen, stored):
+            self.assertEqual(loaded.positionen, original.positionen)
+            self.assertEqual(
+                loaded.positionen,
+                Rechnung.load_from_id(original.id, kasse.cur).positionen,
+            )
+        self.assertEqual(rechnungen[-1].positionen, [])
+        self.assertEqual(
+            [r.id for r in kasse.get_rechnungen(until_date=datetime(2020, 1, 2))],
+            [stored[0].id],
+        )
+
+    def test_tagessaldo(self):
+        """test that the daily account totals match the bookings"""
+        kasse = Kasse(sqlite_file=":memory:")
+        start = datetime(2020, 1, 1, 12, 0)
+        for i in range(20):
+            datum = start + timedelta(hours=7 * i)
+            betrag = Decimal(i) / 4
+            kasse.buchen(
+                [
+                    Buchung("Barkasse", betrag, kommentar=str(i), datum=datum),
+                    Buchung("Besucher", -betrag, kommentar=str(i), datum=datum),
+                ]
+            )
+        self.assertEqual(kasse.verify_tagessaldo(), [])
+
+        for date in [start, start + timedelta(hours=50), start + timedelta(days=10)]:
+            konto_haben, konto_soll, konto_saldi = kasse._konto_summen(date)
+            expected = {}
+            for b in kasse.get_buchungen(until_date=date):
+                expected[b.konto] = expected.get(b.konto, Decimal(0)) + b.betrag
+            self.assertEqual(konto_saldi, expected)
+            self.assertTrue(date.strftime("%Y-%m-%d") in kasse.summary_to_string(date))
+
+        kasse.cur.execute("UPDATE tagessaldo SET haben='1000'")
+        self.assertTrue(kasse.verify_tagessaldo())
+        kasse.rebuild_tagessaldo()
+        self.assertEqual(kasse.verify_tagessaldo(), [])
+
+    def test_get_konto_summen(self):
+        """test the SQL-side aggregation of account totals"""
+        kasse = Kasse(sqlite_file=":memory:")
+        datum = datetime(2021, 3, 4, 5, 6)
+        for betrag in ["0.01", "1234.56", "0.10", "0", "7"]:
+            kasse.buchen(
+                [
+                    Buchung("Barkasse", Decimal(betrag), kommentar="x", datum=datum),
+                    Buchung("Besucher", -Decimal(betrag), kommentar="x", datum=datum),
+                    Buchung("Besucher", Decimal("0.02"), kommentar="y", datum=datum),
+                    Buchung("Gutschein", Decimal("-0.02"), kommentar="y", datum=datum),
+                ]
+            )
+        konto_haben, konto_soll, konto_saldi = kasse.get_konto_summen()
+        self.assertEqual(
+            list(konto_saldi.keys()), ["Barkasse", "Besucher", "Gutschein"]
+        )
+        self.assertEqual(konto_haben["Barkasse"], Decimal("1241.67"))
+        self.assertEqual(konto_soll["Barkasse"], Decimal(0))
+        self.assertEqual(konto_haben["Besucher"], Decimal("0.10"))
+        self.assertEqual(konto_soll["Besucher"], Decimal("1241.67"))
+        self.assertEqual(konto_saldi["Besucher"], Decimal("-1241.57"))
+        self.assertEqual(konto_saldi["Gutschein"], Decimal("-0.10"))
+        self.assertEqual(kasse.get_konto_summen(until_date=datum), ({}, {}, {}))
+
+    def test_migration(self):
+        """test upgrading a database created by an old version without integer amounts"""
+        with tempfile.TemporaryDirectory() as d:
+            filename = d + "/old.sqlite3"
+            con = sqlite3.connect(filename)
+            con.execute(
+                "CREATE TABLE buchung(id INTEGER PRIMARY KEY AUTOINCREMENT, datum, konto, "
+                "rechnung INT, betrag TEXT, kommentar TEXT)"
+            )
+            con.execute(
+                "CREATE TABLE kundenbuchung(id INTEGER PRIMARY KEY AUTOINCREMENT, datum, "
+                "kunde, rechnung INT, betrag TEXT, kommentar TEXT)"
+            )
+            con.execute(
+                "CREATE TABLE position(id INTEGER PRIMARY KEY AUTOINCREMENT, rechnung INT, "
+                "anzahl TEXT, einheit TEXT, artikel TEXT, einzelpreis TEXT, produkt_ref TEXT)"
+            )
+            for betrag in ["12.34", "-12.34", "0.001"]:
+                con.execute(
+                    "INSERT INTO buchung (datum, konto, betrag, kommentar) VALUES (?, ?, ?, ?)",
+                    ("2019-05-06 07:08:09.000000", "Barkasse", betrag, "alt"),
+                )
+            con.execute(
+                "INSERT INTO kundenbuchung (datum, kunde, betrag, kommentar) VALUES (?, ?, ?, ?)",
+                ("2019-05-06 07:08:09.000000", 1, "-5", "alt"),
+            )
+            con.execute(
+                "INSERT INTO position (rechnung, anzahl, einzelpreis) VALUES (1, '2.5', '0.015')"
+            )
+            con.commit()
+            con.close()
+
+            with self.assertRaises(Exception):
+                # read-only access cannot upgrade the schema
+                Kasse(filename, readonly=True)
+            self.assertEqual(
+                sqlite3.connect(filename).execute("PRAGMA user_version").fetchone()[0],
+                0,
+            )
+            kasse = Kasse(filename)
+            kasse._migrate_minor_units(batch_size=2)
+            self.assertEqual(
+                kasse.cur.execute("PRAGMA user_version").fetchone()[0],
+                Kasse.SCHEMA_VERSION,
+            )
+            self.assertEqual(
+                kasse.cur.execute(
+                    "SELECT betrag_e2 FROM buchung ORDER BY id"
+                ).fetchall(),
+                [(1234,), (-1234,), (None,)],
+            )
+            self.assertEqual(
+                kasse.cur.execute("SELECT betrag_e2 FROM kundenbuchung").fetchall(),
+                [(-500,)],
+            )
+            self.assertEqual(
+                kasse.cur.execute(
+                    "SELECT anzahl_e4, einzelpreis_e4 FROM position"
+                ).fetchall(),
+                [(25000, 150)],
+            )
+            self.assertEqual(
+                [b.betrag for b in kasse.get_buchungen()],
+                [Decimal("12.34"), Decimal("-12.34"), Decimal("0.001")],
+            )
+            self.assertEqual(kasse.get_konto_summen()[2]["Barkasse"], Decimal("0.001"))
+            self.assertEqual(kasse.verify_tagessaldo(), [])
+            self.assertEqual(
+                [b.datum for b in kasse.get_buchungen(from_date=datetime(2019, 5, 6))],
+                [datetime(2019, 5, 6, 7, 8, 9)] * 3,
+            )
+            self.assertEqual(kasse.get_buchungen(until_date=datetime(2019, 5, 6)), [])
+
+    def test_migration_saldo_e2(self):
+        """test upgrading a database that caches the client balance only as TEXT"""
+        with tempfile.TemporaryDirectory() as d:
+            filename = d + "/old.sqlite3"
+            con = sqlite3.connect(filename)
+            con.execute(
+                "CREATE TABLE kunde(id INTEGER PRIMARY KEY AUTOINCREMENT, name UNIQUE NOT NULL, "
+                "pin, schuldengrenze, email, telefon, adresse, kommentar, "
+                "saldo TEXT DEFAULT '0', letzte_zahlung_us INTEGER, letzte_belastung_us INTEGER)"
+            )
+            con.execute(
+                "INSERT INTO kunde (name, schuldengrenze, saldo) VALUES ('bob', '0', '-5')"
+            )
+            con.execute("PRAGMA user_version = 4")
+            con.commit()
+            con.close()
+
+            kasse = Kasse(filename)
+            # the client has no transactions, the cached balance is recalculated
+            self.assertEqual(
+                kasse.cur.execute("SELECT saldo, saldo_e2 FROM kunde").fetchall(),
+                [("0", 0)],
+            )
+            kunde = Kunde.load_from_name("bob", kasse.cur, load_buchungen=False)
+            kunde.add_buchung(Decimal("-1.25"), kommentar="test")
+            kunde.store(kasse.cur)
+            self.assertEqual(
+                kasse.cur.execute("SELECT saldo, saldo_e2 FROM kunde").fetchall(),
+                [("-1.25", -125)],
+            )
+            self.assertEqual(kasse.verify_kundensaldo(), [])
+
+    def test_client_action_on_old_database(self):
+        """test that a client action upgrades an old database before looking up the client"""
+        with tempfile.TemporaryDirectory() as d:
+            filename = d + "/old.sqlite3"
+            con = sqlite3.connect(filename)
+            con.execute(
+                "CREATE TABLE kunde(id INTEGER PRIMARY KEY AUTOINCREMENT, name UNIQUE NOT NULL, "
+                "pin, schuldengrenze, email, telefon, adresse, kommentar)"
+            )
+            con.execute(
+                "CREATE TABLE kundenbuchung(id INTEGER PRIMARY KEY AUTOINCREMENT, datum, "
+                "kunde, rechnung INT, betrag TEXT, kommentar TEXT)"
+            )
+            con.execute(
+                "INSERT INTO kunde (name, schuldengrenze) VALUES ('alice', '0')"
+            )
+            con.execute(
+                "INSERT INTO kundenbuchung (datum, kunde, betrag, kommentar) VALUES (?, ?, ?, ?)",
+                ("2019-05-06 07:08:09.000000", 1, "10", "alt"),
+            )
+            con.commit()
+            con.close()
+
+            cfg = ConfigParser()
+            cfg.add_section("general")
+            cfg.set("general", "db_file", filename)
+            cwd = os.getcwd()
+            try:
+                with mock.patch(
+                    "FabLabKasse.scriptHelper.getConfig", return_value=cfg
+                ), mock.patch(
+                    "FabLabKasse.kassenbuch.parse_args",
+                    return_value=parse_args(
+                        "client charge alice 1,50 Kaffee".split(" ")
+                    ),
+                ):
+                    main()
+            finally:
+                os.chdir(cwd)
+
+            kasse = Kasse(filename, readonly=True)
+            kunde = Kunde.load_from_name("alice", kasse.cur, load_buchungen=False)
+            self.assertEqual(kunde.summe, Decimal("8.50"))
+            self.assertEqual(kasse.verify_kundensaldo(), [])
+
+    def test_readonly(self):
+        """test that reports can read while a sale is being written"""
+        with tempfile.TemporaryDirectory() as d:
+            filename = d + "/kasse.sqlite3"
+            datum = datetime(2022, 1, 1)
+            kasse = Kasse(filename)
+            self.assertEqual(
+                kasse.cur.execute("PRAGMA journal_mode").fetchone()[0], "wal"
+            )
+            kasse.buchen(
+                [
+                    Buchung("Barkasse", Decimal(1), kommentar="test", datum=datum),
+                    Buchung("Besucher", Decimal(-1), kommentar="test", datum=datum),
+                ]
+            )
+
+            report = Kasse(filename, readonly=True)
+            # uncommitted sale in progress
+            kasse.cur.execute(
+                "INSERT INTO buchung (konto, betrag, kommentar) VALUES ('Barkasse', '2', 'test')"
+            )
+            self.assertEqual(len(report.get_buchungen()), 2)
+            with self.assertRaises(sqlite3.OperationalError):
+                report.buchen(
+                    [
+                        Buchung("Barkasse", Decimal(1), kommentar="test", datum=datum),
+                        Buchung("Besucher", Decimal(-1), kommentar="test", datum=datum),
+                    ]
+                )
+            kasse.con.commit()
+            self.assertEqual(
+                report.cur.execute("SELECT COUNT(*) FROM buchung").fetchone()[0], 3
+            )
+
+    def test_transaction(self):
+        """test that a sale is stored atomically"""
+        kasse = Kasse(sqlite_file=":memory:")
+        rechnung = Rechnung(datum=datetime(2022, 3, 1))
+        rechnung.add_position("Artikel", Decimal("1.5"), anzahl=2)
+        rechnung.add_position("Rundung", Decimal(1), anzahl=Decimal("0.01"))
+        with kasse.transaction() as cur:
+            rechnung.store(cur)
+            kasse.buchen(
+                [
+                    Buchung(
+                        "Barkasse",
+                        Decimal("3.01"),
+                        rechnung=rechnung.id,
+                        datum=rechnung.datum,
+                    ),
+                    Buchung(
+                        "Besucher",
+                        Decimal("-3.01"),
+                        rechnung=rechnung.id,
+                        datum=rechnung.datum,
+                    ),
+                ]
+            )
+            self.assertTrue(kasse.con.in_transaction, "buchen() must not commit")
+        self.assertFalse(kasse.con.in_transaction)
+        self.assertEqual(
+            [p["id"] for p in Rechnung.load_from_id(rechnung.id, kasse.cur).positionen],
+            [p["id"] for p in rechnung.positionen],
+        )
+
+        with self.assertRaises(AssertionError):
+            # incomplete booking
+            with kasse.transaction() as cur:
+                Rechnung(datum=datetime(2022, 3, 2)).store(cur)
+                kasse.buchen([Buchung("Barkasse", Decimal(1), kommentar="test")])
+        self.assertEqual(len(kasse.rechnungen), 1)
+        self.assertEqual(len(kasse.buchungen), 2)
+        self.assertEqual(kasse.verify_tagessaldo(), [])
+
+    def test_export(self):
+        """test the export formats"""
+        kasse = Kasse(sqlite_file=":memory:")
+        for day in [1, 2, 3]:
+            rechnung = Rechnung(datum=datetime(2022, 4, day))
+            rechnung.add_position("Artikel", Decimal("0.5"), anzahl=day)
+            rechnung.store(kasse.cur)
+        kasse.con.commit()
+
+        def rows():
+            return iter_export_rows(kasse, "invoices", from_date=datetime(2022, 4, 2))
+
+        out = io.StringIO()
+        write_export(out, "invoices", rows(), "csv")
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(lines[0].split(",")[0], "RECH.NR.")
+        self.assertEqual(
+            lines[1].split(",")[:4], ["2", "2022-04-02 00:00:00", "Artikel", "2"]
+        )
+        self.assertEqual(lines[2], "")
+
+        out = io.StringIO()
+        write_export(out, "invoices", rows(), "jsonl")
+        records = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([r["SUMME"] for r in records], ["1.0", "1.5"])
+
+        out = io.StringIO()
+        write_export(out, "invoices", rows(), "columnar", chunk_size=1)
+        groups = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([g["RECH.NR."] for g in groups], [[2], [3]])
+
+    def test_export_incremental(self):
+        """test that incremental exports write every record exactly once"""
+        kasse = Kasse(sqlite_file=":memory:")
+
+        def transfer(kommentar):
+            b = Buchung("Barkasse", Decimal(1), kommentar=kommentar)
+            kasse.buchen(
+                [b, Buchung("Bank", Decimal(-1), kommentar=kommentar, datum=b.datum)]
+            )
+
+        with tempfile.TemporaryDirectory() as d:
+
+            def export():
+                return export_incremental(
+                    kasse, "book", d, chunk_size=2, today=datetime(2022, 5, 1)
+                )
+
+            filename = d + "/book_2022-05-01.csv"
+            transfer("first")
+            transfer("second")
+            self.assertEqual(export(), 4)
+            self.assertEqual(export(), 0)
+            transfer("third")
+            # simulate a crash after writing the next chunk but before storing the bookmark
+            kasse.cur.execute(
+                "UPDATE export_stand SET laenge=? WHERE name='book'",
+                (os.path.getsize(filename),),
+            )
+            kasse.con.commit()
+            with open(filename, "a") as f:
+                f.write("incomplete row")
+            self.assertEqual(export(), 2)
+
+            lines = Path(filename).read_text().splitlines()
+            self.assertEqual(lines[0].split(",")[0], "DATUM")
+            self.assertEqual(
+                [line.split(",")[-1] for line in lines[1:]],
+                ["first", "first", "second", "second", "third", "third"],
+            )
+
+    def test_select(self):
+        """test the parameterised queries of Kasse.select"""
+        kasse = Kasse(sqlite_file=":memory:")
+        for day in [1, 2, 3]:
+            rechnung = Rechnung(datum=datetime(2022, 2, day))
+            rechnung.add_position("Artikel", Decimal(day))
+            rechnung.store(kasse.cur)
+            kasse.buchen(
+                [
+                    Buchung(
+                        "Barkasse",
+                        Decimal(day),
+                        rechnung=rechnung.id,
+                        datum=rechnung.datum,
+                    ),
+                    Buchung(
+                        "Besucher",
+                        -Decimal(day),
+                        rechnung=rechnung.id,
+                        datum=rechnung.datum,
+                    ),
+                ]
+            )
+
+        rows = list(kasse.select("buchung", "betrag, rechnung", konto="Barkasse"))
+        self.assertEqual(rows, [("1", 1), ("2", 2), ("3", 3)])
+        rows = list(
+            kasse.select(
+                "position",
+                "rechnung",
+                from_date=datetime(2022, 2, 2),
+                until_date=datetime(2022, 2, 3),
+            )
+        )
+        self.assertEqual(rows, [(2,)])
+        query, parameters = Kasse._date_query_generator(
+            "buchung", datetime(2022, 2, 2), None, konto="Besucher", rechnung=None
+        )
+        self.assertEqual(
+            query,
+            Kasse._date_query_generator(
+                "buchung", datetime(2000, 1, 1), None, konto="Barkasse"
+            )[0],
+        )
+        self.assertEqual(len(parameters), 2)
+        with self.assertRaises(NotImplementedError):
+            Kasse._date_query_generator("rechnung", konto="Barkasse")
+        with self.assertRaises(NotImplementedError):
+            Kasse._date_query_generator("kunde")
+        # other databases, e.g. the MagPosLog of generateLog.py
+        self.assertEqual(
+            scriptHelper.dateRangeQuery(
+                "MagPosLog",
+                "datum",
+                lambda date: date.isoformat(" "),
+                from_date=datetime(2022, 2, 2),
+            ),
+            (
+                "SELECT id FROM MagPosLog WHERE datum >= ? ORDER BY datum ASC, id ASC",
+                ["2022-02-02 00:00:00"],
+            ),
+        )
@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+#
+# FabLabKasse, a Point-of-Sale Software for FabLabs and other public and trust-based workshops.
+#
+# This program is free software: you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY; without
+# even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along with this program. If not,
+# see <http://www.gnu.org/licenses/>.
+
+"""unittests for product_record.py"""
+
+import io
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+import unittest
+from decimal import Decimal
+
+from .product_record import (
+    _FIELDS,
+    _decode_record_checked,
+    ProductRecord,
+    RecordError,
+    decode_catalogue,
+    decode_record,
+    iter_json_object,
+    load_catalogue,
+)
+
+
+def example_product(**kwargs):
+    """a product of the JSON price list, with some of the unused fields"""
+    product = {
+        "code": "0834",
+        "name": "Karosseriescheibe DIN 9021",
+        "_uom_str": "Stück",
+        "lst_price": 0.15,
+        "_categ_list": ["Mechanik", "Beilagscheiben"],
+        "_location_str": "Elektrowerkstatt / Regal",
+        "categ_id": [195, "Alle Produkte / Mechanik / Beilagscheiben"],
+        "_uom_rounding": 1.0,
+        "_supplierinfo": {"qty": 0.0, "delay": 7},
+        "sale_ok": True,
+    }
+    product.update(kwargs)
+    return product
+
+
+class ProductRecordTest(unittest.TestCase):
+
+    """test decoding the product JSON"""
+
+    def test_decode_record(self):
+        expected = ProductRecord(
+            code="0834",
+            name="Karosseriescheibe DIN 9021",
+            _uom_str="Stück",
+            lst_price=Decimal("0.15"),
+            _categ_list=["Mechanik", "Beilagscheiben"],
+            _location_str="Elektrowerkstatt / Regal",
+            categ_id=195,
+            _uom_rounding=Decimal("1.0"),
+        )
+        # float prices (slow path) and Decimal prices (fast path) give the same result
+        self.assertEqual(decode_record(example_product()), expected)
+        decimal_product = example_product(
+            lst_price=Decimal("0.15"), _uom_rounding=Decimal("1.0")
+        )
+        self.assertEqual(decode_record(decimal_product), expected)
+        self.assertEqual(
+            decode_record(example_product(_location_str=False))._location_str, ""
+        )
+        minimal = example_product()
+        for field in ["_location_str", "categ_id", "_uom_rounding"]:
+            del minimal[field]
+        self.assertEqual(decode_record(minimal).categ_id, None)
+
+    def test_invalid_record(self):
+        for (product, message) in [
+            (example_product(code=False), "field code: expected a numeric string"),
+            (example_product(lst_price="abc"), "field lst_price: expected a number"),
+            (example_product(lst_price=True), "field lst_price: expected a number"),
+            (example_product(lst_price="NaN"), "field lst_price: expected a finite"),
+            (example_product(categ_id=False), "field categ_id: expected [id, name]"),
+            (example_product(_categ_list=[1]), "field _categ_list: expected a list"),
+            ({"code": "1"}, "missing field name"),
+            ([], "expected an object"),
+        ]:
+            with self.assertRaises(ValueError) as cm:
+                decode_record(product)
+            self.assertTrue(str(cm.exception).startswith(message), str(cm.exception))
+
+    def test_fast_path(self):
+        """the fast path of decode_record() accepts nothing that the checked path rejects"""
+        invalid_values = {
+            "code": [False, None, 834, "08a4", ""],
+            "name": [None, False, 5, ["Schraube"]],
+            "_uom_str": [None, False, 1],
+            "lst_price": [None, True, "abc", [1], Decimal("NaN"), Decimal("Inf")],
+            "_categ_list": [None, "Mechanik", [1], ["Mechanik", None]],
+            "input_mode": [None, 1],
+            "_location_str": [1, ["Regal"], True],
+            "categ_id": [False, None, 195, [195], [True, "x"], ["195", "x"]],
+            "_uom_rounding": [None, True, "abc", Decimal("NaN")],
+        }
+        self.assertEqual(
+            sorted(invalid_values), sorted(field for (field, _, _) in _FIELDS)
+        )
+        # with Decimal numbers, a valid record takes the fast path
+        valid = example_product(
+            lst_price=Decimal("0.15"),
+            _uom_rounding=Decimal("1.0"),
+            input_mode="DECIMAL",
+        )
+        self.assertEqual(decode_record(valid), _decode_record_checked(valid))
+        for (field, _, required) in _FIELDS:
+            for value in invalid_values[field]:
+                product = dict(valid)
+                product[field] = value
+                with self.assertRaises(ValueError) as checked:
+                    _decode_record_checked(product)
+                with self.assertRaises(ValueError) as fast:
+                    decode_record(product)
+                self.assertEqual(str(fast.exception), str(checked.exception))
+            product = dict(valid)
+            del product[field]
+            if required:
+                with self.assertRaises(ValueError):
+                    decode_record(product)
+            else:
+                self.assertEqual(
+                    decode_record(product), _decode_record_checked(product)
+                )
+
+    def test_load_catalogue(self):
+        catalogue = {
+            "0834": example_product(lst_price=0.1),
+            "0835": example_product(code="0835", name=None),
+            "0836": example_product(code="0836", lst_price="PRICE"),
+        }
+        text = json.dumps(catalogue).replace('"PRICE"', "12345678901234567.89")
+        (records, errors) = load_catalogue(io.StringIO(text))
+        # prices are decoded exactly, without float rounding
+        self.assertEqual(
+            [r.lst_price for r in records],
+            [Decimal("0.1"), Decimal("12345678901234567.89")],
+        )
+        self.assertEqual(
+            errors, [RecordError("0835", "field name: expected a string, got None")]
+        )
+
+    def test_iter_json_object(self):
+        catalogue = {
+            "0834": example_product(),
+            "0835": example_product(code="0835", lst_price=1234567.5),
+            "x": [1, {"a": "}"}, '\\"', None],
+            "": 12345,
+        }
+        # values (also numbers) may be split between chunks
+        for text in [json.dumps(catalogue, indent=1), '{"b": 2.5}', '{"b": -1e5}']:
+            expected = list(json.loads(text, parse_float=Decimal).items())
+            for chunk_size in [1, 2, 4, 7, 100, 100000]:
+                self.assertEqual(
+                    list(iter_json_object(io.StringIO(text), chunk_size=chunk_size)),
+                    expected,
+                )
+        self.assertEqual(list(iter_json_object(io.StringIO(" { } "))), [])
+        for text in ["", "[]", '{"a": 1', '{"a": 1,}', '{"a": 1} 2', "{1: 2}"]:
+            with self.assertRaises(ValueError):
+                list(iter_json_object(io.StringIO(text), chunk_size=2))
+
+
+@unittest.skipUnless(
+    os.environ.get("FABLABKASSE_BENCHMARK"),
+    "benchmark, set FABLABKASSE_BENCHMARK=1 to run it",
+)
+class LoadCatalogueBenchmark(unittest.TestCase):
+
+    """streaming load_catalogue() against json.load() of the whole document, with 50000 products"""
+
+    count = 50000
+
+    def setUp(self):
+        (fd, self.filename) = tempfile.mkstemp(suffix=".json")
+        self.addCleanup(os.remove, self.filename)
+        # the real price list has dozens of unused fields per product
+        unused_fields = {
+            "_price_str": "0,15 €",
+            "_supplier_name": "MEW",
+            "description": False,
+            "manufacturer": False,
+            "_supplier_all_infos": "MEW: 82.230.130",
+            "_supplierinfo": {
+                "pricelist_ids": [563],
+                "name": [49, "MEW"],
+                "product_uom": [1, "Stück"],
+                "company_id": [1, "FAU FabLab"],
+                "qty": 0.0,
+                "min_qty": 0.0,
+                "product_code": "82.230.130",
+            },
+            "seller_ids": [578],
+        }
+        with open(fd, "w", encoding="utf-8") as f:
+            f.write("{")
+            for i in range(self.count):
+                code = "{0:05d}".format(i)
+                product = example_product(
+                    code=code, name="Produkt {0}".format(i), **unused_fields
+                )
+                f.write("," if i else "")
+                f.write("{0}: {1}".format(json.dumps(code), json.dumps(product)))
+            f.write("}")
+
+    def load_whole_document(self):
+        with open(self.filename, encoding="utf-8") as f:
+            return decode_catalogue(json.load(f, parse_float=Decimal))
+
+    def load_streaming(self):
+        with open(self.filename, encoding="utf-8") as f:
+            return load_catalogue(f)
+
+    def measure(self, load):
+        """:return: (seconds, peak memory in bytes, result of load())"""
+        start = time.perf_counter()
+        result = load()
+        duration = time.perf_counter() - start
+        tracemalloc.start()
+        load()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return (duration, peak, result)
+
+    def test_load(self):
+        print()
+        results = []
+        for (description, load) in [
+            ("json.load", self.load_whole_document),
+            ("streaming", self.load_streaming),
+        ]:
+            (duration, peak, (records, errors)) = self.measure(load)
+            print(
+                "{0}: {1:.0f} ms, peak memory {2:.1f} MiB".format(
+                    description, duration * 1000, peak / 2**20
+                )
+            )
+            self.assertEqual((len(records), errors), (self.count, []))
+            results.append((peak, records))
+        ((whole_peak, whole_records), (streaming_peak, streaming_records)) = results
+        self.assertEqual(streaming_records, whole_records)
+        self.assertLess(streaming_peak, whole_peak)
+
+
+if __name__ == "__main__":
+    unittest.main()